@@ -1,17 +1,62 @@
 from django.contrib import admin
-from .models import GeneratedImage
+from .models import GeneratedImage, GenerationJob
+from .pagination import ApproximateCountPaginator
+from .retention import delete_images
+from .search import index_images, search_images
 
 
 @admin.register(GeneratedImage)
 class GeneratedImageAdmin(admin.ModelAdmin):
     """Admin interface for GeneratedImage model"""
-    list_display = ('id', 'short_prompt', 'created_at')
+    list_display = ('id', 'short_prompt', 'mime_type', 'byte_size', 'created_at')
     list_filter = ('created_at',)
     search_fields = ('prompt',)
-    readonly_fields = ('created_at',)
-    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'blob_key', 'byte_size', 'width', 'height', 'mime_type', 'archived_at')
+    ordering = ('-created_at', '-id')
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # The changelist only shows these columns
+        queryset = super().get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            queryset = queryset.only('id', 'prompt', 'mime_type', 'byte_size', 'created_at')
+        return queryset
+
+    def get_search_results(self, request, queryset, search_term):
+        """Search prompts through the full-text index instead of LIKE '%...%'"""
+        return search_images(queryset, search_term), False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'prompt' in form.changed_data:
+            index_images([obj])
+
+    def delete_model(self, request, obj):
+        delete_images(GeneratedImage.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        # Also releases the blobs and thumbnails no other image shares
+        delete_images(queryset)
     
     def short_prompt(self, obj):
         """Display shortened prompt in admin list"""
         return obj.prompt[:75] + ('...' if len(obj.prompt) > 75 else '')
     short_prompt.short_description = 'Prompt'
+
+
+
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    """Admin interface for GenerationJob model"""
+    list_display = ('id', 'status', 'short_prompt', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'worker', 'attempts')
+    ordering = ('-created_at',)
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+    def short_prompt(self, obj):
+        """Display shortened prompt in admin list"""
+        return obj.prompt[:75] + ('...' if len(obj.prompt) > 75 else '')
+    short_prompt.short_description = 'Prompt'
@@ -0,0 +1,177 @@
+"""
+Admission control of generation requests.
+
+Every generation request is charged to token buckets held in the
+database (RateLimitBucket), so all web processes share them:
+
+- one per tenant: the signed-in user, else the session, else the client
+  address
+- one per client address, more generous, since it is shared behind NATs
+
+A request is admitted only if every bucket holds enough tokens; otherwise
+it is rejected with 429 and a Retry-After telling when it would pass. Queued
+jobs are also capped per tenant and globally, so a backlog is refused up
+front instead of turning into minutes of queueing for everyone.
+
+The worker side (claim_next_job) then shares the worker slots fairly
+between tenants, weighted by GenerationJob.weight.
+"""
+import math
+import random
+from dataclasses import dataclass
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import GenerationJob, RateLimitBucket
+
+
+@dataclass
+class Tenant:
+    """Who a request is charged to"""
+    key: str
+    address: str
+    weight: int = 1
+
+
+@dataclass
+class Rejection:
+    """Why a request was not admitted, and when it may be retried"""
+    reason: str
+    retry_after: int
+
+
+def client_address(request):
+    if settings.RATE_LIMIT_TRUST_X_FORWARDED_FOR:
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '') or 'unknown'
+
+
+def tenant_for(request):
+    """Identify the tenant of a request (no session is created for anonymous clients)"""
+    address = client_address(request)
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return Tenant(f'user:{user.pk}', address, settings.GENERATION_USER_WEIGHT)
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        return Tenant(f'session:{session.session_key}', address)
+    return Tenant(f'ip:{address}', address)
+
+
+def _take(buckets, now):
+    """
+    Charge every (key, cost, capacity, per_second) bucket, or none of them.
+
+    Returns None when all had enough tokens, else the seconds until they would.
+    """
+    rows = {row.key: row for row in RateLimitBucket.objects.select_for_update().filter(
+        key__in=[key for key, _, _, _ in buckets]
+    )}
+    wait = 0.0
+    levels = {}
+    for key, cost, capacity, per_second in buckets:
+        row = rows.get(key)
+        tokens = capacity
+        if row is not None:
+            elapsed = max(0.0, (now - row.updated_at).total_seconds())
+            tokens = min(capacity, row.tokens + elapsed * per_second)
+        if tokens < cost:
+            wait = max(wait, (cost - tokens) / per_second)
+        levels[key] = tokens - cost
+    if wait:
+        return wait
+
+    for key, tokens in levels.items():
+        if key in rows:
+            RateLimitBucket.objects.filter(key=key).update(tokens=tokens, updated_at=now)
+        else:
+            RateLimitBucket.objects.create(key=key, tokens=tokens, updated_at=now)
+    return None
+
+
+def take_tokens(buckets):
+    """Atomically charge the buckets; see _take"""
+    now = timezone.now()
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                return _take(buckets, now)
+        except IntegrityError:
+            if attempt:
+                raise  # Bucket created concurrently twice in a row: give up
+    return None
+
+
+def purge_idle_buckets(idle=timedelta(days=1)):
+    """Delete buckets untouched for a while (they are full again anyway)"""
+    return RateLimitBucket.objects.filter(updated_at__lt=timezone.now() - idle).delete()[0]
+
+
+def _bucket(key, cost, burst, per_minute):
+    per_second = per_minute / 60
+    # A request larger than the bucket would never pass: it empties a full bucket instead
+    return key, min(cost, burst), burst, per_second
+
+
+def check_rate_limit(tenant, cost=1):
+    """Charge cost generations to the tenant's buckets; return a Rejection or None"""
+    if not settings.RATE_LIMIT_ENABLED:
+        return None
+    buckets = [_bucket(tenant.key, cost, settings.RATE_LIMIT_BURST, settings.RATE_LIMIT_PER_MINUTE)]
+    if not tenant.key.startswith('ip:'):
+        buckets.append(_bucket(
+            f'ip:{tenant.address}', cost, settings.RATE_LIMIT_IP_BURST, settings.RATE_LIMIT_IP_PER_MINUTE,
+        ))
+    if random.random() < 0.001:
+        purge_idle_buckets()
+    wait = take_tokens(buckets)
+    if wait is None:
+        return None
+    return Rejection('Too many generation requests. Please slow down.', math.ceil(wait))
+
+
+def _queue_wait_estimate(queued):
+    # Rough time for the workers to drain that many jobs
+    slots = settings.GENERATION_MAX_RUNNING or settings.GENERATION_WORKER_CONCURRENCY
+    return max(1, math.ceil(queued / max(1, slots) * settings.GENERATION_TYPICAL_SECONDS))
+
+
+def check_queue_capacity(tenant):
+    """Refuse a new job when the tenant or the whole queue already holds too many"""
+    queued = GenerationJob.objects.filter(status=GenerationJob.Status.QUEUED)
+    if settings.GENERATION_MAX_QUEUED_PER_TENANT:
+        mine = queued.filter(tenant=tenant.key).count()
+        if mine >= settings.GENERATION_MAX_QUEUED_PER_TENANT:
+            return Rejection(
+                'You already have images waiting to be generated. Please wait for them to finish.',
+                _queue_wait_estimate(mine),
+            )
+    if settings.GENERATION_MAX_QUEUED:
+        total = queued.count()
+        if total >= settings.GENERATION_MAX_QUEUED:
+            return Rejection('The generator is busy. Please try again shortly.', _queue_wait_estimate(total))
+    return None
+
+
+def admit(request, cost=1, queued=True):
+    """
+    Admission check of a generation request.
+
+    Returns (tenant, rejection): the job is charged to tenant, and rejection
+    is None when the request may proceed. queued is False for requests
+    generating inline (batches), which do not count against the queue caps.
+    """
+    tenant = tenant_for(request)
+    rejection = (check_queue_capacity(tenant) if queued else None) or check_rate_limit(tenant, cost)
+    return tenant, rejection
+
+
+async def aadmit(request, cost=1, queued=True):
+    """Coroutine version of admit (the buckets are charged in a transaction, which has no async API)"""
+    return await sync_to_async(admit)(request, cost, queued)
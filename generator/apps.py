@@ -1,6 +1,70 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+
+
+# Application servers whose processes serve requests
+SERVER_PROGRAMS = ('gunicorn', 'uvicorn', 'hypercorn', 'daphne', 'uwsgi', 'waitress-serve')
+
+
+def _program_name(path):
+    """Program of argv[0]: 'gunicorn' for /venv/bin/gunicorn as well as for `python -m gunicorn`"""
+    name = os.path.basename(path)
+    if name == '__main__.py':
+        name = os.path.basename(os.path.dirname(path))
+    return name.removesuffix('.py')
+
+
+def _is_serving_process():
+    """
+    True for processes that serve generations: an application server, runserver's
+    child or the job worker. Tests, shells and scripts calling django.setup() are not.
+    """
+    argv = sys.argv
+    if not argv:
+        return False
+    program = _program_name(argv[0])
+    if program in ('manage', 'django-admin'):
+        command = argv[1] if len(argv) > 1 else ''
+        if command == 'runserver':
+            # Only the autoreloader child actually serves requests
+            return os.environ.get('RUN_MAIN') == 'true'
+        return command == 'rungenerationworker'
+    return program in SERVER_PROGRAMS
 
 
 class GeneratorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'generator'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+
+        from . import checks  # noqa: F401
+        from .models import GeneratedImage
+        from .pagecache import invalidate_gallery
+        from .startup import preloading
+
+        post_save.connect(invalidate_gallery, sender=GeneratedImage, dispatch_uid='gallery_on_save')
+        post_delete.connect(invalidate_gallery, sender=GeneratedImage, dispatch_uid='gallery_on_delete')
+
+        # A preloading gunicorn master starts it in each worker instead (startup.after_fork)
+        if settings.GENERATION_WARMUP_ON_STARTUP and _is_serving_process() and not preloading():
+            start_warmup()
+
+
+def start_warmup():
+    """Prime the remote inference model in the background (and keep it warm if configured)"""
+    from .backends import get_backend
+    from .warmup import start_model_warmer
+
+    for name in settings.GENERATION_BACKEND_CANDIDATES or [settings.GENERATION_BACKEND]:
+        try:
+            backend = get_backend(name)
+        except Exception:
+            continue  # e.g. no API key: nothing to warm up
+        if backend.capabilities.requires_network:
+            return start_model_warmer(backend, interval=settings.GENERATION_KEEP_WARM_INTERVAL)
+    return None
@@ -0,0 +1,182 @@
+"""
+Generation engines and the registry selecting them from settings.
+
+- huggingface: the hosted Stable Diffusion XL model (StableDiffusionService)
+- procedural: deterministic renderer running on the local CPU, no network
+- stub: instant placeholder images, for load tests and benchmarks
+
+Every engine implements the GenerationBackend interface and declares its
+BackendCapabilities, so the pipeline can run fully offline and
+select_backend() can route each request to the cheapest engine able to
+serve it.
+"""
+import hashlib
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from stable_diffusion_service import BackendCapabilities, GenerationBackend
+
+BACKENDS = {
+    'huggingface': 'stable_diffusion_service.get_stable_diffusion_service',
+    'procedural': 'generator.backends.ProceduralBackend',
+    'stub': 'generator.backends.StubBackend',
+}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def _forget_instances():
+    # A worker forked from a preloaded process builds its own engines: their
+    # HTTP connection pools must not be shared between processes
+    global _instances_lock
+    _instances.clear()
+    _instances_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_instances)
+
+
+def get_backend(name=None):
+    """Return the engine registered under name (default: GENERATION_BACKEND), built once per process"""
+    name = name or settings.GENERATION_BACKEND
+    with _instances_lock:
+        backend = _instances.get(name)
+        if backend is None:
+            backend = _instances[name] = import_string(BACKENDS.get(name, name))()
+        return backend
+
+
+def built_backends():
+    """Return the engines built so far in this process, by name"""
+    with _instances_lock:
+        return dict(_instances)
+
+
+def select_backend(width=1024, height=1024, steps=None):
+    """
+    Return the cheapest engine able to serve a request of this size.
+
+    Candidates come from GENERATION_BACKEND_CANDIDATES, or are just
+    GENERATION_BACKEND. Engines that cannot be built (e.g. no API key) or are
+    unavailable are skipped. Returns None when no engine supports the request,
+    and raises the build error when no engine could be built at all.
+    """
+    candidates = settings.GENERATION_BACKEND_CANDIDATES or [settings.GENERATION_BACKEND]
+    usable = []
+    built = False
+    error = None
+    for name in candidates:
+        try:
+            backend = get_backend(name)
+        except Exception as e:
+            error = e
+            continue
+        built = True
+        if backend.capabilities.supports(width, height, steps):
+            usable.append(backend)
+
+    if len(usable) > 1:
+        usable = [backend for backend in usable if backend.is_available()] or usable
+    if usable:
+        return min(usable, key=lambda backend: backend.capabilities.relative_cost)
+    if not built:
+        raise error
+    return None
+
+
+def _word_color(word):
+    digest = hashlib.sha256(word.lower().encode()).digest()
+    return digest[0], digest[1], digest[2]
+
+
+class LocalBackend(GenerationBackend):
+    """Base of the engines rendering in-process"""
+
+    def _build_payload(self, prompt, negative_prompt, width, height, seed):
+        payload = super()._build_payload(prompt, negative_prompt, width, height, seed)
+        # Images of different engines must never share a cache entry
+        payload['engine'] = self.name
+        return payload
+
+    def _rng(self, prompt, negative_prompt, seed):
+        """Random generator determined by the request: same request, same image"""
+        digest = hashlib.sha256(f"{prompt}\0{negative_prompt or ''}\0{seed}".encode()).digest()
+        return random.Random(int.from_bytes(digest[:8], 'big'))
+
+
+class ProceduralBackend(LocalBackend):
+    """
+    Deterministic abstract renderer.
+
+    Colors come from the prompt words and the layout from the request seed:
+    a gradient background with soft translucent shapes, encoded as PNG.
+    Renders a 1024x1024 image in about a tenth of a second on one core.
+    """
+    name = 'procedural'
+    capabilities = BackendCapabilities(
+        max_width=2048, max_height=2048, default_steps=1, max_steps=1,
+        supports_batching=True, requires_network=False, relative_cost=0.01,
+    )
+
+    def _render(self, prompt, negative_prompt, width, height, seed):
+        from PIL import Image, ImageDraw, ImageFilter, ImageOps
+
+        rng = self._rng(prompt, negative_prompt, seed)
+        palette = [_word_color(word) for word in prompt.split()] or [(128, 128, 128)]
+
+        gradient = Image.linear_gradient('L').resize((width, height))
+        if rng.random() < 0.5:
+            gradient = gradient.transpose(Image.Transpose.ROTATE_90).resize((width, height))
+        background = ImageOps.colorize(gradient, palette[0], palette[-1]).convert('RGBA')
+
+        overlay = Image.new('RGBA', (width, height))
+        draw = ImageDraw.Draw(overlay)
+        for i in range(min(40, 6 + 2 * len(palette))):
+            radius = rng.uniform(0.05, 0.35) * min(width, height)
+            x, y = rng.uniform(0, width), rng.uniform(0, height)
+            color = palette[rng.randrange(len(palette))] + (rng.randint(60, 160),)
+            if i % 3:
+                draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill=color)
+            else:
+                draw.regular_polygon((x, y, radius), rng.randint(3, 6), rotation=rng.uniform(0, 360), fill=color)
+
+        image = Image.alpha_composite(background, overlay).convert('RGB')
+        image = image.filter(ImageFilter.GaussianBlur(radius=max(1, min(width, height) // 256)))
+        buffered = BytesIO()
+        image.save(buffered, format='PNG', compress_level=1)
+        return buffered.getvalue()
+
+
+class StubBackend(LocalBackend):
+    """Solid-color placeholder per prompt, after an optional artificial latency"""
+    name = 'stub'
+    capabilities = BackendCapabilities(
+        max_width=4096, max_height=4096, default_steps=1, max_steps=1,
+        supports_batching=True, requires_network=False, relative_cost=0.0,
+    )
+
+    def __init__(self, cache=None, latency=None):
+        super().__init__(cache=cache)
+        self.latency = settings.GENERATION_STUB_LATENCY if latency is None else latency
+
+    def _render(self, prompt, negative_prompt, width, height, seed):
+        if self.latency:
+            time.sleep(self.latency)
+        return _solid_png(width, height, _word_color(prompt))
+
+
+@lru_cache(maxsize=64)
+def _solid_png(width, height, color):
+    from PIL import Image
+
+    buffered = BytesIO()
+    Image.new('RGB', (width, height), color).save(buffered, format='PNG')
+    return buffered.getvalue()
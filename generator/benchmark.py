@@ -0,0 +1,437 @@
+"""
+End-to-end benchmark of the generation pipeline.
+
+BenchmarkEnvironment starts the inference stub, a server running the app
+(gunicorn over WSGI or uvicorn over ASGI) and a generation worker, all on a
+throwaway database and blob store.
+run_scenario() then drives one endpoint with a pool of concurrent clients and
+ScenarioStats reports throughput, latency percentiles and database queries
+per request (from the X-DB-Query-Count header). Results are plain dicts, so a
+run can be saved as JSON and compared with an earlier one.
+"""
+import os
+import platform
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import django
+import requests
+from django.conf import settings
+
+from .stub_server import StubInferenceServer
+
+# Metrics compared between two runs, with the direction that counts as better
+COMPARED_METRICS = {
+    'throughput_rps': 'higher',
+    'latency_ms.p50': 'lower',
+    'latency_ms.p95': 'lower',
+    'latency_ms.p99': 'lower',
+    'db_queries.mean': 'lower',
+}
+
+
+def percentile(sorted_values, p):
+    """Linearly interpolated percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class ScenarioStats:
+    """Thread-safe collector of the request outcomes of one scenario"""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.queries = []
+        self.statuses = Counter()
+        self.errors = 0
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def record(self, latency, status=None, queries=None, ok=True):
+        with self._lock:
+            self.latencies.append(latency)
+            self.statuses[str(status) if status is not None else 'error'] += 1
+            if queries is not None:
+                self.queries.append(queries)
+            if not ok:
+                self.errors += 1
+
+    def summary(self):
+        duration = (self.finished_at or time.perf_counter()) - (self.started_at or time.perf_counter())
+        latencies = sorted(self.latencies)
+
+        def ms(value):
+            return None if value is None else round(value * 1000, 2)
+
+        return {
+            'requests': len(latencies),
+            'errors': self.errors,
+            'duration_s': round(duration, 3),
+            'throughput_rps': round(len(latencies) / duration, 2) if duration > 0 else None,
+            'latency_ms': {
+                'p50': ms(percentile(latencies, 50)),
+                'p95': ms(percentile(latencies, 95)),
+                'p99': ms(percentile(latencies, 99)),
+                'mean': ms(sum(latencies) / len(latencies)) if latencies else None,
+                'max': ms(latencies[-1]) if latencies else None,
+            },
+            'db_queries': {
+                'mean': round(sum(self.queries) / len(self.queries), 2) if self.queries else None,
+                'max': max(self.queries) if self.queries else None,
+            },
+            'status_codes': dict(self.statuses),
+        }
+
+
+class BenchClient:
+    """HTTP client of one simulated user (keeps its session and CSRF token)"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        self.session.get(self.base_url + '/', timeout=30)
+        self.csrf_token = self.session.cookies.get('csrftoken', '')
+
+    def request(self, method, path, **kwargs):
+        headers = kwargs.pop('headers', {})
+        if method != 'GET':
+            headers['X-CSRFToken'] = self.csrf_token
+        return self.session.request(method, self.base_url + path, headers=headers, timeout=120, **kwargs)
+
+
+def run_scenario(name, base_url, make_request, total, concurrency, is_ok=None):
+    """
+    Send ``total`` requests with ``concurrency`` clients and return the ScenarioStats.
+
+    make_request(client, index) performs one request and returns the response.
+    """
+    stats = ScenarioStats(name)
+    is_ok = is_ok or (lambda response: response.status_code < 400)
+    counter = iter(range(total))
+    counter_lock = threading.Lock()
+
+    def next_index():
+        with counter_lock:
+            return next(counter, None)
+
+    def client_loop():
+        client = BenchClient(base_url)
+        while (index := next_index()) is not None:
+            start = time.perf_counter()
+            try:
+                response = make_request(client, index)
+            except requests.RequestException:
+                stats.record(time.perf_counter() - start, ok=False)
+                continue
+            queries = response.headers.get('X-DB-Query-Count')
+            stats.record(
+                time.perf_counter() - start, response.status_code,
+                int(queries) if queries is not None else None, is_ok(response),
+            )
+
+    stats.started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(client_loop) for _ in range(concurrency)]:
+            future.result()
+    stats.finished_at = time.perf_counter()
+    return stats
+
+
+def wait_for_jobs(base_url, jobs, timeout=120.0, poll_interval=0.05):
+    """
+    Poll queued jobs until they finish and return (ScenarioStats, image ids).
+
+    Latency is measured from enqueueing to the first poll seeing the job finished.
+    """
+    stats = ScenarioStats('generate_e2e')
+    stats.started_at = min((queued_at for _, queued_at in jobs), default=time.perf_counter())
+    session = requests.Session()
+    pending = list(jobs)
+    image_ids = []
+    give_up_at = time.monotonic() + timeout
+    while pending and time.monotonic() < give_up_at:
+        still_pending = []
+        for status_url, queued_at in pending:
+            payload = session.get(base_url.rstrip('/') + status_url, timeout=30).json()
+            if payload['status'] in ('succeeded', 'failed'):
+                ok = payload['status'] == 'succeeded'
+                stats.record(time.perf_counter() - queued_at, payload['status'], ok=ok)
+                if ok and payload.get('image'):
+                    image_ids.append(payload['image']['id'])
+            else:
+                still_pending.append((status_url, queued_at))
+        pending = still_pending
+        if pending:
+            time.sleep(poll_interval)
+    for _ in pending:
+        stats.record(timeout, 'timeout', ok=False)
+    stats.finished_at = time.perf_counter()
+    return stats, image_ids
+
+
+def peak_rss_mb(pid):
+    """Peak resident set size of a process in MiB (Linux only, None elsewhere)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def child_pids(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+SERVERS = ('gunicorn', 'uvicorn')
+
+
+class BenchmarkEnvironment:
+    """
+    Stub endpoint + app server + generation worker on a throwaway database.
+
+    ``server`` is 'gunicorn' (main:app over WSGI, with worker_class and
+    threads) or 'uvicorn' (the ASGI application). Use as a context manager;
+    ``base_url`` is the address of the app.
+    """
+
+    def __init__(self, server='gunicorn', workers=2, worker_class='sync', threads=1, job_concurrency=2,
+                 stub_options=None, extra_env=None, keep_workdir=False):
+        if server not in SERVERS:
+            raise ValueError(f"Unknown server {server!r}")
+        self.server_name = server
+        self.workers = workers
+        self.worker_class = worker_class
+        self.threads = threads
+        self.job_concurrency = job_concurrency
+        self.stub_options = stub_options or {}
+        self.extra_env = extra_env or {}
+        self.keep_workdir = keep_workdir
+        self.workdir = None
+        self.stub = None
+        self.server = None
+        self.job_worker = None
+        self.base_url = None
+
+    def __enter__(self):
+        self.workdir = Path(tempfile.mkdtemp(prefix='benchmark-'))
+        self.stub = StubInferenceServer(**self.stub_options).start()
+        env = self._environment()
+        subprocess.run([sys.executable, 'manage.py', 'migrate', '--noinput', '-v0'],
+                       cwd=settings.BASE_DIR, env=env, check=True)
+
+        port = free_port()
+        self.base_url = f'http://127.0.0.1:{port}'
+        self.server = subprocess.Popen(self._server_command(port), cwd=settings.BASE_DIR, env=env)
+        self.job_worker = subprocess.Popen(
+            [sys.executable, 'manage.py', 'rungenerationworker',
+             '--concurrency', str(self.job_concurrency), '--poll-interval', '0.05'],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL,
+        )
+        try:
+            self._wait_until_ready()
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        for process in (self.server, self.job_worker):
+            if process is not None and process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+        if self.stub is not None:
+            self.stub.stop()
+        if self.workdir is not None and not self.keep_workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def _server_command(self, port, workers=None):
+        workers = workers or self.workers
+        if self.server_name == 'uvicorn':
+            return [
+                sys.executable, '-m', 'uvicorn', 'image_generator_django.asgi:application',
+                '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers),
+                '--log-level', 'warning', '--no-access-log',
+            ]
+        return [
+            sys.executable, '-m', 'gunicorn', 'main:app', '--bind', f'127.0.0.1:{port}',
+            '--workers', str(workers), '--worker-class', self.worker_class,
+            '--threads', str(self.threads), '--log-level', 'warning',
+        ]
+
+    def cold_start(self, runs=5, timeout=60.0):
+        """
+        Time to first response of fresh server processes, as two ScenarioStats.
+
+        cold_start: from spawning a one-worker server to its first 200 on /.
+        worker_restart (gunicorn only): from killing that worker to the first
+        200 served by the worker the master starts in its place.
+        """
+        env = self._environment()
+        starts, restarts = ScenarioStats('cold_start'), ScenarioStats('worker_restart')
+        starts.started_at = restarts.started_at = time.perf_counter()
+        for _ in range(runs):
+            port = free_port()
+            url = f'http://127.0.0.1:{port}/'
+            spawned_at = time.perf_counter()
+            server = subprocess.Popen(self._server_command(port, workers=1), cwd=settings.BASE_DIR, env=env)
+            try:
+                starts.record(*_first_response(server, url, spawned_at, timeout))
+                workers = child_pids(server.pid) if self.server_name == 'gunicorn' else []
+                if workers:
+                    killed_at = time.perf_counter()
+                    os.kill(workers[0], signal.SIGKILL)
+                    restarts.record(*_first_response(server, url, killed_at, timeout))
+            finally:
+                server.terminate()
+                try:
+                    server.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+        starts.finished_at = restarts.finished_at = time.perf_counter()
+        return starts, restarts
+
+    def _environment(self):
+        env = dict(os.environ)
+        env.pop('DATABASE_URL', None)
+        env.update({
+            'HUGGINGFACE_API_KEY': 'benchmark',
+            'HUGGINGFACE_API_URL': self.stub.url,
+            'GENERATION_BACKEND': 'huggingface',
+            'GENERATION_BACKEND_CANDIDATES': '',
+            'GENERATION_WARMUP_ON_STARTUP': 'False',
+            'SQLITE_PATH': str(self.workdir / 'db.sqlite3'),
+            'IMAGE_STORE_ROOT': str(self.workdir / 'blobs'),
+            'IMAGE_RENDITION_ROOT': str(self.workdir / 'renditions'),
+            'GENERATION_CACHE_LOCATION': str(self.workdir / 'generation-cache'),
+            'PAGE_CACHE_LOCATION': str(self.workdir / 'page-cache'),
+            'METRICS_DIR': str(self.workdir / 'metrics'),
+            'QUERY_COUNT_HEADER': 'True',
+            # The benchmark clients all come from one address
+            'RATE_LIMIT_ENABLED': 'False',
+            'GENERATION_MAX_QUEUED': '0',
+            'GENERATION_MAX_QUEUED_PER_TENANT': '0',
+        })
+        env.update({key: str(value) for key, value in self.extra_env.items()})
+        return env
+
+    def _wait_until_ready(self, timeout=60.0):
+        give_up_at = time.monotonic() + timeout
+        while time.monotonic() < give_up_at:
+            if self.server.poll() is not None:
+                raise RuntimeError(f"{self.server_name} exited with status {self.server.returncode}")
+            try:
+                if requests.get(self.base_url + '/', timeout=2).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"Server not ready after {timeout:.0f}s")
+
+    def process_stats(self):
+        """Peak RSS of the server's master, each server worker and the generation worker"""
+        if self.server_name == 'uvicorn' and self.workers == 1:
+            workers = [self.server.pid]  # Serves from the main process
+        else:
+            workers = child_pids(self.server.pid)
+        return {
+            'server_master_peak_rss_mb': peak_rss_mb(self.server.pid),
+            'server_workers_peak_rss_mb': [peak_rss_mb(pid) for pid in workers],
+            'generation_worker_peak_rss_mb': peak_rss_mb(self.job_worker.pid),
+            'stub_requests': self.stub.request_count,
+        }
+
+
+def _first_response(process, url, since, timeout):
+    """Wait for the first 200 on url; returns ScenarioStats.record() arguments timed from since"""
+    give_up_at = time.monotonic() + timeout
+    while time.monotonic() < give_up_at and process.poll() is None:
+        try:
+            # Blocks in the listen backlog until a worker accepts the connection
+            response = requests.get(url, timeout=timeout)
+        except requests.RequestException:
+            time.sleep(0.01)  # Not listening yet
+            continue
+        if response.status_code == 200:
+            return time.perf_counter() - since, response.status_code
+        time.sleep(0.01)
+    return time.perf_counter() - since, 'timeout', None, False
+
+
+def run_metadata(config):
+    """Describe the run (code version, interpreter, configuration) for the results file"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': config,
+    }
+
+
+def _metric(summary, dotted):
+    value = summary
+    for part in dotted.split('.'):
+        value = (value or {}).get(part)
+    return value
+
+
+def compare_results(baseline, current):
+    """
+    Return one row per scenario metric: (scenario, metric, before, after, change %, regressed).
+
+    A metric regresses when it moved in the wrong direction by more than 10%.
+    """
+    rows = []
+    for scenario, summary in current['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(scenario)
+        if previous is None:
+            continue
+        for metric, better in COMPARED_METRICS.items():
+            before, after = _metric(previous, metric), _metric(summary, metric)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before * 100 if before else 0.0
+            regressed = change < -10 if better == 'higher' else change > 10
+            rows.append((scenario, metric, before, after, round(change, 1), regressed))
+    return rows
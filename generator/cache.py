@@ -0,0 +1,239 @@
+"""
+Cache of generation results keyed on the normalized request payload.
+
+Identical requests (same prompt, negative prompt, parameters and seed) are
+served from the cache instead of spending inference quota again. Backends are
+pluggable: an in-process LRU, an on-disk store shared between processes, or
+the Django cache framework.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return ' '.join(value.split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def generation_cache_key(payload, seed=None):
+    """Return a deterministic key for a request payload (and seed, if any)"""
+    normalized = _normalize(payload)
+    if seed is not None:
+        normalized = {'payload': normalized, 'seed': seed}
+    encoded = json.dumps(normalized, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class MemoryLRUBackend:
+    """In-process LRU bounded by total bytes and entry age"""
+
+    def __init__(self, max_bytes, max_age):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._entries = OrderedDict()  # key -> (stored_at, bytes)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, data = entry
+            if self.max_age and time.time() - stored_at > self.max_age:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def set(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time(), data)
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key):
+        _, data = self._entries.pop(key)
+        self._size -= len(data)
+
+
+class DiskBackend:
+    """
+    On-disk cache shared by every process using the same directory.
+
+    Entry age is the file mtime and recency the file atime, which is refreshed
+    on each hit; when the directory grows past max_bytes the least recently
+    used files are removed.
+    """
+
+    def __init__(self, location, max_bytes, max_age):
+        self.root = Path(location)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evictions = 0
+
+    def _path(self, key):
+        return self.root / key[:2] / key
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            stat = path.stat()
+            if self.max_age and time.time() - stat.st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                return None
+            data = path.read_bytes()
+            os.utime(path, (time.time(), stat.st_mtime))
+            return data
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._evict()
+
+    def delete(self, key):
+        self._path(key).unlink(missing_ok=True)
+
+    def clear(self):
+        for path in self.root.glob('*/*'):
+            path.unlink(missing_ok=True)
+
+    def _evict(self):
+        entries = []
+        total = 0
+        now = time.time()
+        for path in self.root.glob('*/*'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if self.max_age and now - stat.st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            path.unlink(missing_ok=True)
+            self.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+class DjangoCacheBackend:
+    """Store results through a Django cache alias (size limits are left to that cache)"""
+
+    def __init__(self, alias, max_age):
+        from django.core.cache import caches
+
+        self.cache = caches[alias]
+        self.max_age = max_age or None
+        self.evictions = 0
+
+    def get(self, key):
+        return self.cache.get(f"generation:{key}")
+
+    def set(self, key, data):
+        self.cache.set(f"generation:{key}", data, timeout=self.max_age)
+
+    def delete(self, key):
+        self.cache.delete(f"generation:{key}")
+
+    def clear(self):
+        self.cache.clear()
+
+
+class GenerationCache:
+    """Generation result cache with hit/miss counters"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        data = self.backend.get(key)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def set(self, key, data):
+        self.backend.set(key, data)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.backend.evictions,
+        }
+
+
+def build_generation_cache(config):
+    """
+    Build a GenerationCache from a GENERATION_CACHE settings dict.
+
+    Returns None when the backend is 'none'.
+    """
+    backend = (config.get('BACKEND') or 'none').lower()
+    max_bytes = config.get('MAX_BYTES', 256 * 1024 * 1024)
+    max_age = config.get('MAX_AGE', 24 * 3600)
+
+    if backend == 'none':
+        return None
+    if backend == 'memory':
+        return GenerationCache(MemoryLRUBackend(max_bytes, max_age))
+    if backend == 'disk':
+        return GenerationCache(DiskBackend(config['LOCATION'], max_bytes, max_age))
+    if backend == 'django':
+        return GenerationCache(DjangoCacheBackend(config.get('CACHE_ALIAS', 'default'), max_age))
+    raise ValueError(f"Unknown generation cache backend: {backend}")
@@ -0,0 +1,107 @@
+"""
+System checks of the generator settings (``manage.py check --tag generator``).
+
+They only read settings: no engine, HTTP client or pool is built. Django
+runs them with ``check``, ``runserver`` and ``migrate``, and a preloaded
+gunicorn master runs them once before forking (see generator.startup).
+"""
+import importlib.util
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+SENDFILE_MODES = ('', 'x-sendfile', 'x-accel-redirect')
+CACHE_BACKENDS = ('none', 'memory', 'disk', 'django')
+
+# Settings that must be > 0
+POSITIVE_SETTINGS = (
+    'GENERATION_HTTP_POOL_SIZE', 'GENERATION_ASYNC_POOL_SIZE', 'GENERATION_HTTP_TIMEOUT',
+    'GENERATION_RETRY_MAX_ATTEMPTS', 'GENERATION_REQUEST_DEADLINE', 'GENERATION_CIRCUIT_FAILURE_THRESHOLD',
+    'GENERATION_WORKER_CONCURRENCY', 'GENERATION_WORKER_POLL_INTERVAL', 'GENERATION_BATCH_MAX_ITEMS',
+    'GENERATION_BATCH_CONCURRENCY', 'EXPORT_CHUNK_SIZE', 'RETENTION_BATCH_SIZE', 'METRICS_SNAPSHOT_MAX_AGE',
+)
+# Settings that must be >= 0 (0 usually disables the feature)
+NON_NEGATIVE_SETTINGS = (
+    'GENERATION_RETRY_BASE_DELAY', 'GENERATION_RETRY_MAX_DELAY', 'GENERATION_KEEP_WARM_INTERVAL',
+    'GENERATION_STUB_LATENCY', 'GENERATION_MAX_QUEUED', 'GENERATION_MAX_QUEUED_PER_TENANT', 'RENDITION_POOL_SIZE',
+    'RETENTION_MAX_AGE_DAYS', 'RETENTION_MAX_IMAGES', 'RETENTION_MAX_BYTES', 'IMAGE_ARCHIVE_AFTER_DAYS',
+    'RETENTION_JOB_MAX_AGE_DAYS',
+)
+
+
+def _backend_exists(name):
+    from .backends import BACKENDS
+
+    if name in BACKENDS:
+        return True
+    # A dotted path: find the module without importing it
+    module, _, attribute = name.rpartition('.')
+    try:
+        return bool(module and attribute) and importlib.util.find_spec(module) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+@register('generator')
+def check_settings(app_configs=None, **kwargs):
+    from stable_diffusion_service import TRANSCODE_FORMATS
+
+    from .backends import BACKENDS
+
+    messages = []
+    engines = settings.GENERATION_BACKEND_CANDIDATES or [settings.GENERATION_BACKEND]
+    for name in engines:
+        if not _backend_exists(name):
+            messages.append(Error(
+                f"Unknown generation engine {name!r}",
+                hint=f"Use one of {', '.join(BACKENDS)} or the dotted path of a GenerationBackend",
+                id='generator.E001',
+            ))
+    if 'huggingface' in engines and not settings.HUGGINGFACE_API_KEY:
+        messages.append(Warning(
+            "HUGGINGFACE_API_KEY is not set: the huggingface engine cannot generate",
+            hint="Set the key, or GENERATION_BACKEND=procedural to generate offline",
+            id='generator.W002',
+        ))
+
+    if settings.HUGGINGFACE_API_URL:
+        url = urlparse(settings.HUGGINGFACE_API_URL)
+        if url.scheme not in ('http', 'https') or not url.netloc:
+            messages.append(Error(
+                f"HUGGINGFACE_API_URL is not an http(s) URL: {settings.HUGGINGFACE_API_URL!r}", id='generator.E003',
+            ))
+    if settings.IMAGE_SENDFILE_MODE not in SENDFILE_MODES:
+        messages.append(Error(
+            f"Unknown IMAGE_SENDFILE_MODE {settings.IMAGE_SENDFILE_MODE!r}",
+            hint="Use '' (stream from Django), 'x-sendfile' or 'x-accel-redirect'",
+            id='generator.E004',
+        ))
+    if settings.GENERATION_OUTPUT_FORMAT and settings.GENERATION_OUTPUT_FORMAT.lower() not in TRANSCODE_FORMATS:
+        messages.append(Error(
+            f"Unknown GENERATION_OUTPUT_FORMAT {settings.GENERATION_OUTPUT_FORMAT!r}",
+            hint=f"Use one of {', '.join(TRANSCODE_FORMATS)}, or leave it empty to keep the API's bytes",
+            id='generator.E005',
+        ))
+    cache_backend = (settings.GENERATION_CACHE.get('BACKEND') or 'none').lower()
+    if cache_backend not in CACHE_BACKENDS:
+        messages.append(Error(
+            f"Unknown GENERATION_CACHE_BACKEND {cache_backend!r}",
+            hint=f"Use one of {', '.join(CACHE_BACKENDS)}",
+            id='generator.E006',
+        ))
+
+    for name in POSITIVE_SETTINGS:
+        if getattr(settings, name) <= 0:
+            messages.append(Error(f"{name} must be greater than 0", id='generator.E007'))
+    for name in NON_NEGATIVE_SETTINGS:
+        if getattr(settings, name) < 0:
+            messages.append(Error(f"{name} cannot be negative", id='generator.E008'))
+    if settings.PROFILING_ENABLED and not settings.PROFILING_TOKEN:
+        messages.append(Warning(
+            "PROFILING_ENABLED is on without a PROFILING_TOKEN: no request will be profiled",
+            id='generator.W010',
+        ))
+    if not 0 <= settings.RETENTION_VACUUM_FREE_RATIO <= 1:
+        messages.append(Error("RETENTION_VACUUM_FREE_RATIO must be between 0 and 1", id='generator.E009'))
+    return messages
@@ -0,0 +1,208 @@
+"""
+Streaming bulk export of generated images as a ZIP or tar archive.
+
+export_archive() yields the archive as a sequence of byte chunks while it
+reads the rows with ``.iterator(chunk_size=...)`` and copies each blob in
+CHUNK_SIZE pieces, so memory stays flat whatever the number of images. The
+archive holds ``images/<prompt>_<id>.<ext>`` plus ``manifest.jsonl``, one
+JSON line per exported row (prompt, timestamp, file, size, SHA-256). The
+manifest is spooled to a temporary file during the export and appended last.
+
+Rows whose bytes are not in the blob store (legacy remote images) appear in
+the manifest with ``"file": null``.
+"""
+import json
+import os
+import struct
+import tarfile
+import tempfile
+import time
+import zipfile
+import zlib
+
+from django.conf import settings
+
+from .models import GeneratedImage
+from .serving import CHUNK_SIZE, download_filename, file_chunks
+from .storage import get_blob_store
+
+ARCHIVE_FORMATS = {
+    'zip': ('application/zip', 'zip'),
+    'tar': ('application/x-tar', 'tar'),
+}
+
+MANIFEST_NAME = 'manifest.jsonl'
+EXPORT_FIELDS = ('id', 'prompt', 'image_url', 'blob_key', 'byte_size', 'width', 'height', 'mime_type', 'created_at')
+
+
+def _dos_datetime(timestamp):
+    """(time, date) fields of a ZIP entry (local time, two-second resolution, from 1980)"""
+    t = time.localtime(max(timestamp, 315532800))
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    return dos_time, ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+class ZipStream:
+    """
+    ZIP written front to back, for a non-seekable output.
+
+    Sizes and CRCs follow each entry in a data descriptor. The central
+    directory records are spooled to a temporary file as entries are
+    written (zipfile would keep them all in memory until close), and Zip64
+    end records are added past 4 GiB or 65535 entries. Each entry must be
+    smaller than 4 GiB.
+    """
+
+    def __init__(self):
+        self._offset = 0
+        self._count = 0
+        self._directory = tempfile.TemporaryFile()
+
+    def _emit(self, data):
+        self._offset += len(data)
+        return data
+
+    def add(self, name, chunks, size, mtime, compress=False):
+        encoded = name.encode('utf-8')
+        flags = 0x08 | 0x800  # Data descriptor, UTF-8 name
+        method = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED  # Images are already compressed
+        dos_time, dos_date = _dos_datetime(mtime)
+        header_offset = self._offset
+        yield self._emit(struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, 20, flags, method, dos_time, dos_date, 0, 0, 0, len(encoded), 0,
+        ) + encoded)
+
+        crc = raw_size = compressed_size = 0
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15) if compress else None
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            raw_size += len(chunk)
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                compressed_size += len(chunk)
+                yield self._emit(chunk)
+        if compressor is not None:
+            chunk = compressor.flush()
+            compressed_size += len(chunk)
+            yield self._emit(chunk)
+        if compressed_size >= 0xFFFFFFFF or raw_size >= 0xFFFFFFFF:
+            raise ValueError(f"{name} is too large for a streamed ZIP entry")
+        yield self._emit(struct.pack('<IIII', 0x08074b50, crc, compressed_size, raw_size))
+
+        extra = b''
+        if header_offset >= 0xFFFFFFFF:
+            extra = struct.pack('<HHQ', 0x0001, 8, header_offset)
+        self._directory.write(struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | 45, 45 if extra else 20, flags, method,
+            dos_time, dos_date, crc, compressed_size, raw_size, len(encoded), len(extra), 0, 0, 0,
+            0o100644 << 16, min(header_offset, 0xFFFFFFFF),
+        ) + encoded + extra)
+        self._count += 1
+
+    def close(self):
+        directory_offset = self._offset
+        directory_size = self._directory.tell()
+        self._directory.seek(0)
+        while chunk := self._directory.read(CHUNK_SIZE):
+            yield self._emit(chunk)
+        self._directory.close()
+
+        count = self._count
+        if count >= 0xFFFF or directory_offset >= 0xFFFFFFFF or directory_size >= 0xFFFFFFFF:
+            zip64_end_offset = self._offset
+            yield self._emit(struct.pack(
+                '<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, count, count, directory_size, directory_offset,
+            ))
+            yield self._emit(struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1))
+        yield self._emit(struct.pack(
+            '<IHHHHIIH', 0x06054b50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+            min(directory_size, 0xFFFFFFFF), min(directory_offset, 0xFFFFFFFF), 0,
+        ))
+
+
+class TarStream:
+    """POSIX (pax) tar: a header block, the file bytes, padding to the next block"""
+
+    def __init__(self):
+        self._written = 0
+
+    def _emit(self, data):
+        self._written += len(data)
+        return data
+
+    def add(self, name, chunks, size, mtime, compress=False):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = 0o644
+        yield self._emit(info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+        for chunk in chunks:
+            yield self._emit(chunk)
+        if size % tarfile.BLOCKSIZE:
+            yield self._emit(tarfile.NUL * (tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE))
+
+    def close(self):
+        # Two empty blocks, then padding to a whole record (as tarfile does)
+        end = tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+        remainder = (self._written + len(end)) % tarfile.RECORDSIZE
+        if remainder:
+            end += tarfile.NUL * (tarfile.RECORDSIZE - remainder)
+        yield self._emit(end)
+
+
+def export_queryset(ids=None):
+    """Rows to export (all of them by default) in id order, with the exported columns only"""
+    queryset = GeneratedImage.objects.only(*EXPORT_FIELDS).order_by('id')
+    if ids is not None:
+        queryset = queryset.filter(id__in=ids)
+    return queryset
+
+
+def manifest_entry(image, file_name):
+    return {
+        'id': image.id,
+        'file': file_name,
+        'prompt': image.prompt,
+        'created_at': image.created_at.isoformat(),
+        'mime_type': image.mime_type or None,
+        'width': image.width,
+        'height': image.height,
+        'size': image.byte_size,
+        'sha256': image.blob_key or None,
+        'source_url': image.image_url or None,
+    }
+
+
+def export_archive(queryset, archive_format='zip', chunk_size=None):
+    """
+    Yield the bytes of an archive of the images of queryset, with its manifest.
+
+    chunk_size is the number of rows fetched per database round trip
+    (EXPORT_CHUNK_SIZE by default).
+    """
+    archive = ZipStream() if archive_format == 'zip' else TarStream()
+    store = get_blob_store()
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+
+    with tempfile.TemporaryFile() as manifest:
+        for image in queryset.iterator(chunk_size=chunk_size):
+            file_name = None
+            if image.blob_key:
+                path = store.path(image.blob_key)
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    path = None
+                if path is not None:
+                    file_name = 'images/' + download_filename(image.prompt, image.id, image.mime_type)
+                    yield from archive.add(file_name, file_chunks(path), size, image.created_at.timestamp())
+            line = json.dumps(manifest_entry(image, file_name), ensure_ascii=False) + '\n'
+            manifest.write(line.encode())
+
+        size = manifest.tell()
+        manifest.seek(0)
+        yield from archive.add(
+            MANIFEST_NAME, iter(lambda: manifest.read(CHUNK_SIZE), b''), size, time.time(), compress=True,
+        )
+    yield from archive.close()
@@ -0,0 +1,89 @@
+"""
+Image format and dimension sniffing from the first bytes of a file.
+
+Reads only the container header (PNG IHDR, JPEG SOF, WebP VP8/VP8L/VP8X,
+GIF screen descriptor), so no pixel data is decoded and nothing beyond the
+first few kilobytes needs to be in memory.
+"""
+import struct
+
+# Bytes of header kept for sniffing; large enough for JPEG EXIF before SOF
+HEADER_BYTES = 64 * 1024
+
+MIME_TYPES = {
+    'png': 'image/png',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'gif': 'image/gif',
+    'avif': 'image/avif',
+}
+
+# JPEG start-of-frame markers (DHT, JPG and DAC share the range)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def sniff_image(header):
+    """
+    Return (format, width, height) from the start of an image.
+
+    format is None when the container is not recognised; width and height are
+    None when the header is too short to contain them.
+    """
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        if len(header) >= 24 and header[12:16] == b'IHDR':
+            width, height = struct.unpack('>II', header[16:24])
+            return 'png', width, height
+        return 'png', None, None
+
+    if header.startswith(b'\xff\xd8'):
+        return ('jpeg',) + _jpeg_size(header)
+
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return ('webp',) + _webp_size(header)
+
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        if len(header) >= 10:
+            width, height = struct.unpack('<HH', header[6:10])
+            return 'gif', width, height
+        return 'gif', None, None
+
+    if header[4:12] in (b'ftypavif', b'ftypavis'):
+        return 'avif', None, None
+
+    return None, None, None
+
+
+def _jpeg_size(header):
+    i = 2
+    while i + 9 < len(header):
+        if header[i] != 0xFF:
+            i += 1
+            continue
+        marker = header[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in _JPEG_SOF:
+            height, width = struct.unpack('>HH', header[i + 5:i + 9])
+            return width, height
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        segment_length = struct.unpack('>H', header[i + 2:i + 4])[0]
+        i += 2 + segment_length
+    return None, None
+
+
+def _webp_size(header):
+    chunk = header[12:16]
+    if chunk == b'VP8 ' and len(header) >= 30:
+        width, height = struct.unpack('<HH', header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(header) >= 25:
+        bits = struct.unpack('<I', header[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X' and len(header) >= 30:
+        width = int.from_bytes(header[24:27], 'little') + 1
+        height = int.from_bytes(header[27:30], 'little') + 1
+        return width, height
+    return None, None
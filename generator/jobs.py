@@ -0,0 +1,216 @@
+"""
+Database-backed queue of generation jobs.
+
+Views only enqueue jobs and return immediately; the ``rungenerationworker``
+management command claims queued jobs and runs them in the background.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min
+from django.utils import timezone
+
+from .metrics import JOBS, STAGE_SECONDS, span
+from .models import GenerationJob
+from .pipeline import GenerationError, generate_and_store
+from .warmup import on_cold_start
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL advisory lock held while claiming a job
+CLAIM_LOCK_ID = 0x67656e6a6f62
+
+# Jobs running in this process, told about model cold starts
+_running = set()
+_running_lock = threading.Lock()
+
+
+@on_cold_start
+def _publish_loading_eta(gate, seconds_until_ready):
+    """Record the model-loading ETA on the jobs of this process so progress streams can show it"""
+    with _running_lock:
+        job_ids = list(_running)
+    if not job_ids:
+        return
+    eta = None if seconds_until_ready is None else timezone.now() + timedelta(seconds=seconds_until_ready)
+    GenerationJob.objects.filter(id__in=job_ids, status=GenerationJob.Status.RUNNING).update(loading_eta=eta)
+
+
+def enqueue_generation(prompt, negative_prompt='', use_cache=True, tenant='', weight=1):
+    """Create a queued job for prompt and return it"""
+    return GenerationJob.objects.create(
+        prompt=prompt, negative_prompt=negative_prompt or '', use_cache=use_cache, tenant=tenant, weight=weight,
+    )
+
+
+async def aenqueue_generation(prompt, negative_prompt='', use_cache=True, tenant='', weight=1):
+    """Coroutine version of enqueue_generation"""
+    return await GenerationJob.objects.acreate(
+        prompt=prompt, negative_prompt=negative_prompt or '', use_cache=use_cache, tenant=tenant, weight=weight,
+    )
+
+
+def enqueue_batch(items, use_cache=True, tenant='', weight=1):
+    """Create one queued job per BatchItem, in a single INSERT, and return them in order"""
+    return GenerationJob.objects.bulk_create([
+        GenerationJob(prompt=item.prompt, seed=item.seed, use_cache=use_cache, tenant=tenant, weight=weight)
+        for item in items
+    ])
+
+
+async def aenqueue_batch(items, use_cache=True, tenant='', weight=1):
+    """Coroutine version of enqueue_batch"""
+    return await GenerationJob.objects.abulk_create([
+        GenerationJob(prompt=item.prompt, seed=item.seed, use_cache=use_cache, tenant=tenant, weight=weight)
+        for item in items
+    ])
+
+
+def _next_job_id():
+    """
+    Pick the queued job to run next: weighted fair share between tenants.
+
+    The tenant with the fewest running jobs per unit of weight goes first
+    (ties: the oldest waiting job), so one tenant queueing many jobs cannot
+    hold every worker slot while others wait. Within a tenant jobs run in
+    order.
+    """
+    queued = (
+        GenerationJob.objects
+        .filter(status=GenerationJob.Status.QUEUED)
+        .values('tenant')
+        .annotate(oldest=Min('created_at'), weight=Max('weight'))
+    )
+    tenants = list(queued)
+    if not tenants:
+        return None
+    running = dict(
+        GenerationJob.objects
+        .filter(status=GenerationJob.Status.RUNNING, tenant__in=[t['tenant'] for t in tenants])
+        .values_list('tenant')
+        .annotate(count=Count('id'))
+    )
+    chosen = min(tenants, key=lambda t: (running.get(t['tenant'], 0) / max(1, t['weight']), t['oldest']))
+    return (
+        GenerationJob.objects
+        .filter(status=GenerationJob.Status.QUEUED, tenant=chosen['tenant'])
+        .order_by('created_at')
+        .values_list('id', flat=True)
+        .first()
+    )
+
+
+def _global_slot_free():
+    if not settings.GENERATION_MAX_RUNNING:
+        return True
+    running = GenerationJob.objects.filter(status=GenerationJob.Status.RUNNING).count()
+    return running < settings.GENERATION_MAX_RUNNING
+
+
+def claim_next_job(worker_name):
+    """
+    Atomically move the next queued job to running and return it.
+
+    The claim is a conditional UPDATE, so concurrent workers (threads or
+    processes) never run the same job twice. Returns None when the queue is
+    empty, or when GENERATION_MAX_RUNNING jobs already run across all workers.
+    """
+    while True:
+        with transaction.atomic():
+            _lock_claims()
+            if not _global_slot_free():
+                return None
+            job_id = _next_job_id()
+            if job_id is None:
+                return None
+
+            claimed = GenerationJob.objects.filter(id=job_id, status=GenerationJob.Status.QUEUED).update(
+                status=GenerationJob.Status.RUNNING,
+                worker=worker_name,
+                started_at=timezone.now(),
+                attempts=F('attempts') + 1,
+            )
+        if claimed:
+            return GenerationJob.objects.get(id=job_id)
+        # Another worker won the race for this job; try the next one
+
+
+def _lock_claims():
+    # Serializes claims so the fair share and the global cap hold across workers.
+    # SQLite transactions normally take the write lock when they start
+    # (transaction_mode IMMEDIATE); otherwise a write that matches no row takes
+    # it before the queue is read.
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [CLAIM_LOCK_ID])
+    elif connection.vendor == 'sqlite' and connection.settings_dict['OPTIONS'].get('transaction_mode') != 'IMMEDIATE':
+        with connection.cursor() as cursor:
+            cursor.execute(f"UPDATE {GenerationJob._meta.db_table} SET id = id WHERE 0")
+
+
+def queue_has_jobs():
+    return GenerationJob.objects.filter(status=GenerationJob.Status.QUEUED).exists()
+
+
+def requeue_stale_jobs(timeout_seconds, max_attempts=None):
+    """
+    Put running jobs whose worker died back on the queue; return how many were requeued.
+
+    A stale job already claimed max_attempts times (GENERATION_JOB_MAX_ATTEMPTS)
+    is failed instead, so a job that keeps killing its worker cannot loop
+    forever. Jobs running in this process are never stale.
+    """
+    max_attempts = max_attempts or settings.GENERATION_JOB_MAX_ATTEMPTS
+    cutoff = timezone.now() - timedelta(seconds=timeout_seconds)
+    with _running_lock:
+        own_jobs = list(_running)
+    stale = GenerationJob.objects.filter(
+        status=GenerationJob.Status.RUNNING,
+        started_at__lt=cutoff,
+    ).exclude(id__in=own_jobs)
+
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status=GenerationJob.Status.FAILED,
+        error=f"Generation abandoned after {max_attempts} attempts",
+        finished_at=timezone.now(),
+        loading_eta=None,
+    )
+    if failed:
+        logger.warning(f"Failed {failed} stale generation job(s) after {max_attempts} attempts")
+        JOBS.inc(failed, status=GenerationJob.Status.FAILED)
+    return stale.filter(attempts__lt=max_attempts).update(status=GenerationJob.Status.QUEUED, worker='')
+
+
+def run_job(job):
+    """Run a claimed job to completion and record its outcome"""
+    if job.started_at:
+        STAGE_SECONDS.observe((job.started_at - job.created_at).total_seconds(), stage='queue_wait')
+    with _running_lock:
+        _running.add(job.id)
+    try:
+        with span('job', job_id=str(job.id)):
+            image = generate_and_store(job.prompt, job.negative_prompt, use_cache=job.use_cache, seed=job.seed)
+    except GenerationError as e:
+        _finish(job, GenerationJob.Status.FAILED, error=str(e))
+    except Exception as e:
+        logger.error(f"Generation job {job.id} failed: {str(e)}")
+        _finish(job, GenerationJob.Status.FAILED, error=f"Error generating image: {str(e)}")
+    else:
+        _finish(job, GenerationJob.Status.SUCCEEDED, image=image)
+    finally:
+        with _running_lock:
+            _running.discard(job.id)
+    return job
+
+
+def _finish(job, status, image=None, error=''):
+    job.status = status
+    job.image = image
+    job.error = error
+    job.finished_at = timezone.now()
+    job.loading_eta = None
+    job.save(update_fields=['status', 'image', 'error', 'finished_at', 'loading_eta'])
+    JOBS.inc(status=status)
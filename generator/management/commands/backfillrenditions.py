@@ -0,0 +1,65 @@
+"""
+Render the thumbnails, WebP/AVIF variants and placeholders of existing images.
+"""
+import os
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.core.management.base import BaseCommand
+
+from generator.models import GeneratedImage
+from generator.renditions import render_chunk, make_pool, save_placeholders
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the renditions and placeholders of images that have none yet, in parallel chunks. "
+        "Progress is recorded per image, so an interrupted run resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Rendering processes")
+        parser.add_argument('--chunk-size', type=int, default=20, help="Images per pool task")
+        parser.add_argument('--limit', type=int, help="Stop after this many images")
+        parser.add_argument('--force', action='store_true',
+                            help="Re-render every image, including those already done")
+
+    def handle(self, *args, **options):
+        images = GeneratedImage.objects.exclude(blob_key='').order_by('id')
+        if not options['force']:
+            images = images.filter(renditions_at__isnull=True)
+        total = images.count()
+        if options['limit']:
+            total = min(total, options['limit'])
+        self.stdout.write(f"Rendering {total} images with {options['workers']} processes")
+
+        chunk_size = max(1, options['chunk_size'])
+        # Keep a bounded number of chunks in flight so memory stays flat on large tables
+        max_pending = max(1, options['workers']) * 2
+        last_id = 0
+        submitted = done = failed = 0
+        pending = set()
+        with make_pool(max(1, options['workers'])) as pool:
+            while True:
+                while len(pending) < max_pending and submitted < total:
+                    rows = list(
+                        images.filter(id__gt=last_id)
+                        .values_list('id', 'blob_key')[:min(chunk_size, total - submitted)]
+                    )
+                    if not rows:
+                        total = submitted
+                        break
+                    last_id = rows[-1][0]
+                    submitted += len(rows)
+                    keys = sorted({key for _, key in rows})
+                    pending.add(pool.submit(render_chunk, keys, options['force']))
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    results = future.result()
+                    save_placeholders(results)
+                    done += sum(1 for result in results.values() if result is not None)
+                    failed += sum(1 for result in results.values() if result is None)
+                self.stdout.write(f"{done} blobs rendered, {failed} failed", ending='\r')
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f"Rendered {done} blobs ({failed} failed) for {submitted} images"))
@@ -0,0 +1,66 @@
+"""
+Apply the retention policy: delete expired images, archive cold ones, prune
+finished jobs and compact the database.
+"""
+import os
+
+from django.core.management.base import BaseCommand
+
+from generator.retention import archive_cold, compact_database, delete_expired, prune_jobs, sweep_orphans
+
+
+def _mb(size):
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply the RETENTION_* and IMAGE_ARCHIVE_AFTER_DAYS settings, then compact the database. "
+        "Meant to run periodically (cron, systemd timer); every step is safe to interrupt and rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report what would be done without changing anything")
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Rows deleted per transaction (default: RETENTION_BATCH_SIZE)")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Processes re-encoding images for the archive tier")
+        parser.add_argument('--skip-archive', action='store_true', help="Do not move images to the archive tier")
+        vacuum = parser.add_mutually_exclusive_group()
+        vacuum.add_argument('--vacuum', action='store_true', default=None,
+                            help="VACUUM the SQLite database whatever its free space")
+        vacuum.add_argument('--no-vacuum', action='store_false', dest='vacuum',
+                            help="Never VACUUM the SQLite database (ANALYZE still runs)")
+        parser.add_argument('--sweep-orphans', action='store_true',
+                            help="Also walk the blob store for blobs no image references")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        verb = "Would delete" if dry_run else "Deleted"
+
+        deleted, released = delete_expired(options['batch_size'], dry_run=dry_run)
+        self.stdout.write(f"{verb} {deleted} expired images" + (
+            f", released {released.blobs} blobs ({_mb(released.bytes)})" if released.blobs else ''
+        ))
+
+        if not options['skip_archive']:
+            archived, saved = archive_cold(options['workers'], dry_run=dry_run)
+            if dry_run:
+                self.stdout.write(f"Would archive {archived} images")
+            else:
+                self.stdout.write(f"Archived {archived} images, saving {_mb(saved)}")
+
+        self.stdout.write(f"{verb} {prune_jobs(options['batch_size'], dry_run=dry_run)} finished jobs")
+
+        if options['sweep_orphans']:
+            released = sweep_orphans(dry_run=dry_run)
+            self.stdout.write(f"{verb} {released.blobs} orphaned blobs ({_mb(released.bytes)})")
+
+        report = compact_database(options['vacuum'], dry_run=dry_run)
+        if 'database_bytes' in report:
+            self.stdout.write(
+                f"Database: {_mb(report['database_bytes'])}, {_mb(report['free_bytes'])} free"
+                + (" after VACUUM" if report['vacuumed'] else '')
+            )
+        self.stdout.write(self.style.SUCCESS("Dry run done" if dry_run else "Retention applied"))
@@ -0,0 +1,54 @@
+"""
+Export generated images as a ZIP or tar archive with a JSONL manifest.
+"""
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from generator.export import ARCHIVE_FORMATS, export_archive, export_queryset
+from generator.search import search_images
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream all images (or a selection) into a ZIP or tar archive holding the image files "
+        "and manifest.jsonl, without loading them in memory"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Archive file to write, or - for standard output")
+        parser.add_argument('--format', choices=list(ARCHIVE_FORMATS), default=None,
+                            help="Archive format (default: from the output extension, else zip)")
+        parser.add_argument('--ids', help="Comma-separated image ids to export")
+        parser.add_argument('--query', help="Only export the images whose prompt matches this search")
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help="Rows read per database round trip (default: EXPORT_CHUNK_SIZE)")
+
+    def handle(self, *args, **options):
+        output = options['output']
+        archive_format = options['format'] or ('tar' if output.endswith('.tar') else 'zip')
+        ids = None
+        if options['ids']:
+            try:
+                ids = [int(part) for part in options['ids'].split(',') if part.strip()]
+            except ValueError:
+                raise CommandError("--ids expects comma-separated integers")
+
+        queryset = export_queryset(ids)
+        if options['query']:
+            queryset = search_images(queryset, options['query'])
+
+        chunks = export_archive(queryset, archive_format, chunk_size=options['chunk_size'])
+        if output == '-':
+            self._write(chunks, sys.stdout.buffer)
+            return
+        with open(output, 'wb') as f:
+            written = self._write(chunks, f)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {output}"))
+
+    def _write(self, chunks, f):
+        written = 0
+        for chunk in chunks:
+            f.write(chunk)
+            written += len(chunk)
+        return written
@@ -0,0 +1,44 @@
+"""
+Generate a batch of images from the command line.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from generator.pipeline import GenerationError, generate_batch_and_store
+
+
+class Command(BaseCommand):
+    help = "Generate several images with bounded concurrency: a list of prompts, or one prompt with N variations"
+
+    def add_arguments(self, parser):
+        parser.add_argument('prompts', nargs='*', help="Prompts to generate")
+        parser.add_argument('--file', help="Read prompts from a file, one per line")
+        parser.add_argument('--variations', type=int, help="Generate N variations of a single prompt")
+        parser.add_argument('--seeds', type=int, nargs='+', help="Explicit seeds for the variations of a single prompt")
+        parser.add_argument('--concurrency', type=int, help="Maximum number of generations in flight")
+        parser.add_argument('--no-cache', action='store_true', help="Skip cached results")
+
+    def handle(self, *args, **options):
+        prompts = list(options['prompts'])
+        if options['file']:
+            with open(options['file'], encoding='utf-8') as f:
+                prompts += [line.strip() for line in f if line.strip()]
+
+        kwargs = {'prompts': prompts}
+        if len(prompts) == 1 and (options['variations'] or options['seeds']):
+            kwargs = {'prompt': prompts[0], 'seeds': options['seeds'], 'variations': options['variations']}
+
+        try:
+            items = generate_batch_and_store(
+                concurrency=options['concurrency'],
+                use_cache=not options['no_cache'],
+                **kwargs,
+            )
+        except GenerationError as e:
+            raise CommandError(str(e))
+
+        for item in items:
+            seed = f" (seed {item.seed})" if item.seed is not None else ''
+            if item.image_id:
+                self.stdout.write(self.style.SUCCESS(f"#{item.image_id}{seed}: {item.prompt}"))
+            else:
+                self.stdout.write(self.style.ERROR(f"failed{seed}: {item.prompt}: {item.error}"))
@@ -0,0 +1,89 @@
+"""
+Import-time profile of a fresh worker, from ``python -X importtime``.
+"""
+import json
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+ENTRY_POINTS = {
+    'wsgi': 'main',
+    'asgi': 'image_generator_django.asgi',
+}
+
+# "import time:       self [us] |  cumulative | imported package", nested imports indented by two spaces
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$')
+
+
+def parse_importtime(output):
+    """Rows of (module, self µs, cumulative µs, depth) in the order the imports finished"""
+    rows = []
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        if match:
+            own, cumulative, indent, module = match.groups()
+            rows.append((module, int(own), int(cumulative), (len(indent) - 1) // 2))
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Import the WSGI or ASGI entry point and the URLconf in a fresh interpreter under "
+        "`python -X importtime` and report the slowest modules and packages"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entry', choices=ENTRY_POINTS, default='wsgi',
+                            help="wsgi (main:app, as gunicorn loads it) or asgi (the ASGI application)")
+        parser.add_argument('--limit', type=int, default=20, help="Modules and packages listed")
+        parser.add_argument('--sort', choices=('self', 'cumulative'), default='self',
+                            help="Rank modules by their own import time or including what they import")
+        parser.add_argument('--json', action='store_true', help="Print the whole profile as JSON")
+
+    def handle(self, *args, **options):
+        # What a worker does before its first response: load the application, then the URLconf
+        code = (
+            f"import {ENTRY_POINTS[options['entry']]}\n"
+            "from django.urls import get_resolver\n"
+            "get_resolver().url_patterns\n"
+        )
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        rows = parse_importtime(process.stderr)
+        if process.returncode or not rows:
+            raise CommandError(f"Importing {ENTRY_POINTS[options['entry']]} failed:\n{process.stderr[-2000:]}")
+
+        total = sum(cumulative for _, _, cumulative, depth in rows if depth == 0)
+        packages = defaultdict(int)
+        for module, own, _, _ in rows:
+            packages[module.partition('.')[0]] += own
+        column = 1 if options['sort'] == 'self' else 2
+        modules = sorted(rows, key=lambda row: row[column], reverse=True)[:options['limit']]
+        packages = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:options['limit']]
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'entry': options['entry'],
+                'total_ms': total / 1000,
+                'module_count': len(rows),
+                'modules': [
+                    {'module': module, 'self_ms': own / 1000, 'cumulative_ms': cumulative / 1000, 'depth': depth}
+                    for module, own, cumulative, depth in rows
+                ],
+            }, indent=2))
+            return
+
+        self.stdout.write(f"{len(rows)} modules imported in {total / 1000:.1f} ms")
+        self.stdout.write(f"\nSlowest modules ({options['sort']}):")
+        self.stdout.write(f"  {'self ms':>9}  {'cumul. ms':>9}  module")
+        for module, own, cumulative, _ in modules:
+            self.stdout.write(f"  {own / 1000:9.1f}  {cumulative / 1000:9.1f}  {module}")
+        self.stdout.write("\nSlowest packages (self time of their modules):")
+        for package, own in packages:
+            self.stdout.write(f"  {own / 1000:9.1f}  {package}")
@@ -0,0 +1,40 @@
+"""
+Rebuild the prompt search indexes (full-text and similar prompts).
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Exists, OuterRef
+
+from generator.models import GeneratedImage, PromptBand
+from generator.search import FTS_TABLE, fts5_available, index_images
+
+
+class Command(BaseCommand):
+    help = "Recompute the similar-prompt bands of every image (or of those missing them) and rebuild the FTS5 table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true', help="Only index images that have no bands yet")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Images indexed per transaction")
+
+    def handle(self, *args, **options):
+        if fts5_available():
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+            self.stdout.write("Rebuilt the full-text index")
+
+        images = GeneratedImage.objects.only('id', 'prompt').order_by('id')
+        if options['missing']:
+            images = images.filter(~Exists(PromptBand.objects.filter(image=OuterRef('pk'))))
+        chunk_size = max(1, options['chunk_size'])
+        last_id = 0
+        indexed = 0
+        # Walk the table by primary key so every chunk is an index range scan
+        while True:
+            chunk = list(images.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            index_images(chunk)
+            indexed += len(chunk)
+            last_id = chunk[-1].id
+            self.stdout.write(f"Indexed {indexed} images", ending='\r')
+        self.stdout.write(self.style.SUCCESS(f"Indexed the prompts of {indexed} images"))
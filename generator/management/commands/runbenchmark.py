@@ -0,0 +1,207 @@
+"""
+End-to-end benchmark: app server (gunicorn or uvicorn) + generation worker against the inference stub.
+"""
+import itertools
+import json
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from generator.benchmark import (
+    SERVERS, BenchmarkEnvironment, compare_results, run_metadata, run_scenario, wait_for_jobs,
+)
+
+SCENARIOS = ('generate', 'batch', 'gallery', 'download', 'coldstart')
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark generate/, api/batch/, gallery/ and download/<id>/ under gunicorn or uvicorn with a local "
+        "inference stub and save throughput, latency percentiles, peak RSS, DB query counts and the time to "
+        "first response of fresh workers as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help=f"Comma-separated scenarios to run, among {', '.join(SCENARIOS)}")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario")
+        parser.add_argument('--concurrency', type=int, default=8, help="Concurrent clients")
+        parser.add_argument('--distinct-prompts', type=int, default=0,
+                            help="Cycle through this many prompts in generate (0: every prompt is unique)")
+        parser.add_argument('--server', choices=SERVERS, default='gunicorn',
+                            help="gunicorn (main:app over WSGI) or uvicorn (the ASGI application)")
+        parser.add_argument('--workers', type=int, default=2, help="Server worker processes")
+        parser.add_argument('--worker-class', default='sync', help="gunicorn worker class")
+        parser.add_argument('--threads', type=int, default=1, help="Threads per gunicorn worker")
+        parser.add_argument('--job-concurrency', type=int, default=4, help="Generation worker concurrency")
+        parser.add_argument('--cold-start-runs', type=int, default=5,
+                            help="Servers started by the coldstart scenario")
+        parser.add_argument('--job-timeout', type=float, default=300.0,
+                            help="Seconds to wait for queued jobs to finish")
+        parser.add_argument('--stub-latency', type=float, default=0.2, help="Stub response latency, in seconds")
+        parser.add_argument('--stub-jitter', type=float, default=0.0)
+        parser.add_argument('--loading-rate', type=float, default=0.0, help="Fraction of stub 503 answers")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of stub 500 answers")
+        parser.add_argument('--image-size', type=int, default=512, help="Side of the stub PNG images")
+        parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                            help="Extra setting for the server and worker processes (repeatable)")
+        parser.add_argument('--output', help="Results file (default: benchmarks/results/<timestamp>.json)")
+        parser.add_argument('--compare', help="Earlier results file to compare this run with")
+        parser.add_argument('--keep-workdir', action='store_true',
+                            help="Keep the temporary database and blob store")
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        extra_env = dict(self._parse_env(item) for item in options['env'])
+        stub_options = {
+            'latency': options['stub_latency'],
+            'jitter': options['stub_jitter'],
+            'loading_rate': options['loading_rate'],
+            'error_rate': options['error_rate'],
+            'estimated_time': 1.0,
+            'image_size': options['image_size'],
+        }
+        config = {
+            key: options[key] for key in (
+                'requests', 'concurrency', 'distinct_prompts', 'server', 'workers', 'worker_class', 'threads',
+                'job_concurrency',
+            )
+        }
+        config.update(scenarios=scenarios, stub=stub_options, env=extra_env)
+
+        results = {'meta': run_metadata(config), 'scenarios': {}}
+        with BenchmarkEnvironment(
+            server=options['server'], workers=options['workers'], worker_class=options['worker_class'],
+            threads=options['threads'], job_concurrency=options['job_concurrency'], stub_options=stub_options, extra_env=extra_env,
+            keep_workdir=options['keep_workdir'],
+        ) as env:
+            self.stdout.write(f"Benchmarking {env.base_url} (stub at {env.stub.url}, workdir {env.workdir})")
+            image_ids = self._run(env, scenarios, options, results['scenarios'])
+            results['processes'] = env.process_stats()
+            results['images_generated'] = len(image_ids)
+
+        self._report(results)
+        output = self._save(results, options['output'])
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+        if options['compare']:
+            self._compare(options['compare'], results)
+
+    def _run(self, env, scenarios, options, summaries):
+        total, concurrency = options['requests'], options['concurrency']
+        image_ids = []
+
+        # Generation also seeds the gallery and the downloads
+        if 'generate' in scenarios or 'download' in scenarios:
+            distinct = options['distinct_prompts']
+            jobs = []
+
+            def generate(client, index):
+                prompt = f"benchmark prompt {index % distinct if distinct else index}"
+                response = client.request(
+                    'POST', '/generate/', data={'prompt': prompt}, headers={'Accept': 'application/json'},
+                )
+                if response.status_code == 202:
+                    jobs.append((response.json()['status_url'], time.perf_counter()))
+                return response
+
+            n = total if 'generate' in scenarios else max(concurrency, 20)
+            stats = run_scenario('generate', env.base_url, generate, n, concurrency,
+                                 is_ok=lambda response: response.status_code == 202)
+            e2e, image_ids = wait_for_jobs(env.base_url, jobs, timeout=options['job_timeout'])
+            if 'generate' in scenarios:
+                summaries['generate'] = stats.summary()
+                summaries['generate_e2e'] = e2e.summary()
+
+        if 'batch' in scenarios:
+            batch_jobs = []
+
+            def batch(client, index):
+                response = client.request(
+                    'POST', '/api/batch/', json={'prompt': f"benchmark batch prompt {index}", 'variations': 4},
+                    headers={'Accept': 'application/json'},
+                )
+                if response.status_code == 202:
+                    queued_at = time.perf_counter()
+                    batch_jobs.extend((job['status_url'], queued_at) for job in response.json()['jobs'])
+                return response
+
+            summaries['batch'] = run_scenario(
+                'batch', env.base_url, batch, total, concurrency,
+                is_ok=lambda response: response.status_code == 202,
+            ).summary()
+            batch_e2e, _ = wait_for_jobs(env.base_url, batch_jobs, timeout=options['job_timeout'])
+            summaries['batch_e2e'] = batch_e2e.summary()
+
+        if 'gallery' in scenarios:
+            summaries['gallery'] = run_scenario(
+                'gallery', env.base_url, lambda client, index: client.request('GET', '/gallery/'),
+                total, concurrency,
+            ).summary()
+
+        if 'download' in scenarios:
+            if not image_ids:
+                raise CommandError("No image was generated, cannot benchmark downloads")
+            ids = itertools.cycle(image_ids)
+            summaries['download'] = run_scenario(
+                'download', env.base_url, lambda client, index: client.request('GET', f'/download/{next(ids)}/'),
+                total, concurrency,
+            ).summary()
+
+        if 'coldstart' in scenarios:
+            starts, restarts = env.cold_start(options['cold_start_runs'])
+            summaries['cold_start'] = starts.summary()
+            if restarts.latencies:
+                summaries['worker_restart'] = restarts.summary()
+        return image_ids
+
+    def _parse_env(self, item):
+        name, sep, value = item.partition('=')
+        if not sep or not name:
+            raise CommandError(f"--env expects NAME=VALUE, got {item!r}")
+        return name, value
+
+    def _report(self, results):
+        self.stdout.write(f"{'scenario':<14}{'reqs':>6}{'errs':>6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}"
+                          f"{'p99 ms':>9}{'queries':>9}")
+        for name, summary in results['scenarios'].items():
+            latency = summary['latency_ms']
+            self.stdout.write(
+                f"{name:<14}{summary['requests']:>6}{summary['errors']:>6}"
+                f"{_fmt(summary['throughput_rps']):>9}{_fmt(latency['p50']):>9}{_fmt(latency['p95']):>9}"
+                f"{_fmt(latency['p99']):>9}{_fmt(summary['db_queries']['mean']):>9}"
+            )
+        processes = results['processes']
+        self.stdout.write(
+            f"Peak RSS (MiB): {results['meta']['config']['server']} workers {processes['server_workers_peak_rss_mb']}, "
+            f"generation worker {processes['generation_worker_peak_rss_mb']}; "
+            f"stub requests: {processes['stub_requests']}"
+        )
+
+    def _save(self, results, output):
+        if output:
+            path = Path(output)
+        else:
+            stamp = results['meta']['timestamp'].replace(':', '').replace('-', '').replace('+0000', 'Z')
+            path = Path(settings.BASE_DIR) / 'benchmarks' / 'results' / f'{stamp}.json'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(results, indent=2))
+        return path
+
+    def _compare(self, baseline_path, results):
+        try:
+            baseline = json.loads(Path(baseline_path).read_text())
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read {baseline_path}: {e}")
+        self.stdout.write(f"Compared with {baseline_path} ({baseline.get('meta', {}).get('git_commit')}):")
+        for scenario, metric, before, after, change, regressed in compare_results(baseline, results):
+            line = f"  {scenario:<16}{metric:<18}{before:>10} -> {after:<10}{change:+.1f}%"
+            self.stdout.write(self.style.ERROR(line + '  REGRESSION') if regressed else line)
+
+
+def _fmt(value):
+    return '-' if value is None else f"{value:.1f}"
@@ -0,0 +1,86 @@
+"""
+Background worker that drains the generation job queue.
+"""
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from generator.jobs import claim_next_job, queue_has_jobs, requeue_stale_jobs, run_job
+from generator.metrics import REGISTRY
+
+
+class Command(BaseCommand):
+    help = "Run queued image generation jobs with a bounded number of concurrent generations"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.GENERATION_WORKER_CONCURRENCY,
+            help="Number of jobs to run at the same time",
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.GENERATION_WORKER_POLL_INTERVAL,
+            help="Seconds to wait before polling an empty queue again",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Exit once the queue is empty instead of waiting for new jobs",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        poll_interval = options['poll_interval']
+        worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        stopping = threading.Event()
+        slots = threading.Semaphore(concurrency)
+
+        def stop(signum, frame):
+            self.stdout.write("Stopping after running jobs finish...")
+            stopping.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        def requeue():
+            requeued = requeue_stale_jobs(settings.GENERATION_JOB_TIMEOUT)
+            if requeued:
+                self.stdout.write(f"Requeued {requeued} stale job(s)")
+            return time.monotonic() + settings.GENERATION_REQUEUE_INTERVAL
+
+        # Also catches the jobs of workers that die while this one runs
+        next_requeue = requeue()
+        self.stdout.write(f"Generation worker {worker_name} started with concurrency {concurrency}")
+
+        def work(job):
+            try:
+                run_job(job)
+                self.stdout.write(f"Job {job.id} {job.status}")
+            finally:
+                # Each pool thread holds its own DB connection
+                connection.close()
+                slots.release()
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='generation') as pool:
+            while not stopping.is_set():
+                if time.monotonic() >= next_requeue:
+                    close_old_connections()
+                    next_requeue = requeue()
+                if not slots.acquire(timeout=poll_interval):
+                    continue
+                close_old_connections()
+                job = claim_next_job(worker_name)
+                if job is None:
+                    slots.release()
+                    if options['once'] and not queue_has_jobs():
+                        break
+                    # Keeps the metrics snapshot of an idle worker fresh (see generator.metrics)
+                    REGISTRY.maybe_flush()
+                    stopping.wait(poll_interval)
+                    continue
+                pool.submit(work, job)
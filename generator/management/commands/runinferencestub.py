@@ -0,0 +1,38 @@
+"""
+Run the local stub of the Hugging Face inference endpoint.
+"""
+from django.core.management.base import BaseCommand
+
+from generator.stub_server import StubInferenceServer
+
+
+class Command(BaseCommand):
+    help = "Serve a local stand-in for the Hugging Face inference API (set HUGGINGFACE_API_URL to its URL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.5, help="Seconds before each response")
+        parser.add_argument('--jitter', type=float, default=0.0, help="Extra random latency, in seconds")
+        parser.add_argument('--loading-rate', type=float, default=0.0, help="Fraction of 503 model-loading answers")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of 500 answers")
+        parser.add_argument('--estimated-time', type=float, default=1.0, help="estimated_time sent with 503s")
+        parser.add_argument('--image-size', type=int, default=64)
+
+    def handle(self, *args, **options):
+        server = StubInferenceServer(
+            (options['host'], options['port']),
+            latency=options['latency'],
+            jitter=options['jitter'],
+            loading_rate=options['loading_rate'],
+            error_rate=options['error_rate'],
+            estimated_time=options['estimated_time'],
+            image_size=options['image_size'],
+        )
+        self.stdout.write(f"Stub inference endpoint listening on {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
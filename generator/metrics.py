@@ -0,0 +1,307 @@
+"""
+In-process metrics and timing spans, exported in the Prometheus text format.
+
+Counters and histograms live in a per-process registry. Generations run in
+the worker process while /metrics is served by the web workers, so every
+process also writes its values to ``<METRICS_DIR>/<host>-<pid>.json`` (at
+most every METRICS_FLUSH_INTERVAL seconds) and the endpoint sums the files of
+all processes. With METRICS_DIR empty only the serving process is seen.
+
+A process's values are reported while it runs: it removes its file at exit,
+and collect() drops the files of processes of this host that are gone (killed
+workers) and files not rewritten for METRICS_SNAPSHOT_MAX_AGE seconds
+(processes of other hosts or containers sharing the directory).
+"""
+import atexit
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _setting(name, default):
+    try:
+        from django.conf import settings
+        if settings.configured:
+            return getattr(settings, name, default)
+    except ImportError:
+        pass
+    return default
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.samples = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def describe(self):
+        return {'type': self.kind, 'help': self.documentation, 'labelnames': list(self.labelnames)}
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+        self.registry.maybe_flush()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            counts, total, count = self.samples.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.samples[key] = (counts, total + value, count + 1)
+        self.registry.maybe_flush()
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def describe(self):
+        return dict(super().describe(), buckets=list(self.buckets))
+
+
+class Registry:
+    """Metrics of this process, flushed periodically to a shared directory"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self._last_flush = 0.0
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(self, name, documentation, labelnames, **kwargs)
+            return metric
+
+    def snapshot(self):
+        """Plain-data copy of every metric: {name: {type, help, labelnames, [buckets], samples}}"""
+        with self.lock:
+            return {
+                name: dict(metric.describe(), samples=[
+                    [list(key), value] for key, value in metric.samples.items()
+                ])
+                for name, metric in self.metrics.items()
+            }
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= _setting('METRICS_FLUSH_INTERVAL', 5.0):
+            self.flush()
+
+    def flush(self):
+        """Write this process's snapshot to METRICS_DIR (no-op when unset)"""
+        self._last_flush = time.monotonic()
+        directory = _setting('METRICS_DIR', '')
+        if not directory:
+            return
+        try:
+            directory = Path(directory)
+            directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+            with os.fdopen(fd, 'w') as tmp:
+                json.dump(self.snapshot(), tmp)
+            os.replace(tmp_path, directory / _snapshot_name(os.getpid()))
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {directory}: {e}")
+
+    def discard(self):
+        """Remove this process's snapshot (at exit)"""
+        directory = _setting('METRICS_DIR', '')
+        if directory:
+            try:
+                (Path(directory) / _snapshot_name(os.getpid())).unlink(missing_ok=True)
+            except OSError:
+                pass
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.discard)
+
+
+def _snapshot_name(pid):
+    # The host name keeps apart the processes of containers sharing METRICS_DIR
+    return f'{socket.gethostname()}-{pid}.json'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Running as another user
+    return True
+
+
+def _stale(path, now):
+    """True for the snapshot of a process that is gone"""
+    host, _, pid = path.stem.rpartition('-')
+    if host == socket.gethostname() and pid.isdigit() and not _pid_alive(int(pid)):
+        return True
+    return now - path.stat().st_mtime > _setting('METRICS_SNAPSHOT_MAX_AGE', 3600)
+
+
+def collect():
+    """Return the merged snapshot of every live process (this one included)"""
+    REGISTRY.flush()
+    snapshots = []
+    directory = _setting('METRICS_DIR', '')
+    if directory and Path(directory).is_dir():
+        now = time.time()
+        for path in Path(directory).glob('*.json'):
+            try:
+                if _stale(path, now):
+                    path.unlink(missing_ok=True)
+                    continue
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue  # Being replaced or truncated: skipped for this scrape
+    else:
+        snapshots.append(REGISTRY.snapshot())
+    return merge(snapshots)
+
+
+def merge(snapshots):
+    """Sum counters and histograms of several snapshots"""
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, dict(metric, samples={}))
+            for key, value in metric['samples']:
+                key = tuple(key)
+                current = target['samples'].get(key)
+                if metric['type'] == 'histogram':
+                    counts, total, count = value
+                    if current is not None:
+                        counts = [a + b for a, b in zip(current[0], counts)]
+                        total, count = total + current[1], count + current[2]
+                    target['samples'][key] = (counts, total, count)
+                else:
+                    target['samples'][key] = value + (current or 0)
+    return merged
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def render(snapshot):
+    """Format a snapshot in the Prometheus text exposition format"""
+    lines = []
+    for name in sorted(snapshot):
+        metric = snapshot[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        names = metric['labelnames']
+        for key, value in sorted(metric['samples'].items()):
+            if metric['type'] == 'histogram':
+                counts, total, count = value
+                for bound, bucket_count in zip(metric['buckets'], counts):
+                    lines.append(f"{name}_bucket{_labels(names, key, [('le', bound)])} {bucket_count}")
+                lines.append(f"{name}_bucket{_labels(names, key, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{_labels(names, key)} {total}")
+                lines.append(f"{name}_count{_labels(names, key)} {count}")
+            else:
+                lines.append(f"{name}{_labels(names, key)} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def render_gauge(name, documentation, samples, labelnames=()):
+    """Format a gauge computed at scrape time from (label values, value) pairs"""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    lines += [f"{name}{_labels(labelnames, key)} {value}" for key, value in samples]
+    return '\n'.join(lines) + '\n'
+
+
+# Metrics of the generation hot path
+STAGE_SECONDS = REGISTRY.histogram(
+    'generation_stage_seconds', 'Time spent in each stage of a generation', ['stage'],
+)
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    'generation_upstream_requests_total', 'Calls to the inference backend by HTTP status', ['backend', 'status'],
+)
+RETRIES = REGISTRY.counter(
+    'generation_retries_total', 'Retried inference calls by the status that caused the retry', ['backend', 'status'],
+)
+FAILURES = REGISTRY.counter(
+    'generation_failures_total', 'Generations that returned no image', ['backend', 'reason'],
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    'generation_cache_requests_total', 'Generation cache lookups', ['result'],
+)
+JOBS = REGISTRY.counter(
+    'generation_jobs_total', 'Generation jobs finished by the worker', ['status'],
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Django request handling time', ['view', 'method', 'status'],
+)
+
+
+@contextmanager
+def span(stage, **fields):
+    """
+    Time one stage of a generation.
+
+    The duration goes to generation_stage_seconds{stage=...} and to a debug
+    log record carrying the stage, the duration and any extra fields.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        logger.debug(
+            f"span {stage} {elapsed * 1000:.1f}ms",
+            extra={'span': stage, 'duration_ms': round(elapsed * 1000, 2), **fields},
+        )
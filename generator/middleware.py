@@ -0,0 +1,157 @@
+"""
+Request instrumentation middleware.
+"""
+import cProfile
+import io
+import pstats
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from .metrics import HTTP_REQUEST_SECONDS
+
+# Accepted ?profile_sort= values: the pstats.SortKey values and their aliases (tottime, cumtime...)
+PROFILE_SORT_KEYS = frozenset(pstats.Stats.sort_arg_dict_default)
+
+# Counter of the request being handled: copied into the threads running its
+# queries (sync_to_async), unlike per-connection wrappers
+_query_counter = ContextVar('query_counter', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter.count += 1
+    return execute(sql, params, many, context)
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+
+class _HybridMiddleware:
+    """Middleware running natively in sync (WSGI) and async (ASGI) stacks"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.handle(request)
+
+    async def __acall__(self, request):
+        return await self.ahandle(request)
+
+
+class QueryCountMiddleware(_HybridMiddleware):
+    """Count the database queries run while handling a request and report them in X-DB-Query-Count"""
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        connection_created.connect(_install_query_counter, dispatch_uid='query_count_middleware')
+        for connection in connections.all(initialized_only=True):
+            _install_query_counter(None, connection)
+
+    def handle(self, request):
+        counter = _QueryCounter()
+        token = _query_counter.set(counter)
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_counter.reset(token)
+        response['X-DB-Query-Count'] = str(counter.count)
+        return response
+
+    async def ahandle(self, request):
+        counter = _QueryCounter()
+        token = _query_counter.set(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_counter.reset(token)
+        response['X-DB-Query-Count'] = str(counter.count)
+        return response
+
+
+class MetricsMiddleware(_HybridMiddleware):
+    """Record the handling time of every request in http_request_duration_seconds"""
+
+    def handle(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, response, start)
+        return response
+
+    async def ahandle(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, start)
+        return response
+
+    def _observe(self, request, response, start):
+        match = getattr(request, 'resolver_match', None)
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            view=(match.url_name if match else None) or 'unmatched',
+            method=request.method,
+            status=response.status_code,
+        )
+
+
+class ProfilingMiddleware:
+    """
+    Profile a single request on demand.
+
+    When PROFILING_ENABLED is on, a request sent with an ``X-Profile`` header
+    equal to PROFILING_TOKEN is run under cProfile and the response is
+    replaced by the statistics of the top functions, by cumulative time or
+    by the ``profile_sort`` query parameter. Nothing is profiled while
+    PROFILING_TOKEN is empty.
+
+    Synchronous only: under ASGI, Django then runs the views in a thread
+    while it is installed, which is fine for a debugging aid.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        requested = request.headers.get('X-Profile')
+        token = settings.PROFILING_TOKEN
+        if not requested or not token or not constant_time_compare(requested, token):
+            return self.get_response(request)
+        sort = request.GET.get('profile_sort', pstats.SortKey.CUMULATIVE.value)
+        if sort not in PROFILE_SORT_KEYS:
+            return HttpResponse(
+                f"Unknown profile_sort {sort!r}, use one of: {', '.join(sorted(PROFILE_SORT_KEYS))}\n",
+                status=400, content_type='text/plain; charset=utf-8',
+            )
+
+        profiler = cProfile.Profile()
+        response = profiler.runcall(self.get_response, request)
+        if getattr(response, 'streaming', False):
+            # Drain the body so the time spent producing it is profiled too
+            profiler.runcall(lambda: [None for _ in response.streaming_content])
+
+        output = io.StringIO()
+        output.write(f"{request.method} {request.get_full_path()} -> {response.status_code}\n\n")
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats(sort).print_stats(40)
+        return HttpResponse(output.getvalue(), content_type='text/plain; charset=utf-8')
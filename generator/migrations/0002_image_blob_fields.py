@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedimage',
+            name='blob_key',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 key of the image bytes in the blob store', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='generatedimage',
+            name='byte_size',
+            field=models.PositiveIntegerField(blank=True, help_text='Size of the stored image in bytes', null=True),
+        ),
+        migrations.AddField(
+            model_name='generatedimage',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='generatedimage',
+            name='mime_type',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='generatedimage',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='generatedimage',
+            name='image_url',
+            field=models.URLField(blank=True, help_text='Remote URL of legacy images not held in the blob store', max_length=500),
+        ),
+    ]
@@ -0,0 +1,100 @@
+import base64
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.db import migrations
+
+# The blob store layout as of this migration (generator.storage may change later):
+# IMAGE_STORE_ROOT/<key[:2]>/<key[2:4]>/<key>, key = SHA-256 of the content
+
+
+def _blob_path(key):
+    return Path(settings.IMAGE_STORE_ROOT) / key[:2] / key[2:4] / key
+
+
+def _write_blob(data):
+    key = hashlib.sha256(data).hexdigest()
+    path = _blob_path(key)
+    if path.exists():
+        return key
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return key
+
+
+def _describe(data, mime_type):
+    """Return (mime_type, width, height) read by Pillow from the image header"""
+    from PIL import Image
+
+    try:
+        with Image.open(BytesIO(data)) as image:
+            return Image.MIME.get(image.format, mime_type), image.width, image.height
+    except Exception:
+        return mime_type, None, None
+
+
+def move_data_urls_to_store(apps, schema_editor):
+    """Write inline data-URL images to the blob store and keep only their key"""
+    GeneratedImage = apps.get_model('generator', 'GeneratedImage')
+    rows = (
+        GeneratedImage.objects
+        .filter(image_url__startswith='data:')
+        .only('id', 'image_url')
+    )
+    for image in rows.iterator(chunk_size=50):
+        header, encoded = image.image_url.split(',', 1)
+        data = base64.b64decode(encoded)
+        mime_type, width, height = _describe(
+            data, header[len('data:'):].split(';', 1)[0] or 'application/octet-stream',
+        )
+        GeneratedImage.objects.filter(pk=image.pk).update(
+            image_url='',
+            blob_key=_write_blob(data),
+            byte_size=len(data),
+            mime_type=mime_type,
+            width=width,
+            height=height,
+        )
+
+
+def restore_data_urls(apps, schema_editor):
+    """Inline blob-store images back into image_url as data URLs"""
+    GeneratedImage = apps.get_model('generator', 'GeneratedImage')
+    rows = (
+        GeneratedImage.objects
+        .exclude(blob_key='')
+        .only('id', 'blob_key', 'mime_type')
+    )
+    for image in rows.iterator(chunk_size=50):
+        encoded = base64.b64encode(_blob_path(image.blob_key).read_bytes()).decode()
+        GeneratedImage.objects.filter(pk=image.pk).update(
+            image_url=f"data:{image.mime_type or 'image/png'};base64,{encoded}",
+            blob_key='',
+            byte_size=None,
+            width=None,
+            height=None,
+            mime_type='',
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0002_image_blob_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_data_urls_to_store, restore_data_urls),
+    ]
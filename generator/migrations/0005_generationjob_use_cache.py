@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0004_generationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='use_cache',
+            field=models.BooleanField(default=True, help_text='Serve identical earlier results from the generation cache'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0005_generationjob_use_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationLease',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('owner', models.CharField(help_text='Token of the lease holder', max_length=64)),
+                ('error', models.TextField(blank=True)),
+                ('acquired_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('image', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='generator.generatedimage')),
+            ],
+            options={
+                'verbose_name': 'Generation Lease',
+                'verbose_name_plural': 'Generation Leases',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0006_generationlease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='loading_eta',
+            field=models.DateTimeField(blank=True, help_text='When the model should be loaded, while the job waits on a cold start', null=True),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:54
+
+import django.db.models.deletion
+from django.db import OperationalError, migrations, models
+
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE generator_image_fts USING fts5("
+    "prompt, content='generator_generatedimage', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER generator_image_fts_insert AFTER INSERT ON generator_generatedimage BEGIN "
+    "INSERT INTO generator_image_fts(rowid, prompt) VALUES (new.id, new.prompt); END",
+    "CREATE TRIGGER generator_image_fts_delete AFTER DELETE ON generator_generatedimage BEGIN "
+    "INSERT INTO generator_image_fts(generator_image_fts, rowid, prompt) VALUES ('delete', old.id, old.prompt); END",
+    "CREATE TRIGGER generator_image_fts_update AFTER UPDATE OF prompt ON generator_generatedimage BEGIN "
+    "INSERT INTO generator_image_fts(generator_image_fts, rowid, prompt) VALUES ('delete', old.id, old.prompt); "
+    "INSERT INTO generator_image_fts(rowid, prompt) VALUES (new.id, new.prompt); END",
+    # Index the rows that already exist
+    "INSERT INTO generator_image_fts(generator_image_fts) VALUES ('rebuild')",
+]
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS generator_image_fts_insert",
+    "DROP TRIGGER IF EXISTS generator_image_fts_delete",
+    "DROP TRIGGER IF EXISTS generator_image_fts_update",
+    "DROP TABLE IF EXISTS generator_image_fts",
+]
+POSTGRES_FTS = [
+    "CREATE INDEX IF NOT EXISTS generator_image_prompt_fts "
+    "ON generator_generatedimage USING GIN (to_tsvector('english', prompt))",
+]
+POSTGRES_FTS_DROP = ["DROP INDEX IF EXISTS generator_image_prompt_fts"]
+
+
+def _execute(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_fulltext_index(apps, schema_editor):
+    """Create the prompt full-text index of the database backend (see generator.search)"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _execute(schema_editor, POSTGRES_FTS)
+    elif vendor == 'sqlite':
+        try:
+            _execute(schema_editor, SQLITE_FTS)
+        except OperationalError:
+            # SQLite built without FTS5: search falls back to LIKE
+            _execute(schema_editor, SQLITE_FTS_DROP)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _execute(schema_editor, POSTGRES_FTS_DROP)
+    elif vendor == 'sqlite':
+        _execute(schema_editor, SQLITE_FTS_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0007_generationjob_loading_eta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromptBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='generator.generatedimage')),
+            ],
+            options={
+                'verbose_name': 'Prompt Band',
+                'verbose_name_plural': 'Prompt Bands',
+                'indexes': [models.Index(fields=['band', 'bucket'], name='generator_prompt_band_idx')],
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
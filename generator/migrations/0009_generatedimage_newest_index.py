@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0008_promptband_fulltext_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='generatedimage',
+            index=models.Index(fields=['-created_at', '-id'], name='generator_image_newest_idx'),
+        ),
+    ]
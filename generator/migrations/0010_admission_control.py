@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0009_generatedimage_newest_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('key', models.CharField(max_length=150, primary_key=True, serialize=False)),
+                ('tokens', models.FloatField()),
+                ('updated_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Rate Limit Bucket',
+                'verbose_name_plural': 'Rate Limit Buckets',
+            },
+        ),
+        migrations.AddField(
+            model_name='generationjob',
+            name='tenant',
+            field=models.CharField(blank=True, help_text='User, session or client address that queued the job', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='generationjob',
+            name='weight',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Share of the worker slots given to the tenant'),
+        ),
+        migrations.AddIndex(
+            model_name='generationjob',
+            index=models.Index(fields=['status', 'tenant', 'created_at'], name='generator_job_tenant_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0010_admission_control'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedimage',
+            name='blurhash',
+            field=models.CharField(blank=True, help_text='BlurHash placeholder of the image', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='generatedimage',
+            name='lqip',
+            field=models.TextField(blank=True, help_text='Tiny inline WebP shown while the image loads (data URL)'),
+        ),
+        migrations.AddField(
+            model_name='generatedimage',
+            name='renditions_at',
+            field=models.DateTimeField(blank=True, help_text='When the thumbnails and placeholders were rendered', null=True),
+        ),
+    ]
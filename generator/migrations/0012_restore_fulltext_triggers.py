@@ -0,0 +1,37 @@
+from django.db import migrations
+
+# 0011 rebuilt generator_generatedimage on SQLite (columns with defaults cannot be
+# added in place), which dropped the triggers keeping the FTS5 table in sync
+SQLITE_FTS_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS generator_image_fts_insert AFTER INSERT ON generator_generatedimage BEGIN "
+    "INSERT INTO generator_image_fts(rowid, prompt) VALUES (new.id, new.prompt); END",
+    "CREATE TRIGGER IF NOT EXISTS generator_image_fts_delete AFTER DELETE ON generator_generatedimage BEGIN "
+    "INSERT INTO generator_image_fts(generator_image_fts, rowid, prompt) VALUES ('delete', old.id, old.prompt); END",
+    "CREATE TRIGGER IF NOT EXISTS generator_image_fts_update AFTER UPDATE OF prompt ON generator_generatedimage BEGIN "
+    "INSERT INTO generator_image_fts(generator_image_fts, rowid, prompt) VALUES ('delete', old.id, old.prompt); "
+    "INSERT INTO generator_image_fts(rowid, prompt) VALUES (new.id, new.prompt); END",
+    # Index the rows inserted while the triggers were missing
+    "INSERT INTO generator_image_fts(generator_image_fts) VALUES ('rebuild')",
+]
+
+
+def restore_fulltext_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'generator_image_fts'")
+        if cursor.fetchone() is None:
+            return  # SQLite built without FTS5
+    for statement in SQLITE_FTS_TRIGGERS:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0011_image_renditions'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_fulltext_triggers, migrations.RunPython.noop),
+    ]
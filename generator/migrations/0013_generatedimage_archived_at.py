@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0012_restore_fulltext_triggers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedimage',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, help_text='When the image was moved to the archive tier', null=True),
+        ),
+    ]
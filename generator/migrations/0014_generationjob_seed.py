@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 09:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('generator', '0013_generatedimage_archived_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='seed',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Seed of a batch variation (random when empty)', null=True),
+        ),
+    ]
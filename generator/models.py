@@ -1,15 +1,42 @@
+import uuid
+
 from django.db import models
+from django.urls import reverse
 from django.utils import timezone
 
 
+class GeneratedImageQuerySet(models.QuerySet):
+    # Columns read by the gallery and the other image lists
+    LISTING_FIELDS = ('id', 'prompt', 'image_url', 'blob_key', 'width', 'height', 'lqip', 'created_at')
+
+    def for_listing(self):
+        """Load only the columns needed to render an image card"""
+        return self.only(*self.LISTING_FIELDS)
+
+
 class GeneratedImage(models.Model):
     """Model for storing AI-generated images"""
     prompt = models.TextField(help_text="Text description used to generate the image")
-    image_url = models.URLField(max_length=500, help_text="URL of the generated image")
+    image_url = models.URLField(max_length=500, blank=True, help_text="Remote URL of legacy images not held in the blob store")
+    blob_key = models.CharField(max_length=64, blank=True, db_index=True, help_text="SHA-256 key of the image bytes in the blob store")
+    byte_size = models.PositiveIntegerField(null=True, blank=True, help_text="Size of the stored image in bytes")
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    mime_type = models.CharField(max_length=50, blank=True)
     created_at = models.DateTimeField(default=timezone.now, help_text="When the image was generated")
+    blurhash = models.CharField(max_length=64, blank=True, help_text="BlurHash placeholder of the image")
+    lqip = models.TextField(blank=True, help_text="Tiny inline WebP shown while the image loads (data URL)")
+    renditions_at = models.DateTimeField(null=True, blank=True, help_text="When the thumbnails and placeholders were rendered")
+    archived_at = models.DateTimeField(null=True, blank=True, help_text="When the image was moved to the archive tier")
+
+    objects = GeneratedImageQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']  # Show newest images first
+        indexes = [
+            # Newest-first listings and their keyset pagination on (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='generator_image_newest_idx'),
+        ]
         verbose_name = "Generated Image"
         verbose_name_plural = "Generated Images"
     
@@ -20,3 +47,140 @@ class GeneratedImage(models.Model):
     def short_prompt(self):
         """Return a shortened version of the prompt for display"""
         return self.prompt[:100] + ('...' if len(self.prompt) > 100 else '')
+
+    @property
+    def src_url(self):
+        """Return the URL the full-size image is served from"""
+        if self.blob_key:
+            return reverse('image_file', args=[self.id])
+        return self.image_url
+
+    @property
+    def thumbnail_url(self):
+        """Return the URL of the gallery thumbnail"""
+        if self.blob_key:
+            return reverse('image_thumbnail', args=[self.id])
+        return self.image_url
+
+    @property
+    def thumbnail_srcset(self):
+        """Return the srcset of the thumbnail sizes, letting the browser pick one for its layout"""
+        from .renditions import THUMBNAIL_SIZES
+
+        if not self.blob_key:
+            return ''
+        url = reverse('image_thumbnail', args=[self.id])
+        return ', '.join(f"{url}?size={size} {size}w" for size in THUMBNAIL_SIZES)
+
+    @property
+    def display_url(self):
+        """Return the URL of the web-optimized full view (WebP/AVIF instead of the original PNG)"""
+        from .renditions import DISPLAY_SIZE
+
+        if self.blob_key:
+            return f"{reverse('image_thumbnail', args=[self.id])}?size={DISPLAY_SIZE}"
+        return self.image_url
+
+
+class GenerationJob(models.Model):
+    """Queued image generation request, processed by the generation worker"""
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        RUNNING = 'running', 'Running'
+        SUCCEEDED = 'succeeded', 'Succeeded'
+        FAILED = 'failed', 'Failed'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    prompt = models.TextField(help_text="Text description used to generate the image")
+    negative_prompt = models.TextField(blank=True)
+    use_cache = models.BooleanField(default=True, help_text="Serve identical earlier results from the generation cache")
+    seed = models.PositiveBigIntegerField(null=True, blank=True, help_text="Seed of a batch variation (random when empty)")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    image = models.ForeignKey(GeneratedImage, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True, help_text="Worker that claimed the job")
+    tenant = models.CharField(max_length=100, blank=True, help_text="User, session or client address that queued the job")
+    weight = models.PositiveSmallIntegerField(default=1, help_text="Share of the worker slots given to the tenant")
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    loading_eta = models.DateTimeField(
+        null=True, blank=True, help_text="When the model should be loaded, while the job waits on a cold start",
+    )
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='generator_job_queue_idx'),
+            models.Index(fields=['status', 'tenant', 'created_at'], name='generator_job_tenant_idx'),
+        ]
+        verbose_name = "Generation Job"
+        verbose_name_plural = "Generation Jobs"
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status}): {self.prompt[:50]}"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.Status.SUCCEEDED, self.Status.FAILED)
+
+
+class GenerationLease(models.Model):
+    """
+    Cross-process lease on one in-flight generation, keyed on the normalized request.
+
+    The process holding the lease calls the API; the others wait for it and
+    share the resulting image (or error) instead of generating it again.
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    owner = models.CharField(max_length=64, help_text="Token of the lease holder")
+    image = models.ForeignKey(GeneratedImage, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    error = models.TextField(blank=True)
+    acquired_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Generation Lease"
+        verbose_name_plural = "Generation Leases"
+
+    def __str__(self):
+        return f"Lease {self.key[:12]} ({'finished' if self.finished_at else 'in flight'})"
+
+
+class RateLimitBucket(models.Model):
+    """Token bucket of one rate-limited client (see generator.admission)"""
+    key = models.CharField(max_length=150, primary_key=True)
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Rate Limit Bucket"
+        verbose_name_plural = "Rate Limit Buckets"
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.1f} tokens"
+
+
+class PromptBand(models.Model):
+    """
+    One MinHash band of an image prompt, the index behind "similar prompts" lookups.
+
+    Images whose prompts share a (band, bucket) pair are likely similar; see
+    generator.search.
+    """
+    image = models.ForeignKey(GeneratedImage, on_delete=models.CASCADE, related_name='+')
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['band', 'bucket'], name='generator_prompt_band_idx'),
+        ]
+        verbose_name = "Prompt Band"
+        verbose_name_plural = "Prompt Bands"
+
+    def __str__(self):
+        return f"Band {self.band} of image #{self.image_id}"
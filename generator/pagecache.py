@@ -0,0 +1,134 @@
+"""
+Caching of rendered pages.
+
+The gallery grid (image cards and pagination links) is rendered once per
+(search, cursor) and kept in the PAGE_CACHE_ALIAS cache, whose entries
+are keyed on a gallery version. Saving or deleting a GeneratedImage (and
+the batch pipeline's bulk insert) replaces the version, which drops every
+cached grid at once. The page around the grid carries the user's CSRF
+token and messages, so it is still rendered per request; repeat loads are
+answered 304 Not Modified from page_etag() without rendering at all
+(page_condition() is the view decorator).
+
+The cache must be shared by the web and worker processes for the
+invalidation to be seen everywhere (the default is a file-based cache).
+"""
+import hashlib
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.views.decorators.http import condition
+
+GALLERY_VERSION_KEY = 'gallery:version'
+
+# Set inside deferred_invalidation(): invalidations are recorded, not applied
+_deferred = ContextVar('gallery_invalidation_deferred', default=None)
+
+
+def page_cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def gallery_version():
+    """Current gallery version (created on first use)"""
+    cache = page_cache()
+    version = cache.get(GALLERY_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        # Another process may have set it meanwhile: keep theirs
+        if not cache.add(GALLERY_VERSION_KEY, version, timeout=None):
+            version = cache.get(GALLERY_VERSION_KEY, version)
+    return version
+
+
+def invalidate_gallery(**kwargs):
+    """Drop every cached gallery grid (signal receiver for GeneratedImage changes)"""
+    pending = _deferred.get()
+    if pending is not None:
+        pending.append(True)
+        return
+    page_cache().set(GALLERY_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+@contextmanager
+def deferred_invalidation():
+    """Coalesce the invalidations of a bulk change (one signal per row) into a single one at the end"""
+    pending = []
+    token = _deferred.set(pending)
+    try:
+        yield
+    finally:
+        _deferred.reset(token)
+        if pending:
+            invalidate_gallery()
+
+
+def _digest(*parts):
+    return hashlib.sha256('\0'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+async def agallery_fragment(version, params, render):
+    """Return the cached grid of these gallery parameters, awaiting render() on a miss"""
+    cache = page_cache()
+    key = f'gallery:grid:{version}:{_digest(*params)}'
+    html = await cache.aget(key)
+    if html is None:
+        html = await render()
+        await cache.aset(key, html, timeout=settings.PAGE_CACHE_TIMEOUT)
+    return html
+
+
+def _templates_version():
+    # Changes when templates are deployed (all processes see the same files)
+    paths = [Path(directory) for directory in settings.TEMPLATES[0]['DIRS']]
+    paths.append(Path(__file__).resolve().parent / 'templates')
+    mtimes = [path.stat().st_mtime for directory in paths if directory.is_dir() for path in directory.rglob('*.html')]
+    return max(mtimes, default=0)
+
+
+TEMPLATES_VERSION = _templates_version()
+
+
+def page_etag(request, *parts):
+    """
+    ETag of a page whose content depends only on parts, or None when it must be rendered.
+
+    The CSRF cookie is part of the tag, since the page embeds a token derived
+    from it; pending flash messages always force a render.
+    """
+    if len(get_messages(request)):
+        return None
+    return _digest(TEMPLATES_VERSION, request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''), *parts)
+
+
+def _load_messages(request):
+    # Reads the message storage once; later reads use the loaded messages
+    len(get_messages(request))
+
+
+def page_condition(etag_func):
+    """
+    condition(etag_func=...) for async page views.
+
+    The pending flash messages (which page_etag() and the template read) may
+    live in the session: they are loaded in a thread first, so the session
+    store is never queried from the event loop.
+    """
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            await sync_to_async(_load_messages)(request)
+            return await conditional_view(request, *args, **kwargs)
+
+        return inner
+
+    return decorator
@@ -0,0 +1,129 @@
+"""
+Keyset (seek) pagination over (created_at, id).
+
+Unlike OFFSET pagination, each page is a bounded index range scan, so the cost
+of a page does not grow with how deep into the gallery the user has scrolled.
+"""
+import base64
+from dataclasses import dataclass
+from datetime import datetime
+from functools import cached_property
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+
+
+@dataclass
+class KeysetPage:
+    """One page of results plus the cursors of its neighbours"""
+    items: list
+    newer_cursor: str | None
+    older_cursor: str | None
+
+
+def encode_cursor(obj):
+    raw = f"{obj.created_at.isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (created_at, pk) from a cursor, or None if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _seek(queryset, page_size, before, after):
+    """Return (rows queryset, position, towards_newer) of a keyset page"""
+    position = decode_cursor(after) if after else decode_cursor(before) if before else None
+
+    if position and after:
+        created_at, pk = position
+        rows = (
+            queryset
+            .filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+            .order_by('created_at', 'id')[:page_size + 1]
+        )
+        return rows, position, True
+    if position:
+        created_at, pk = position
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    return queryset.order_by('-created_at', '-id')[:page_size + 1], position, False
+
+
+def _page(rows, page_size, position, towards_newer):
+    if towards_newer:
+        has_more_newer = len(rows) > page_size
+        items = rows[:page_size][::-1]
+        has_more_older = True
+    else:
+        has_more_older = len(rows) > page_size
+        items = rows[:page_size]
+        has_more_newer = position is not None
+
+    return KeysetPage(
+        items=items,
+        newer_cursor=encode_cursor(items[0]) if items and has_more_newer else None,
+        older_cursor=encode_cursor(items[-1]) if items and has_more_older else None,
+    )
+
+
+def paginate_newest_first(queryset, page_size, before=None, after=None):
+    """
+    Return a KeysetPage of queryset ordered by (-created_at, -id).
+
+    ``before`` walks towards older rows, ``after`` towards newer rows.
+    """
+    rows, position, towards_newer = _seek(queryset, page_size, before, after)
+    return _page(list(rows), page_size, position, towards_newer)
+
+
+async def apaginate_newest_first(queryset, page_size, before=None, after=None):
+    """Coroutine version of paginate_newest_first (async ORM iteration)"""
+    rows, position, towards_newer = _seek(queryset, page_size, before, after)
+    return _page([row async for row in rows], page_size, position, towards_newer)
+
+
+def estimated_row_count(model, using='default'):
+    """
+    Cheap estimate of a table's row count, or None when the backend has none.
+
+    PostgreSQL reads the planner statistics; SQLite takes the largest rowid,
+    which overcounts by the number of deleted rows.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f"SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}")
+        else:
+            return None
+        row = cursor.fetchone()
+    # reltuples is -1 for a table that was never analyzed
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Paginator counting unfiltered querysets from table statistics.
+
+    Above ``threshold`` rows an exact COUNT(*) scans the whole
+    table on every page load; the estimate is good enough for page links.
+    Filtered querysets are still counted exactly.
+    """
+    threshold = 10_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if getattr(queryset, 'query', None) is not None and not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, using=queryset.db)
+            if estimate is not None and estimate > self.threshold:
+                return estimate
+        return super().count
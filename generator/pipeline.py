@@ -0,0 +1,218 @@
+"""
+Generation pipeline: call the Stable Diffusion service and persist the result.
+"""
+import logging
+
+from django.conf import settings
+
+from stable_diffusion_service import build_batch_items
+
+from .backends import select_backend
+from .metrics import span
+from .models import GeneratedImage
+from .pagecache import invalidate_gallery
+from .renditions import schedule_renditions
+from .search import index_images
+from .singleflight import LeaseTable, SingleFlight
+from .storage import get_blob_store
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationError(Exception):
+    """Raised when an image could not be generated"""
+
+
+def get_service(width=1024, height=1024):
+    """Return the generation engine for a request, or raise GenerationError if none is configured"""
+    try:
+        service = select_backend(width, height)
+    except Exception as e:
+        if "HUGGINGFACE_API_KEY" in str(e):
+            raise GenerationError('Hugging Face API key is required. Please add your HUGGINGFACE_API_KEY to environment variables.')
+        raise GenerationError(f"Image generation service is not available: {e}")
+    if not service:
+        raise GenerationError('Image generation service is not available. Please check your API key.')
+    return service
+
+
+_in_flight = SingleFlight()
+
+
+def generate_and_store(prompt, negative_prompt=None, use_cache=True, seed=None):
+    """
+    Generate an image for prompt, write it to the blob store and return the saved GeneratedImage.
+
+    With GENERATION_COALESCE on, identical requests running at the same time
+    (in this process or another one) share a single generation and image.
+    Requests with use_cache off ask for a fresh image and are never coalesced.
+    """
+    service = get_service()
+
+    def generate():
+        return _generate_and_store(service, prompt, negative_prompt, use_cache, seed)
+
+    if not settings.GENERATION_COALESCE or not use_cache:
+        return generate()
+
+    key = service.request_key(prompt, negative_prompt or None, seed=seed)
+    return _in_flight.do(key, lambda: _coalesced(key, generate))
+
+
+def _coalesced(key, generate):
+    """Run generate under the cross-process lease on key, or share the holder's outcome"""
+    leases = _lease_table()
+    while True:
+        token = leases.acquire(key)
+        if token is not None:
+            try:
+                image = generate()
+            except GenerationError as e:
+                leases.complete(key, token, error=str(e))
+                raise
+            except BaseException:
+                leases.release(key, token)
+                raise
+            leases.complete(key, token, image=image)
+            return image
+
+        logger.info(f"Waiting for identical in-flight generation {key[:12]}")
+        lease = leases.wait(key, timeout=leases.ttl)
+        if lease is None:
+            continue  # Holder gave up or died: try to take the lease over
+        if lease.error:
+            raise GenerationError(lease.error)
+        if lease.image is not None:
+            return lease.image
+        # The shared image was deleted meanwhile
+        return generate()
+
+
+def _lease_table():
+    return LeaseTable(
+        ttl=settings.GENERATION_COALESCE_LEASE_TTL,
+        poll_interval=settings.GENERATION_COALESCE_POLL_INTERVAL,
+    )
+
+
+def _generate_and_store(service, prompt, negative_prompt, use_cache, seed=None):
+    logger.info(f"Generating image for prompt: {prompt}")
+    # The response body is streamed straight into the blob store
+    with get_blob_store().writer() as writer:
+        result = service.generate_image(
+            prompt, negative_prompt=negative_prompt or None, seed=seed, use_cache=use_cache, sink=writer,
+            **_output_options(),
+        )
+        if not result:
+            raise _failure(service)
+        with span('storage_write'):
+            stored = writer.commit()
+    with span('db_insert'):
+        image = GeneratedImage.objects.create(prompt=prompt, **stored.as_fields())
+    with span('search_index'):
+        index_images([image])
+    schedule_renditions([image])
+    return image
+
+
+def _failure(service):
+    """Return the GenerationError matching the service state after a failed call"""
+    if not service.is_available():
+        return GenerationError('Image generation service is temporarily unavailable. Please try again in a minute.')
+    return GenerationError('Image generation failed. Please try again.')
+
+
+def _output_options():
+    """Return the explicit transcoding options configured by GENERATION_OUTPUT_FORMAT"""
+    if not settings.GENERATION_OUTPUT_FORMAT:
+        return {}
+    return {
+        'output_format': settings.GENERATION_OUTPUT_FORMAT,
+        'quality': settings.GENERATION_OUTPUT_QUALITY,
+    }
+
+
+def generate_batch_and_store(prompts=None, prompt=None, seeds=None, variations=None,
+                             concurrency=None, use_cache=True):
+    """
+    Generate a batch of images with bounded concurrency and persist the successes.
+
+    Takes either a list of prompts, or one prompt with a list of seeds or a
+    number of variations. Returns the service's BatchItem list, each item
+    carrying either ``image_id`` or ``error``. All successful rows are saved
+    with a single bulk insert. Used by the generatebatch command: the web
+    views queue one job per item instead (see jobs.enqueue_batch).
+    """
+    service, items, concurrency = _prepare_batch(prompts, prompt, seeds, variations, concurrency)
+    writers = {}
+    try:
+        items = service.generate_batch(
+            items, concurrency=concurrency, use_cache=use_cache, sink_factory=_sink_factory(writers),
+            **_output_options(),
+        )
+        return _save_batch(items, writers)
+    finally:
+        # Drops the temp files of failed items
+        for writer in writers.values():
+            writer.abort()
+
+
+def build_batch(prompts=None, prompt=None, seeds=None, variations=None):
+    """Return the BatchItems of a batch request, or raise GenerationError if it is empty or too large"""
+    try:
+        # Checks the size before drawing any seed: variations comes from the client
+        items = build_batch_items(
+            prompts=prompts, prompt=prompt, seeds=seeds, variations=variations,
+            max_items=settings.GENERATION_BATCH_MAX_ITEMS,
+        )
+    except ValueError as e:
+        raise GenerationError(str(e))
+    if not items:
+        raise GenerationError('Please enter at least one prompt')
+    return items
+
+
+def _prepare_batch(prompts, prompt, seeds, variations, concurrency):
+    """Validate a batch request and return (service, items, concurrency)"""
+    items = build_batch(prompts, prompt, seeds, variations)
+    service = get_service()
+    concurrency = concurrency or settings.GENERATION_BATCH_CONCURRENCY
+    concurrency = max(1, min(concurrency, settings.GENERATION_BATCH_CONCURRENCY))
+    logger.info(f"Generating batch of {len(items)} images with concurrency {concurrency}")
+    return service, items, concurrency
+
+
+def _sink_factory(writers):
+    """Return a sink_factory opening one blob writer per item, kept in writers"""
+    store = get_blob_store()
+
+    def sink_for(item):
+        writers[id(item)] = writer = store.writer()
+        return writer
+
+    return sink_for
+
+
+def _save_batch(items, writers):
+    """Commit the blobs of the successful items and insert their rows"""
+    new_images = []
+    stored_items = []
+    for item in items:
+        if not item.ok:
+            continue
+        with span('storage_write'):
+            stored = writers[id(item)].commit()
+        new_images.append(GeneratedImage(prompt=item.prompt, **stored.as_fields()))
+        stored_items.append(item)
+
+    # One INSERT for the whole batch
+    with span('db_insert', rows=len(new_images)):
+        GeneratedImage.objects.bulk_create(new_images)
+    with span('search_index', rows=len(new_images)):
+        index_images(new_images)
+    if new_images:
+        invalidate_gallery()  # bulk_create sends no post_save
+        schedule_renditions(new_images)
+    for item, image in zip(stored_items, new_images):
+        item.image_id = image.pk
+    return items
@@ -0,0 +1,148 @@
+"""
+Progress streams of generation jobs.
+
+The job row is the source of truth: the worker updates its status, image
+and model-loading ETA, and job_events() / ajob_events() turn the changes
+into a sequence of JSON payloads. They are delivered as server-sent events
+by the ``job_events`` view (from job_events() under WSGI, ajob_events()
+under ASGI) and over a WebSocket by ``websocket_job_events`` (mounted in
+asgi.py).
+"""
+import asyncio
+import json
+import re
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import GenerationJob
+
+WS_JOB_PATH = re.compile(r'^/ws/jobs/(?P<job_id>[0-9a-f-]{36})/$')
+
+
+def job_payload(job):
+    """Return the JSON representation of a generation job"""
+    payload = {
+        'id': str(job.id),
+        'status': job.status,
+        'status_url': reverse('job_status', args=[job.id]),
+        'events_url': reverse('job_events', args=[job.id]),
+        'prompt': job.prompt,
+        'seed': job.seed,
+        'error': job.error,
+        'loading_eta_seconds': None,
+        'image': None,
+    }
+    if job.status == GenerationJob.Status.RUNNING and job.loading_eta:
+        payload['loading_eta_seconds'] = max(0, round((job.loading_eta - timezone.now()).total_seconds()))
+    if job.status == GenerationJob.Status.SUCCEEDED and job.image_id:
+        payload['image'] = {
+            'id': job.image_id,
+            'url': reverse('image_file', args=[job.image_id]),
+            'download_url': reverse('download_image', args=[job.image_id]),
+        }
+    return payload
+
+
+def _job_state(job_id):
+    try:
+        job = GenerationJob.objects.filter(id=job_id).first()
+    except ValidationError:
+        return None
+    return None if job is None else job_payload(job)
+
+
+def _changed(previous, payload):
+    # The ETA counts down on its own: only a new estimate is a change
+    keys = ('status', 'image', 'error')
+    if previous is None or any(previous[key] != payload[key] for key in keys):
+        return True
+    return (previous['loading_eta_seconds'] is None) != (payload['loading_eta_seconds'] is None)
+
+
+def job_events(job_id, poll_interval=None, max_duration=None):
+    """
+    Yield the job payload on every state transition until the job finishes.
+
+    Stops after max_duration seconds (clients reconnect and get the current
+    state first), or immediately when the job does not exist.
+    """
+    poll_interval = poll_interval or settings.JOB_EVENTS_POLL_INTERVAL
+    give_up_at = time.monotonic() + (max_duration or settings.JOB_EVENTS_MAX_DURATION)
+    previous = None
+    while True:
+        payload = _job_state(job_id)
+        if payload is None:
+            return
+        if _changed(previous, payload):
+            yield payload
+            previous = payload
+        if payload['status'] in (GenerationJob.Status.SUCCEEDED, GenerationJob.Status.FAILED):
+            return
+        if time.monotonic() >= give_up_at:
+            return
+        time.sleep(poll_interval)
+
+
+async def ajob_events(job_id, poll_interval=None, max_duration=None):
+    """Coroutine version of job_events (database reads run in a thread)"""
+    poll_interval = poll_interval or settings.JOB_EVENTS_POLL_INTERVAL
+    give_up_at = time.monotonic() + (max_duration or settings.JOB_EVENTS_MAX_DURATION)
+    previous = None
+    while True:
+        payload = await sync_to_async(_job_state)(job_id)
+        if payload is None:
+            return
+        if _changed(previous, payload):
+            yield payload
+            previous = payload
+        if payload['status'] in (GenerationJob.Status.SUCCEEDED, GenerationJob.Status.FAILED):
+            return
+        if time.monotonic() >= give_up_at:
+            return
+        await asyncio.sleep(poll_interval)
+
+
+def sse_stream(events, retry_ms=2000):
+    """Format payloads as server-sent events of type 'job'"""
+    yield f"retry: {retry_ms}\n\n"
+    for payload in events:
+        yield f"event: job\ndata: {json.dumps(payload)}\n\n"
+
+
+async def asse_stream(events, retry_ms=2000):
+    """Async version of sse_stream, over an async iterator of payloads"""
+    yield f"retry: {retry_ms}\n\n"
+    async for payload in events:
+        yield f"event: job\ndata: {json.dumps(payload)}\n\n"
+
+
+async def websocket_job_events(scope, receive, send):
+    """ASGI WebSocket handler streaming the payloads of /ws/jobs/<uuid>/ as JSON text frames"""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    match = WS_JOB_PATH.match(scope['path'])
+    if not match:
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    await send({'type': 'websocket.accept'})
+
+    async def wait_for_disconnect():
+        while (await receive())['type'] != 'websocket.disconnect':
+            pass
+
+    disconnected = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        async for payload in ajob_events(match['job_id'], max_duration=settings.GENERATION_JOB_TIMEOUT):
+            if disconnected.done():
+                return
+            await send({'type': 'websocket.send', 'text': json.dumps(payload)})
+        if not disconnected.done():
+            await send({'type': 'websocket.close', 'code': 1000})
+    finally:
+        disconnected.cancel()
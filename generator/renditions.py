@@ -0,0 +1,332 @@
+"""
+Downscaled renditions (thumbnails) of images held in the blob store.
+
+Renditions are derived from the immutable blob, so each one is rendered once
+and then served straight from disk. After a generation is stored, a pool of
+processes renders every size and format in the background and computes the
+image placeholders (a BlurHash and a tiny inline WebP), so the CPU-heavy
+Pillow work stays off the request path; get_thumbnail() still renders a
+missing rendition on first use.
+"""
+import base64
+import logging
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+
+from .storage import get_blob_store
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZES = (256, 512, 1024)
+DEFAULT_THUMBNAIL_SIZE = 256
+# Web-optimized stand-in for the full-size PNG (image viewer)
+DISPLAY_SIZE = 1024
+
+# format name -> (PIL format, mime type, save options)
+_FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+_AVIF_FORMAT = ('AVIF', 'image/avif', {'quality': 60, 'speed': 8})
+
+# Width of the inline placeholder image
+LQIP_SIZE = 16
+
+
+@lru_cache(maxsize=None)
+def rendition_formats():
+    """Formats renditions are rendered in, AVIF included when Pillow supports it"""
+    # Probing the codecs imports Pillow: done on first use rather than at startup
+    from PIL import features
+
+    formats = dict(_FORMATS)
+    if features.check('avif'):
+        formats['avif'] = _AVIF_FORMAT
+    return formats
+
+
+def rendition_path(key, size, fmt):
+    """Return the on-disk path of a rendition"""
+    root = Path(settings.IMAGE_RENDITION_ROOT)
+    # Validates the key as a side effect
+    get_blob_store().path(key)
+    return root / key[:2] / key[2:4] / f"{key}-{size}.{fmt}"
+
+
+def rendition_paths(key):
+    """Return the paths of every rendition of a blob (rendered or not)"""
+    return [rendition_path(key, size, fmt) for size in THUMBNAIL_SIZES for fmt in rendition_formats()]
+
+
+def link_renditions(key, new_key):
+    """Reuse the renditions of key for new_key, a blob with the same pixels"""
+    for path, new_path in zip(rendition_paths(key), rendition_paths(new_key)):
+        if not path.exists() or new_path.exists():
+            continue
+        new_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(path, new_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            # No hard links on this filesystem: copy next to the target, then rename
+            fd, tmp_path = tempfile.mkstemp(dir=new_path.parent, prefix='.tmp-')
+            os.close(fd)
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, new_path)
+
+
+def delete_renditions(key):
+    for path in rendition_paths(key):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def negotiate_format(accept_header):
+    """Pick the smallest format the client advertises: AVIF, then WebP, JPEG otherwise"""
+    accept = accept_header or ''
+    if 'image/avif' in accept and 'avif' in rendition_formats():
+        return 'avif'
+    return 'webp' if 'image/webp' in accept else 'jpeg'
+
+
+def _check(size, fmt):
+    if size not in THUMBNAIL_SIZES:
+        raise ValueError(f"Unsupported thumbnail size: {size}")
+    if fmt not in rendition_formats():
+        raise ValueError(f"Unsupported thumbnail format: {fmt}")
+
+
+def _save(image, path, fmt):
+    """Write a rendition atomically (readers never see a partial file)"""
+    pil_format, _, options = rendition_formats()[fmt]
+    if image.mode not in ('RGB', 'RGBA') or (fmt == 'jpeg' and image.mode != 'RGB'):
+        image = image.convert('RGB')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            image.save(tmp, format=pil_format, **options)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def get_thumbnail(key, size=DEFAULT_THUMBNAIL_SIZE, fmt='webp'):
+    """Return the path of a thumbnail rendition, rendering it on first use"""
+    _check(size, fmt)
+    path = rendition_path(key, size, fmt)
+    if path.exists():
+        return path
+
+    from PIL import Image
+
+    with get_blob_store().open(key) as src, Image.open(src) as image:
+        # draft() lets JPEG sources decode directly at reduced scale
+        image.draft('RGB', (size, size))
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        _save(image, path, fmt)
+    return path
+
+
+def render_renditions(key, force=False):
+    """
+    Render every size and format of a blob and return its placeholders.
+
+    Sizes are produced from the largest down, each from the previous one,
+    so the source is decoded once. Returns {'blurhash': ..., 'lqip': ...}.
+    """
+    from PIL import Image
+
+    with get_blob_store().open(key) as src, Image.open(src) as original:
+        image = original.convert('RGBA' if 'A' in original.getbands() else 'RGB')
+    for size in sorted(THUMBNAIL_SIZES, reverse=True):
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        for fmt in rendition_formats():
+            path = rendition_path(key, size, fmt)
+            if force or not path.exists():
+                _save(image, path, fmt)
+    return placeholders(image)
+
+
+def placeholders(image):
+    """BlurHash string and inline WebP data URL standing in for an image while it loads"""
+    from PIL import Image
+
+    small = image.convert('RGB')
+    small.thumbnail((LQIP_SIZE, LQIP_SIZE), Image.Resampling.BOX)
+    buffered = BytesIO()
+    small.save(buffered, format='WEBP', quality=40)
+    lqip = 'data:image/webp;base64,' + base64.b64encode(buffered.getvalue()).decode()
+
+    sample = image.convert('RGB')
+    sample.thumbnail((32, 32), Image.Resampling.BOX)
+    x_components, y_components = (4, 3) if sample.width >= sample.height else (3, 4)
+    return {'blurhash': blurhash_encode(sample, x_components, y_components), 'lqip': lqip}
+
+
+# BlurHash (https://blurha.sh): a few DCT components of the image, base83-encoded
+
+_BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+_SRGB_TO_LINEAR = [
+    value / 255 / 12.92 if value / 255 <= 0.04045 else ((value / 255 + 0.055) / 1.055) ** 2.4
+    for value in range(256)
+]
+
+
+def _base83(value, length):
+    return ''.join(_BASE83[value // 83 ** (length - i - 1) % 83] for i in range(length))
+
+
+def _linear_to_srgb(value):
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash_encode(image, x_components=4, y_components=3):
+    """Encode a (small) RGB image as a BlurHash string"""
+    width, height = image.size
+    pixels = [tuple(_SRGB_TO_LINEAR[channel] for channel in pixel) for pixel in image.getdata()]
+    factors = []
+    for j in range(y_components):
+        cos_y = [math.cos(math.pi * j * y / height) for y in range(height)]
+        for i in range(x_components):
+            cos_x = [math.cos(math.pi * i * x / width) for x in range(width)]
+            normalisation = 1 if i == 0 and j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                row = y * width
+                for x in range(width):
+                    basis = cos_x[x] * cos_y[y]
+                    pr, pg, pb = pixels[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = normalisation / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        quantised_max = max(0, min(82, int(max(abs(c) for factor in ac for c in factor) * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+    else:
+        quantised_max, max_value = 0, 1
+    result += _base83(quantised_max, 1)
+    result += _base83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+
+    def quantise(value):
+        signed = math.copysign(abs(value / max_value) ** 0.5, value)
+        return max(0, min(18, int(math.floor(signed * 9 + 9.5))))
+
+    for r, g, b in ac:
+        result += _base83(quantise(r) * 19 * 19 + quantise(g) * 19 + quantise(b), 2)
+    return result
+
+
+def render_chunk(keys, force=False):
+    """Pool task: render the renditions of several blobs, {key: placeholders or None}"""
+    results = {}
+    for key in keys:
+        try:
+            results[key] = render_renditions(key, force=force)
+        except Exception as e:
+            logger.warning(f"Could not render renditions of {key[:12]}: {e}")
+            results[key] = None
+    return results
+
+
+def _init_pool_process():
+    # Spawned pool processes start without Django configured
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def make_pool(workers):
+    # Spawned rather than forked: the callers are multi-threaded (web and job workers)
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_pool_process,
+    )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _forget_pool():
+    # A forked child does not inherit the pool's management thread
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pool)
+
+
+def _background_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = make_pool(settings.RENDITION_POOL_SIZE)
+        return _pool
+
+
+def save_placeholders(results):
+    """Record the placeholders of rendered blobs on every image row holding them"""
+    from django.utils import timezone
+
+    from .models import GeneratedImage
+    from .pagecache import invalidate_gallery
+
+    now = timezone.now()
+    updated = 0
+    for key, result in results.items():
+        if result is not None:
+            updated += GeneratedImage.objects.filter(blob_key=key).update(renditions_at=now, **result)
+    if updated:
+        invalidate_gallery()  # update() sends no post_save: cached grids would keep no placeholders
+
+
+def schedule_renditions(images):
+    """Render the renditions of freshly stored images in the background process pool"""
+    if not settings.RENDITION_POOL_SIZE:
+        return None
+    keys = sorted({image.blob_key for image in images if image.blob_key})
+    if not keys:
+        return None
+    future = _background_pool().submit(render_chunk, keys)
+    caller = threading.current_thread()
+
+    def done(future):
+        from django.db import connection
+
+        try:
+            save_placeholders(future.result())
+        except Exception as e:
+            logger.warning(f"Rendition task failed: {e}")
+        finally:
+            # Runs in the pool's thread, unless the task was already done
+            if threading.current_thread() is not caller:
+                connection.close()
+
+    future.add_done_callback(done)
+    return future
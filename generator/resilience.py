@@ -0,0 +1,162 @@
+"""
+Resilience primitives for calls to the inference backend.
+
+- ExponentialBackoff: capped exponential delays with full jitter
+- Deadline: overall time budget of one generation, retries included
+- CircuitBreaker: fails fast after repeated upstream failures and lets a
+  few half-open probes through once the reset timeout has elapsed
+- HealthState: cached availability answer derived from the breaker and
+  recent observations, so health checks do not hit the network each time
+
+All state is per process and thread-safe.
+"""
+import random
+import threading
+import time
+
+
+class ExponentialBackoff:
+    """Delay of attempt n is uniform in [0, min(cap, base * 2**n)] ("full jitter")"""
+
+    def __init__(self, base=1.0, cap=30.0, jitter=True):
+        self.base = base
+        self.cap = cap
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        ceiling = min(self.cap, self.base * (2 ** attempt))
+        return random.uniform(0, ceiling) if self.jitter else ceiling
+
+
+class Deadline:
+    """Time budget shared by every attempt of one request"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds else None
+
+    def remaining(self):
+        if self.expires_at is None:
+            return float('inf')
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open circuit breaker.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    every call is refused for ``reset_timeout`` seconds. It then goes
+    half-open and lets up to ``half_open_max_calls`` probes through: one
+    success closes it again, one failure re-opens it.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, half_open_max_calls=1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    def retry_after(self):
+        """Seconds until the open circuit lets a probe through"""
+        with self._lock:
+            if self._current_state() != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def allow_request(self):
+        """Return True if a call may be attempted now"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            return False
+
+    def release_probe(self):
+        """Give back a half-open probe slot when the call ended without an outcome (cancelled, local error)"""
+        with self._lock:
+            if self._current_state() == self.HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._half_open_calls = 0
+
+    def record_failure(self):
+        with self._lock:
+            state = self._current_state()
+            self._failures += 1
+            if state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._half_open_calls = 0
+
+
+class HealthState:
+    """
+    Cached availability of the backend.
+
+    Answers from the circuit breaker and the last observed outcome; only when
+    nothing has been observed for ``ttl`` seconds is ``probe`` called, and its
+    result is cached in turn.
+    """
+
+    def __init__(self, circuit, probe=None, ttl=30.0):
+        self.circuit = circuit
+        self.probe = probe
+        self.ttl = ttl
+        self.last_ok = None
+        self.last_observed_at = None
+        self._lock = threading.Lock()
+
+    def observe(self, ok):
+        with self._lock:
+            self.last_ok = ok
+            self.last_observed_at = time.monotonic()
+
+    def is_available(self):
+        if self.circuit.state == CircuitBreaker.OPEN:
+            return False
+        with self._lock:
+            fresh = self.last_observed_at is not None and time.monotonic() - self.last_observed_at < self.ttl
+            if fresh or self.probe is None:
+                return self.last_ok is not False
+        ok = bool(self.probe())
+        self.observe(ok)
+        return ok
+
+    def snapshot(self):
+        return {
+            'circuit': self.circuit.state,
+            'last_ok': self.last_ok,
+            'seconds_since_observation': (
+                None if self.last_observed_at is None else round(time.monotonic() - self.last_observed_at, 1)
+            ),
+        }
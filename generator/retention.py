@@ -0,0 +1,378 @@
+"""
+Lifecycle of generated images: retention, archive tier and database compaction.
+
+The ``enforceretention`` command (meant to run from cron or a systemd timer)
+applies the policy configured in settings, in this order:
+
+- Images older than RETENTION_MAX_AGE_DAYS, beyond the newest
+  RETENTION_MAX_IMAGES, or past the newest RETENTION_MAX_BYTES are deleted,
+  oldest first, in short transactions of RETENTION_BATCH_SIZE rows. Blobs
+  and renditions no remaining row references are released.
+- Images older than IMAGE_ARCHIVE_AFTER_DAYS move to the archive tier: the
+  blob is re-encoded as lossless WebP (same pixels, typically a third
+  smaller than the PNG the API returns) under its new key, and the row is
+  marked archived.
+- Finished generation jobs older than RETENTION_JOB_MAX_AGE_DAYS are deleted.
+- The database is compacted: on SQLite the full-text index is merged, the
+  file is vacuumed once RETENTION_VACUUM_FREE_RATIO of its pages are free
+  and the planner statistics are refreshed; PostgreSQL runs VACUUM ANALYZE
+  on the tables retention shrinks.
+
+Every rule is disabled when set to 0.
+"""
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import GeneratedImage, GenerationJob, PromptBand
+from .pagecache import deferred_invalidation, invalidate_gallery
+from .renditions import delete_renditions, link_renditions, make_pool
+from .search import FTS_TABLE, fts5_available
+from .storage import get_blob_store, store_image_bytes
+
+logger = logging.getLogger(__name__)
+
+# A blob written again within this many seconds is not released: a generation
+# storing the same bytes may be about to reference it (BlobStore.put touches it)
+RELEASE_GRACE = 3600
+
+# Lossless: the archived image decodes to the same pixels as the original
+ARCHIVE_WEBP_OPTIONS = {'lossless': True, 'exact': True, 'quality': 50, 'method': 4}
+# Keep the original unless the WebP is at least this much smaller
+ARCHIVE_MIN_SAVING = 0.1
+WEBP_MAX_DIMENSION = 16383
+
+
+@dataclass
+class Released:
+    blobs: int = 0
+    bytes: int = 0
+
+    def __iadd__(self, other):
+        self.blobs += other.blobs
+        self.bytes += other.bytes
+        return self
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _newest_first():
+    return GeneratedImage.objects.order_by('-created_at', '-id')
+
+
+def _size_cutoff(budget, chunk_size):
+    """First image (newest first) past a budget of stored bytes, summed per row"""
+    total = 0
+    rows = _newest_first().values_list('created_at', 'id', 'byte_size')
+    for created_at, pk, size in rows.iterator(chunk_size=chunk_size):
+        total += size or 0
+        if total > budget:
+            return created_at, pk
+    return None
+
+
+def expiry_cutoff(now=None):
+    """
+    Return (created_at, id) of the newest image the retention rules expire, or None.
+
+    That image and every older one are deleted: the rules all keep a newest
+    prefix of the gallery, so the strictest one wins.
+    """
+    now = now or timezone.now()
+    rows = _newest_first().values_list('created_at', 'id')
+    cutoffs = []
+    if settings.RETENTION_MAX_AGE_DAYS:
+        cutoffs.append(rows.filter(created_at__lt=now - timedelta(days=settings.RETENTION_MAX_AGE_DAYS)).first())
+    if settings.RETENTION_MAX_IMAGES:
+        keep = settings.RETENTION_MAX_IMAGES
+        cutoffs.append(next(iter(rows[keep:keep + 1]), None))
+    if settings.RETENTION_MAX_BYTES:
+        cutoffs.append(_size_cutoff(settings.RETENTION_MAX_BYTES, settings.RETENTION_BATCH_SIZE))
+    return max((cutoff for cutoff in cutoffs if cutoff is not None), default=None)
+
+
+def expired_images(cutoff):
+    created_at, pk = cutoff
+    return GeneratedImage.objects.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lte=pk))
+
+
+def release_blobs(keys, grace=RELEASE_GRACE, dry_run=False):
+    """Delete the blobs and renditions of keys that no image references any more"""
+    store = get_blob_store()
+    keys = sorted(set(keys))
+    released = Released()
+    written_before = time.time() - grace
+    for chunk in _chunks(keys, 500):
+        referenced = set(
+            GeneratedImage.objects.filter(blob_key__in=chunk).order_by()
+            .values_list('blob_key', flat=True).distinct()
+        )
+        for key in chunk:
+            if key in referenced:
+                continue
+            try:
+                stat = store.path(key).stat()
+            except FileNotFoundError:
+                stat = None
+            if stat is not None and stat.st_mtime > written_before:
+                continue
+            if not dry_run:
+                store.delete(key)
+                delete_renditions(key)
+            if stat is not None:
+                released.blobs += 1
+                released.bytes += stat.st_size
+    return released
+
+
+def delete_images(queryset):
+    """Delete images (search index rows included), then release the blobs they alone held"""
+    with deferred_invalidation(), transaction.atomic():
+        keys = list(queryset.exclude(blob_key='').order_by().values_list('blob_key', flat=True).distinct())
+        deleted = queryset.delete()[1].get(GeneratedImage._meta.label, 0)
+    return deleted, release_blobs(keys)
+
+
+def delete_expired(batch_size=None, dry_run=False):
+    """Delete the images expired by the retention rules, oldest first; returns (deleted, Released)"""
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    cutoff = expiry_cutoff()
+    if cutoff is None:
+        return 0, Released()
+    expired = expired_images(cutoff).order_by('created_at', 'id')
+    if dry_run:
+        return expired.count(), Released()
+
+    deleted, released = 0, Released()
+    # One short transaction per batch, so the web and worker processes are
+    # never locked out for long
+    while ids := list(expired.values_list('id', flat=True)[:batch_size]):
+        count, freed = delete_images(GeneratedImage.objects.filter(id__in=ids))
+        deleted += count
+        released += freed
+    return deleted, released
+
+
+def archive_blob(key):
+    """
+    Re-encode a blob as lossless WebP in the store and return its StoredImage.
+
+    Returns None when the original is kept: already WebP, animated, a mode
+    WebP cannot hold losslessly, or too little to gain.
+    """
+    from PIL import Image, ImageChops
+
+    store = get_blob_store()
+    size = store.size(key)
+    with Image.open(store.path(key)) as image:
+        if (image.format == 'WEBP' or getattr(image, 'n_frames', 1) > 1 or image.mode not in ('RGB', 'RGBA')
+                or max(image.size) > WEBP_MAX_DIMENSION):
+            return None
+        image.load()
+        buffer = BytesIO()
+        image.save(buffer, 'WEBP', icc_profile=image.info.get('icc_profile'), **ARCHIVE_WEBP_OPTIONS)
+        data = buffer.getvalue()
+        if len(data) > size * (1 - ARCHIVE_MIN_SAVING):
+            return None
+        with Image.open(BytesIO(data)) as encoded:
+            if encoded.mode != image.mode or ImageChops.difference(encoded, image).getbbox() is not None:
+                logger.warning(f"Lossless WebP of {key[:12]} does not match the original, keeping it")
+                return None
+
+    stored = store_image_bytes(data, store)
+    link_renditions(key, stored.key)
+    return stored
+
+
+def archive_chunk(keys):
+    """Pool task: archive several blobs, {key: StoredImage or None if kept}; failed keys are left out"""
+    results = {}
+    for key in keys:
+        try:
+            results[key] = archive_blob(key)
+        except Exception as e:
+            logger.warning(f"Could not archive {key[:12]}: {e}")
+    return results
+
+
+def archive_candidates(before):
+    """(id, blob_key) of the images to archive: created before `before`, blob not shared with newer images"""
+    newer = GeneratedImage.objects.filter(blob_key=OuterRef('blob_key'), created_at__gte=before)
+    return (
+        GeneratedImage.objects
+        .filter(created_at__lt=before, archived_at__isnull=True)
+        .exclude(blob_key='')
+        .exclude(Exists(newer))
+        .order_by('id')
+        .values_list('id', 'blob_key')
+    )
+
+
+def save_archived(results, before):
+    """Point the archived images at their WebP blob, then release the originals; returns (images, bytes saved)"""
+    now = timezone.now()
+    archived = 0
+    for key, stored in results.items():
+        rows = GeneratedImage.objects.filter(blob_key=key, created_at__lt=before, archived_at__isnull=True)
+        if stored is None:
+            rows.update(archived_at=now)
+            continue
+        archived += rows.update(archived_at=now, **stored.as_fields())
+    released = release_blobs([key for key, stored in results.items() if stored is not None])
+    saved = released.bytes - sum(stored.size for stored in results.values() if stored is not None)
+    if archived:
+        invalidate_gallery()  # update() sends no post_save
+    return archived, max(saved, 0)
+
+
+def archive_cold(workers=1, chunk_size=20, dry_run=False):
+    """Move the images older than IMAGE_ARCHIVE_AFTER_DAYS to the archive tier; returns (images, bytes saved)"""
+    if not settings.IMAGE_ARCHIVE_AFTER_DAYS:
+        return 0, 0
+    before = timezone.now() - timedelta(days=settings.IMAGE_ARCHIVE_AFTER_DAYS)
+    candidates = archive_candidates(before)
+    if dry_run:
+        # Leave out the images the deletion step would have removed
+        cutoff = expiry_cutoff()
+        if cutoff is not None:
+            candidates = candidates.exclude(id__in=expired_images(cutoff).values('id'))
+        return candidates.count(), 0
+
+    archived = saved = 0
+    last_id = 0
+    # Keep a bounded number of chunks in flight so memory stays flat on large tables
+    max_pending = max(1, workers) * 2
+    pending = set()
+    exhausted = False
+    with make_pool(max(1, workers)) as pool:
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                rows = list(candidates.filter(id__gt=last_id)[:chunk_size])
+                if not rows:
+                    exhausted = True
+                    break
+                last_id = rows[-1][0]
+                pending.add(pool.submit(archive_chunk, sorted({key for _, key in rows})))
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                count, freed = save_archived(future.result(), before)
+                archived += count
+                saved += freed
+    return archived, saved
+
+
+def prune_jobs(batch_size=None, dry_run=False):
+    """Delete the finished generation jobs older than RETENTION_JOB_MAX_AGE_DAYS"""
+    if not settings.RETENTION_JOB_MAX_AGE_DAYS:
+        return 0
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    before = timezone.now() - timedelta(days=settings.RETENTION_JOB_MAX_AGE_DAYS)
+    finished = GenerationJob.objects.filter(
+        status__in=[GenerationJob.Status.SUCCEEDED, GenerationJob.Status.FAILED], created_at__lt=before,
+    )
+    if dry_run:
+        return finished.count()
+    deleted = 0
+    while ids := list(finished.values_list('id', flat=True)[:batch_size]):
+        deleted += GenerationJob.objects.filter(id__in=ids).delete()[0]
+    return deleted
+
+
+def compact_database(vacuum=None, dry_run=False, using='default'):
+    """
+    Give the space of deleted rows back and refresh the planner statistics.
+
+    vacuum forces (True) or skips (False) the SQLite VACUUM; by default it
+    runs once RETENTION_VACUUM_FREE_RATIO of the pages are free. Returns a
+    dict describing what was done.
+    """
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        return _compact_sqlite(connection, vacuum, dry_run)
+    if connection.vendor == 'postgresql':
+        tables = ', '.join(
+            connection.ops.quote_name(model._meta.db_table) for model in (GeneratedImage, PromptBand, GenerationJob)
+        )
+        if not dry_run:
+            # Plain VACUUM: the space is reused by new rows rather than returned
+            # to the filesystem, without VACUUM FULL's exclusive lock
+            with connection.cursor() as cursor:
+                cursor.execute(f"VACUUM (ANALYZE) {tables}")
+        return {'vacuumed': not dry_run}
+    return {'vacuumed': False}
+
+
+def _pragma(cursor, name):
+    cursor.execute(f"PRAGMA {name}")
+    return cursor.fetchone()[0]
+
+
+def _compact_sqlite(connection, vacuum, dry_run):
+    with connection.cursor() as cursor:
+        page_size = _pragma(cursor, 'page_size')
+        pages = _pragma(cursor, 'page_count')
+        free = _pragma(cursor, 'freelist_count')
+        if vacuum is None:
+            vacuum = bool(pages) and free / pages >= settings.RETENTION_VACUUM_FREE_RATIO
+        report = {'database_bytes': pages * page_size, 'free_bytes': free * page_size, 'vacuumed': False}
+        if dry_run:
+            return report
+
+        if fts5_available():
+            # Merge the index segments left behind by the deleted rows
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        if vacuum:
+            # Rewrites the whole file under an exclusive lock: writers wait on
+            # SQLITE_TIMEOUT meanwhile
+            cursor.execute("VACUUM")
+            cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            report['vacuumed'] = True
+            report['database_bytes'] = _pragma(cursor, 'page_count') * page_size
+            report['free_bytes'] = _pragma(cursor, 'freelist_count') * page_size
+        cursor.execute("ANALYZE")
+    return report
+
+
+def sweep_orphans(grace=RELEASE_GRACE, dry_run=False):
+    """
+    Release the blobs no image references, and the temp files of interrupted writes.
+
+    Catches blobs deleted images left behind (before retention existed, or
+    kept by the grace period). Walks the whole store, so it is run on demand
+    rather than on every retention pass.
+    """
+    store = get_blob_store()
+    released = Released()
+    keys = []
+    for key, _ in store.keys():
+        keys.append(key)
+        if len(keys) >= 500:
+            released += release_blobs(keys, grace, dry_run)
+            keys = []
+    released += release_blobs(keys, grace, dry_run)
+
+    written_before = time.time() - grace
+    for path in [*store.root.glob('.tmp-*'), *store.root.glob('??/??/.tmp-*')]:
+        try:
+            stat = path.stat()
+            if stat.st_mtime < written_before:
+                if not dry_run:
+                    path.unlink()
+                released.blobs += 1
+                released.bytes += stat.st_size
+        except FileNotFoundError:
+            pass
+    return released
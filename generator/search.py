@@ -0,0 +1,178 @@
+"""
+Prompt search: full-text matching and "similar prompts" lookups.
+
+Full-text search uses the database's own index, chosen by backend:
+
+- SQLite: the FTS5 table ``generator_image_fts`` (external content kept in
+  sync with generator_generatedimage by triggers, porter stemming). A
+  migration that rebuilds the image table on SQLite drops the triggers, and
+  must be followed by one re-creating them (as 0012_restore_fulltext_triggers
+  does after the 0011 rebuild)
+- PostgreSQL: a GIN index on ``to_tsvector('english', prompt)``
+- anything else: one case-insensitive LIKE per word (table scan)
+
+Similar prompts use MinHash locality-sensitive hashing over character
+trigrams. Every image stores SIMILARITY_BANDS band hashes (PromptBand rows,
+indexed on (band, bucket)); prompts sharing a band bucket are candidates,
+which are then ranked by their exact trigram Jaccard similarity. A lookup
+reads a handful of index ranges whatever the number of images.
+"""
+import hashlib
+import re
+from functools import lru_cache
+
+from django.db import connection, transaction
+from django.db.models import BooleanField, Count, Q
+from django.db.models.expressions import RawSQL
+
+from .models import GeneratedImage, PromptBand
+
+FTS_TABLE = 'generator_image_fts'
+
+SIMILARITY_BANDS = 16
+SIMILARITY_ROWS = 4  # MinHash values per band
+SIMILARITY_CANDIDATES = 200  # Candidates ranked exactly per lookup
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+_MERSENNE = (1 << 61) - 1
+
+
+def search_words(query):
+    """Words of a user query, lower-cased (punctuation and operators are dropped)"""
+    return [word.lower() for word in _WORD.findall(query or '')][:16]
+
+
+@lru_cache(maxsize=None)
+def fts5_available():
+    """True when the SQLite FTS5 table exists (SQLite built without FTS5 falls back to LIKE)"""
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def search_images(queryset, query):
+    """
+    Filter a GeneratedImage queryset to the prompts matching every word of query.
+
+    The last word also matches as a prefix, so results show up while typing.
+    Ordering is left to the caller (the gallery keeps newest first).
+    """
+    words = search_words(query)
+    if not words:
+        return queryset
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(words) + ':*'
+        table = GeneratedImage._meta.db_table
+        return queryset.filter(RawSQL(
+            f"to_tsvector('english', {table}.prompt) @@ to_tsquery('english', %s)",
+            [tsquery], output_field=BooleanField(),
+        ))
+    if fts5_available():
+        match = ' '.join(f'"{word}"' for word in words) + '*'
+        return queryset.filter(RawSQL(
+            f"{GeneratedImage._meta.db_table}.id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)",
+            [match], output_field=BooleanField(),
+        ))
+    condition = Q()
+    for word in words:
+        condition &= Q(prompt__icontains=word)
+    return queryset.filter(condition)
+
+
+def _normalize(prompt):
+    return ' '.join(search_words(prompt))
+
+
+def trigrams(prompt):
+    """Character trigrams of the normalized prompt (padded so short words count)"""
+    text = f"  {_normalize(prompt)} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+@lru_cache(maxsize=1)
+def _permutations():
+    # Fixed pseudo-random (a, b) pairs: signatures must be stable across processes and releases
+    seed = hashlib.sha256(b'generator.search.minhash').digest()
+    pairs = []
+    for i in range(SIMILARITY_BANDS * SIMILARITY_ROWS):
+        digest = hashlib.sha256(seed + i.to_bytes(4, 'big')).digest()
+        a = int.from_bytes(digest[:8], 'big') % (_MERSENNE - 1) + 1
+        b = int.from_bytes(digest[8:16], 'big') % _MERSENNE
+        pairs.append((a, b))
+    return pairs
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+def minhash(grams):
+    """MinHash signature of a trigram set (SIMILARITY_BANDS * SIMILARITY_ROWS values)"""
+    hashes = [_hash(gram) for gram in grams]
+    return [min((a * h + b) % _MERSENNE for h in hashes) for a, b in _permutations()]
+
+
+def band_buckets(prompt):
+    """Return [(band, bucket)] of a prompt, or [] when it has no words"""
+    if not _normalize(prompt):
+        return []
+    signature = minhash(trigrams(prompt))
+    buckets = []
+    for band in range(SIMILARITY_BANDS):
+        rows = signature[band * SIMILARITY_ROWS:(band + 1) * SIMILARITY_ROWS]
+        digest = hashlib.blake2b(repr(rows).encode(), digest_size=8).digest()
+        buckets.append((band, int.from_bytes(digest, 'big', signed=True)))
+    return buckets
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def index_images(images):
+    """(Re)compute the similarity bands of saved images"""
+    images = [image for image in images if image.pk]
+    if not images:
+        return
+    with transaction.atomic():
+        PromptBand.objects.filter(image__in=images).delete()
+        PromptBand.objects.bulk_create([
+            PromptBand(image=image, band=band, bucket=bucket)
+            for image in images
+            for band, bucket in band_buckets(image.prompt)
+        ])
+
+
+def similar_images(prompt, limit=6, min_similarity=0.3, queryset=None):
+    """
+    Return up to limit (image, similarity) pairs whose prompt resembles prompt, best first.
+
+    Similarity is the Jaccard index of the character trigrams (1.0: same words).
+    """
+    buckets = band_buckets(prompt)
+    if not buckets:
+        return []
+    matches = Q()
+    for band, bucket in buckets:
+        matches |= Q(band=band, bucket=bucket)
+    candidate_ids = list(
+        PromptBand.objects.filter(matches)
+        .values('image_id')
+        .annotate(shared=Count('id'))
+        .order_by('-shared', '-image_id')
+        .values_list('image_id', flat=True)[:SIMILARITY_CANDIDATES]
+    )
+    if not candidate_ids:
+        return []
+
+    queryset = GeneratedImage.objects.all() if queryset is None else queryset
+    wanted = trigrams(prompt)
+    scored = []
+    for image in queryset.filter(id__in=candidate_ids):
+        similarity = jaccard(wanted, trigrams(image.prompt))
+        if similarity >= min_similarity:
+            scored.append((image, round(similarity, 3)))
+    scored.sort(key=lambda pair: (-pair[1], -pair[0].created_at.timestamp()))
+    return scored[:limit]
@@ -0,0 +1,199 @@
+"""
+Efficient HTTP delivery of blob-store files.
+
+Responses are streamed from disk in chunks and support conditional GETs
+(ETag / Last-Modified), single byte ranges, and optional offloading of the
+transfer to the front web server through X-Sendfile or X-Accel-Redirect.
+
+Under an ASGI server files are read through async iterators, so a transfer
+does not hold a thread for its whole duration.
+"""
+import asyncio
+import mimetypes
+import os
+import re
+from calendar import timegm
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags
+
+from .storage import get_blob_store
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_chunks(path, start=0, length=None, chunk_size=CHUNK_SIZE):
+    """Yield the bytes of path from start, up to length bytes"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+async def afile_chunks(path, start=0, length=None, chunk_size=CHUNK_SIZE):
+    """Async version of file_chunks (the reads run in a thread)"""
+    chunks = file_chunks(path, start, length, chunk_size)
+    try:
+        while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+            yield chunk
+    finally:
+        chunks.close()
+
+
+async def aiter_in_thread(iterator):
+    """
+    Drive a blocking iterator from an async response, one item at a time.
+
+    Every step runs in the same dedicated thread, so a database cursor opened
+    by the iterator stays usable; the thread's connections are closed at the end.
+    """
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stream')
+    done = object()
+
+    def close():
+        try:
+            getattr(iterator, 'close', lambda: None)()
+        finally:
+            connections.close_all()
+
+    try:
+        while (item := await loop.run_in_executor(executor, next, iterator, done)) is not done:
+            yield item
+    finally:
+        await loop.run_in_executor(executor, close)
+        executor.shutdown(wait=False)
+
+
+def served_over_asgi(request):
+    """
+    True when request comes from an ASGI server.
+
+    Streaming bodies must then be async iterators: Django buffers a sync
+    iterator completely before sending it over ASGI (and an async one under
+    WSGI).
+    """
+    return isinstance(request, ASGIRequest)
+
+
+def stream_file(request, path, content_type, start=0, length=None, status=200):
+    """StreamingHttpResponse of length bytes of path from start (whole file by default)"""
+    if length is None:
+        length = os.path.getsize(path) - start
+    chunks = afile_chunks if served_over_asgi(request) else file_chunks
+    response = StreamingHttpResponse(chunks(path, start, length), status=status, content_type=content_type)
+    response['Content-Length'] = str(length)
+    return response
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) inclusive for a single-range header.
+
+    Returns None when the header is absent or not a single byte range (the
+    whole file is then served) and raises ValueError when it cannot be
+    satisfied.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def download_filename(prompt, image_id, mime_type):
+    """Return a safe attachment filename for an image"""
+    safe_prompt = "".join(c for c in prompt[:50] if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    extension = {'image/jpeg': '.jpg'}.get(mime_type) or mimetypes.guess_extension(mime_type or '') or '.png'
+    return f"{safe_prompt}_{image_id}{extension}"
+
+
+def serve_blob(request, key, content_type, last_modified=None, filename=None,
+               cache_control='public, max-age=86400'):
+    """
+    Return a response delivering blob key.
+
+    The blob key doubles as a strong ETag since the content behind it never
+    changes.
+    """
+    store = get_blob_store()
+    path = store.path(key)
+    etag = f'"{key}"'
+    last_modified_ts = timegm(last_modified.utctimetuple()) if last_modified else None
+
+    # 304 Not Modified / 412 Precondition Failed
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified_ts)
+    if response is None:
+        response = _blob_body(request, store, path, key, etag, content_type)
+
+    response['ETag'] = etag
+    if last_modified_ts is not None:
+        response['Last-Modified'] = http_date(last_modified_ts)
+    response['Cache-Control'] = cache_control
+    if filename and response.status_code != 304:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _blob_body(request, store, path, key, etag, content_type):
+    mode = settings.IMAGE_SENDFILE_MODE
+    if mode == 'x-sendfile':
+        # The front server (Apache mod_xsendfile, lighttpd...) reads the file itself
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = str(os.path.abspath(path))
+        return response
+    if mode == 'x-accel-redirect':
+        # nginx serves the internal location mapped onto IMAGE_STORE_ROOT
+        response = HttpResponse(content_type=content_type)
+        relative = os.path.relpath(path, store.root).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = settings.IMAGE_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + relative
+        return response
+
+    size = os.path.getsize(path)
+    byte_range = None
+    if request.method == 'GET' and _if_range_matches(request, etag):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = stream_file(request, path, content_type, length=size)
+    else:
+        start, end = byte_range
+        response = stream_file(request, path, content_type, start, end - start + 1, status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _if_range_matches(request, etag):
+    """A Range is only honoured when If-Range is absent or names the current ETag"""
+    if_range = request.headers.get('If-Range')
+    return not if_range or etag in parse_etags(if_range)
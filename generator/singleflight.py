@@ -0,0 +1,121 @@
+"""
+Coalescing of identical concurrent generations ("single flight").
+
+When the same normalized request is submitted several times at once, only
+the first caller generates; the others wait and share its outcome.
+
+- SingleFlight: per-process, threads waiting on one in-flight call
+- LeaseTable: cross-process, a GenerationLease row claimed with an INSERT
+  (or a conditional UPDATE once expired) that later records the result
+
+A finished lease is kept for ``result_ttl`` seconds so waiters polling from
+other processes can pick up the result; a lease whose holder died expires
+after ``ttl`` seconds and is taken over by the next caller.
+"""
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import GenerationLease
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers with the same key share its outcome"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class LeaseTable:
+    """Database lease table coordinating generations across worker processes"""
+
+    def __init__(self, ttl=180.0, result_ttl=10.0, poll_interval=0.25):
+        self.ttl = ttl
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+
+    def acquire(self, key):
+        """Return an owner token if the lease on key was obtained, None if someone else holds it"""
+        token = uuid.uuid4().hex
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=self.ttl)
+        GenerationLease.objects.filter(expires_at__lt=now).exclude(key=key).delete()
+        try:
+            with transaction.atomic():
+                GenerationLease.objects.create(key=key, owner=token, acquired_at=now, expires_at=expires_at)
+            return token
+        except IntegrityError:
+            pass
+        # Take over a lease whose holder died or whose result is stale
+        taken = GenerationLease.objects.filter(key=key, expires_at__lt=now).update(
+            owner=token, image=None, error='', acquired_at=now, finished_at=None, expires_at=expires_at,
+        )
+        return token if taken else None
+
+    def complete(self, key, token, image=None, error=''):
+        """Publish the outcome of a held lease to the waiters"""
+        now = timezone.now()
+        GenerationLease.objects.filter(key=key, owner=token).update(
+            image=image, error=error, finished_at=now, expires_at=now + timedelta(seconds=self.result_ttl),
+        )
+
+    def release(self, key, token):
+        """Drop a held lease without a result so a waiter takes over"""
+        GenerationLease.objects.filter(key=key, owner=token).delete()
+
+    def wait(self, key, timeout=None):
+        """
+        Poll the lease on key until it finishes.
+
+        Returns the finished GenerationLease, or None when the lease vanished,
+        expired or timeout elapsed (the caller should then try to acquire it).
+        """
+        give_up_at = None if timeout is None else time.monotonic() + timeout
+        while True:
+            lease = GenerationLease.objects.select_related('image').filter(key=key).first()
+            if lease is None or lease.expires_at < timezone.now():
+                return None
+            if lease.finished_at is not None:
+                return lease
+            if give_up_at is not None and time.monotonic() >= give_up_at:
+                return None
+            time.sleep(self.poll_interval)
@@ -0,0 +1,75 @@
+"""
+Process startup: the optional gunicorn preload path (see gunicorn.conf.py).
+
+With GUNICORN_PRELOAD the master imports the application, validates the
+settings and pays the one-off import and template compilation costs once;
+every worker, including the ones forked to replace a dead worker, starts
+from that state instead of importing Django from scratch. Nothing that
+holds a socket, a thread or a process pool is created before the fork:
+database connections are closed, and the HTTP sessions and the rendition
+pool are built lazily by each worker.
+"""
+import gc
+import logging
+import os
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Set by gunicorn.conf.py in the master, removed in each worker after the fork
+PRELOAD_ENV = 'GENERATOR_PRELOADED'
+
+# Templates the pages render on their first request
+WARM_TEMPLATES = (
+    'generator/base.html', 'generator/index.html', 'generator/gallery.html',
+    'generator/gallery_grid.html', 'generator/batch.html',
+)
+
+
+def preloading():
+    """True in a gunicorn master loading the application before forking its workers"""
+    return os.environ.get(PRELOAD_ENV) == 'true'
+
+
+def warm_process():
+    """Check the settings and do the one-off imports every worker would repeat"""
+    from django.core.checks import run_checks
+    from django.template.loader import get_template
+    from django.urls import get_resolver
+
+    for message in run_checks(tags=['generator']):
+        log = logger.error if message.is_serious() else logger.warning
+        log("%s", message)
+
+    # The URLconf imports the views, the engines and the inference client
+    get_resolver().url_patterns
+    for name in WARM_TEMPLATES:
+        get_template(name)
+
+    # Heavy dependencies the modules only import when first used
+    import PIL.Image  # noqa: F401
+    import requests  # noqa: F401
+
+    from .renditions import rendition_formats
+
+    rendition_formats()
+
+
+def prepare_fork():
+    """Drop what must not be shared with the children (called in the master)"""
+    from django.db import connections
+
+    connections.close_all()
+    # Keep the collector of the children off the preloaded objects, so it neither
+    # rescans them nor dirties the pages they share with the master
+    gc.freeze()
+
+
+def after_fork():
+    """Start what the master skipped while preloading (called in each worker)"""
+    os.environ.pop(PRELOAD_ENV, None)
+    if settings.GENERATION_WARMUP_ON_STARTUP:
+        from .apps import start_warmup
+
+        start_warmup()
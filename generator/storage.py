@@ -0,0 +1,234 @@
+"""
+Content-addressed blob storage for generated image bytes.
+
+Images are written once under their SHA-256 digest, so identical results are
+stored a single time and rows in the database only keep the key and a few
+bytes of metadata.
+"""
+import base64
+import hashlib
+import os
+import re
+import tempfile
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+
+from .imageinfo import HEADER_BYTES, MIME_TYPES, sniff_image
+
+KEY_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+@dataclass(frozen=True)
+class StoredImage:
+    """Metadata of an image written to the blob store"""
+    key: str
+    size: int
+    mime_type: str
+    width: int | None
+    height: int | None
+
+    def as_fields(self):
+        """Return the matching GeneratedImage field values"""
+        return {
+            'blob_key': self.key,
+            'byte_size': self.size,
+            'mime_type': self.mime_type,
+            'width': self.width,
+            'height': self.height,
+        }
+
+
+class BlobStore:
+    """Filesystem blob store keyed by the SHA-256 of the content"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, key):
+        """Return the on-disk path of a blob, sharded by key prefix"""
+        if not KEY_RE.match(key or ''):
+            raise ValueError(f"Invalid blob key: {key!r}")
+        return self.root / key[:2] / key[2:4] / key
+
+    def exists(self, key):
+        return self.path(key).exists()
+
+    def put(self, data):
+        """Write bytes to the store and return their key (no-op if already present)"""
+        key = hashlib.sha256(data).hexdigest()
+        path = self.path(key)
+        if path.exists():
+            _touch(path)
+            return key
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file in the same directory then rename, so readers
+        # never see a partially written blob.
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return key
+
+    def writer(self):
+        """Return a BlobWriter that streams a new blob into the store"""
+        return BlobWriter(self)
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def read(self, key):
+        with self.open(key) as f:
+            return f.read()
+
+    def size(self, key):
+        return self.path(key).stat().st_size
+
+    def delete(self, key):
+        try:
+            self.path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def keys(self):
+        """Yield (key, path) of every blob, one shard directory at a time"""
+        for shard in sorted(self.root.glob('??/??')):
+            for path in sorted(shard.iterdir()):
+                if KEY_RE.match(path.name):
+                    yield path.name, path
+
+
+def _touch(path):
+    # A blob written again is in use: push back its release by the retention
+    # sweep (see generator.retention.release_blobs)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+class BlobWriter:
+    """
+    Streams bytes into the store without holding them in memory.
+
+    Chunks go to a temp file while the SHA-256 is computed incrementally;
+    commit() moves the file under its key (or drops it if the blob already
+    exists) and returns the StoredImage metadata. Leaving the context without
+    committing discards the partial file.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._header = bytearray()
+        self.store.root.mkdir(parents=True, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=self.store.root, prefix='.tmp-')
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        if len(self._header) < HEADER_BYTES:
+            self._header += chunk[:HEADER_BYTES - len(self._header)]
+        return len(chunk)
+
+    def commit(self):
+        self._file.close()
+        key = self._hash.hexdigest()
+        path = self.store.path(key)
+        if path.exists():
+            os.unlink(self._tmp_path)
+            _touch(path)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self._tmp_path, path)
+        self._tmp_path = None
+
+        fmt, width, height = sniff_image(bytes(self._header))
+        if width is None:
+            with self.store.open(key) as f:
+                mime_type, width, height = describe_image(f)
+        else:
+            mime_type = MIME_TYPES[fmt]
+        return StoredImage(key=key, size=self.size, mime_type=mime_type, width=width, height=height)
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        if self._tmp_path and os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
+        self._tmp_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.abort()
+
+
+_blob_store = None
+
+
+def get_blob_store():
+    """Return the blob store configured by IMAGE_STORE_ROOT"""
+    global _blob_store
+    if _blob_store is None:
+        _blob_store = BlobStore(settings.IMAGE_STORE_ROOT)
+    return _blob_store
+
+
+def describe_image(data):
+    """Return (mime_type, width, height) read from the image header (bytes or a binary file)"""
+    header = data[:HEADER_BYTES] if isinstance(data, bytes) else data.read(HEADER_BYTES)
+    fmt, width, height = sniff_image(header)
+    if width is not None:
+        return MIME_TYPES[fmt], width, height
+
+    # Unknown container: let Pillow parse the header (pixel data is not decoded)
+    from PIL import Image
+
+    if not isinstance(data, bytes):
+        data.seek(0)
+    try:
+        with Image.open(BytesIO(data) if isinstance(data, bytes) else data) as image:
+            return Image.MIME.get(image.format, 'application/octet-stream'), image.width, image.height
+    except Exception:
+        return 'application/octet-stream', None, None
+
+
+def decode_data_url(data_url):
+    """Split a base64 data URL into (mime_type, bytes)"""
+    header, encoded = data_url.split(',', 1)
+    mime_type = header[len('data:'):].split(';', 1)[0] or 'application/octet-stream'
+    return mime_type, base64.b64decode(encoded)
+
+
+def store_image_bytes(data, store=None):
+    """Write image bytes to the blob store and return their StoredImage metadata"""
+    store = store or get_blob_store()
+    key = store.put(data)
+    mime_type, width, height = describe_image(data)
+    return StoredImage(key=key, size=len(data), mime_type=mime_type, width=width, height=height)
+
+
+def store_remote_image(url, timeout=30, store=None):
+    """Stream a remote image into the blob store once and return its StoredImage metadata"""
+    import requests
+
+    store = store or get_blob_store()
+    with requests.get(url, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        with store.writer() as writer:
+            for chunk in response.iter_content(64 * 1024):
+                writer.write(chunk)
+            return writer.commit()
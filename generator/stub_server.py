@@ -0,0 +1,103 @@
+"""
+Local stand-in for the Hugging Face inference endpoint.
+
+Used to exercise StableDiffusionService (sync and async paths), the job
+worker and the benchmarks without network access or inference quota. Point
+HUGGINGFACE_API_URL at it and set any HUGGINGFACE_API_KEY.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+
+def render_png(width, height):
+    """Return a solid PNG of the given size"""
+    from PIL import Image
+
+    buffered = BytesIO()
+    Image.new('RGB', (width, height), (64, 96, 160)).save(buffered, format='PNG')
+    return buffered.getvalue()
+
+
+class StubInferenceServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server answering POSTs with a PNG after a configurable delay.
+
+    ``loading_rate`` and ``error_rate`` are the fractions of requests answered
+    with a 503 "model loading" (carrying ``estimated_time``) and a 500.
+    """
+    daemon_threads = True
+    # Async servers open hundreds of connections at once (the default backlog is 5)
+    request_queue_size = 512
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, jitter=0.0,
+                 loading_rate=0.0, error_rate=0.0, estimated_time=1.0, image_size=64):
+        super().__init__(address, StubInferenceHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.loading_rate = loading_rate
+        self.error_rate = error_rate
+        self.estimated_time = estimated_time
+        self.image_bytes = render_png(image_size, image_size)
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/models/stub"
+
+    def start(self):
+        """Serve from a background thread and return self"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def handle_error(self, request, client_address):
+        # Clients that gave up (timeouts in tests and benchmarks) are expected
+        pass
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubInferenceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real endpoint
+
+    def do_GET(self):
+        self._send(200, b'{"loaded": true}', 'application/json')
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        with server._count_lock:
+            server.request_count += 1
+
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+
+        roll = random.random()
+        if roll < server.loading_rate:
+            body = json.dumps({'error': 'Model is currently loading', 'estimated_time': server.estimated_time})
+            self._send(503, body.encode(), 'application/json')
+        elif roll < server.loading_rate + server.error_rate:
+            self._send(500, b'{"error": "Injected failure"}', 'application/json')
+        else:
+            self._send(200, server.image_bytes, 'image/png')
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,88 @@
+"""
+Supervision of the generation worker next to the web server.
+
+Deployments that run a single command (the .replit deployment) cannot start
+the worker as its own service. With GENERATION_WORKER_SUPERVISED the
+gunicorn master (see gunicorn.conf.py) starts ``manage.py
+rungenerationworker`` as a separate process through a ProcessSupervisor,
+restarts it with a growing delay when it exits, and stops it on shutdown.
+Jobs of a worker that died are requeued by the next one (see
+jobs.requeue_stale_jobs).
+"""
+import logging
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from .resilience import ExponentialBackoff
+
+logger = logging.getLogger(__name__)
+
+WORKER_COMMAND = (sys.executable, str(Path(__file__).resolve().parent.parent / 'manage.py'), 'rungenerationworker')
+
+
+class ProcessSupervisor:
+    """
+    Keep one child process running.
+
+    A child that ran for at least min_uptime seconds is restarted at once;
+    one that keeps exiting early is restarted after an exponential backoff.
+    """
+
+    def __init__(self, command=WORKER_COMMAND, min_uptime=10.0, backoff=None, stop_timeout=30.0, cwd=None):
+        self.command = list(command)
+        self.min_uptime = min_uptime
+        self.backoff = backoff or ExponentialBackoff(base=1.0, cap=60.0, jitter=False)
+        self.stop_timeout = stop_timeout
+        self.cwd = cwd
+        self.restarts = 0
+        self.process = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start the child and its watcher thread; return self"""
+        self._thread = threading.Thread(target=self._watch, name='worker-supervisor', daemon=True)
+        self._thread.start()
+        return self
+
+    def _spawn(self):
+        with self._lock:
+            if self._stopping.is_set():
+                return None
+            self.process = subprocess.Popen(self.command, cwd=self.cwd)
+            return self.process
+
+    def _watch(self):
+        failures = 0
+        while not self._stopping.is_set():
+            started_at = time.monotonic()
+            process = self._spawn()
+            if process is None:
+                return
+            code = process.wait()
+            if self._stopping.is_set():
+                return
+            failures = 0 if time.monotonic() - started_at >= self.min_uptime else failures + 1
+            delay = self.backoff.delay(failures - 1) if failures else 0.0
+            logger.warning(f"Process {self.command} exited with code {code}, restarting in {delay:.1f}s")
+            self.restarts += 1
+            self._stopping.wait(delay)
+
+    def stop(self):
+        """Terminate the child (SIGTERM lets the worker finish its running jobs) and stop restarting it"""
+        with self._lock:
+            self._stopping.set()
+            process = self.process
+        if process is not None and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(self.stop_timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        if self._thread is not None:
+            self._thread.join(self.stop_timeout)
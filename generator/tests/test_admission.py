@@ -0,0 +1,95 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from generator.admission import Tenant, check_queue_capacity, check_rate_limit, take_tokens, tenant_for
+from generator.models import GenerationJob, RateLimitBucket
+
+
+class TenantTests(TestCase):
+    def request(self, **meta):
+        request = RequestFactory().post('/', REMOTE_ADDR='10.0.0.1', **meta)
+        request.user = AnonymousUser()
+        return request
+
+    def test_anonymous_client_is_its_address(self):
+        self.assertEqual(tenant_for(self.request()), Tenant('ip:10.0.0.1', '10.0.0.1'))
+
+    @override_settings(GENERATION_USER_WEIGHT=3)
+    def test_signed_in_user_is_weighted(self):
+        request = self.request()
+        request.user = User.objects.create_user('alice')
+        self.assertEqual(tenant_for(request), Tenant(f'user:{request.user.pk}', '10.0.0.1', 3))
+
+    def test_forwarded_address_needs_to_be_trusted(self):
+        request = self.request(HTTP_X_FORWARDED_FOR='203.0.113.9, 10.0.0.1')
+        self.assertEqual(tenant_for(request).key, 'ip:10.0.0.1')
+        with override_settings(RATE_LIMIT_TRUST_X_FORWARDED_FOR=True):
+            self.assertEqual(tenant_for(request).key, 'ip:203.0.113.9')
+
+
+@override_settings(
+    RATE_LIMIT_ENABLED=True, RATE_LIMIT_BURST=3, RATE_LIMIT_PER_MINUTE=6,
+    RATE_LIMIT_IP_BURST=4, RATE_LIMIT_IP_PER_MINUTE=60,
+)
+@mock.patch('generator.admission.random.random', return_value=1.0)
+class RateLimitTests(TestCase):
+    tenant = Tenant('session:abc', '10.0.0.1')
+
+    def test_burst_then_retry_after(self, _random):
+        for _ in range(3):
+            self.assertIsNone(check_rate_limit(self.tenant))
+        rejection = check_rate_limit(self.tenant)
+        # 6 per minute: one token every 10 seconds
+        self.assertEqual(rejection.retry_after, 10)
+
+    def test_tokens_refill_with_time(self, _random):
+        check_rate_limit(self.tenant, cost=3)
+        RateLimitBucket.objects.update(updated_at=timezone.now() - timedelta(seconds=20))
+        self.assertIsNone(check_rate_limit(self.tenant, cost=2))
+        self.assertIsNotNone(check_rate_limit(self.tenant))
+
+    def test_address_bucket_is_shared_by_its_tenants(self, _random):
+        for i in range(4):
+            self.assertIsNone(check_rate_limit(Tenant(f'session:{i}', '10.0.0.1')))
+        self.assertIsNotNone(check_rate_limit(Tenant('session:other', '10.0.0.1')))
+        self.assertIsNone(check_rate_limit(Tenant('session:other', '10.0.0.2')))
+
+    def test_rejected_request_charges_no_bucket(self, _random):
+        take_tokens([('ip:10.0.0.1', 4, 4, 1.0)])
+        self.assertIsNotNone(check_rate_limit(self.tenant))
+        self.assertFalse(RateLimitBucket.objects.filter(key=self.tenant.key).exists())
+
+    def test_cost_larger_than_the_burst_empties_a_full_bucket(self, _random):
+        self.assertIsNone(check_rate_limit(self.tenant, cost=10))
+        self.assertAlmostEqual(RateLimitBucket.objects.get(key=self.tenant.key).tokens, 0)
+
+    @override_settings(RATE_LIMIT_ENABLED=False)
+    def test_disabled(self, _random):
+        for _ in range(10):
+            self.assertIsNone(check_rate_limit(self.tenant))
+        self.assertFalse(RateLimitBucket.objects.exists())
+
+
+@override_settings(GENERATION_MAX_QUEUED=3, GENERATION_MAX_QUEUED_PER_TENANT=2)
+class QueueCapacityTests(TestCase):
+    def queue(self, tenant, count):
+        GenerationJob.objects.bulk_create(GenerationJob(prompt='p', tenant=tenant) for _ in range(count))
+
+    def test_per_tenant_cap(self):
+        self.queue('ip:a', 2)
+        self.assertIsNotNone(check_queue_capacity(Tenant('ip:a', 'a')))
+        self.assertIsNone(check_queue_capacity(Tenant('ip:b', 'b')))
+
+    def test_global_cap(self):
+        self.queue('ip:a', 1)
+        self.queue('ip:b', 2)
+        self.assertIsNotNone(check_queue_capacity(Tenant('ip:c', 'c')))
+
+    def test_finished_jobs_do_not_count(self):
+        self.queue('ip:a', 2)
+        GenerationJob.objects.update(status=GenerationJob.Status.SUCCEEDED)
+        self.assertIsNone(check_queue_capacity(Tenant('ip:a', 'a')))
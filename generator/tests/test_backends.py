@@ -0,0 +1,106 @@
+import os
+import unittest
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from generator import backends
+from generator.backends import ProceduralBackend, StubBackend, built_backends, get_backend, select_backend
+from stable_diffusion_service import BackendCapabilities
+
+ALL_ENGINES = ['huggingface', 'procedural', 'stub']
+
+
+class BackendCapabilitiesTests(SimpleTestCase):
+    def test_supports_checks_size_and_steps(self):
+        capabilities = BackendCapabilities(max_width=1024, max_height=768, default_steps=20, max_steps=50)
+        self.assertTrue(capabilities.supports(1024, 768))
+        self.assertFalse(capabilities.supports(1025, 768))
+        self.assertFalse(capabilities.supports(1024, 769))
+        self.assertTrue(capabilities.supports(512, 512, steps=50))
+        self.assertFalse(capabilities.supports(512, 512, steps=51))
+
+    def test_describe(self):
+        description = StubBackend(latency=0).describe()
+        self.assertEqual(description['name'], 'stub')
+        self.assertEqual(description['capabilities']['max_width'], 4096)
+        self.assertFalse(description['capabilities']['requires_network'])
+
+
+@override_settings(HUGGINGFACE_API_KEY=None, GENERATION_CACHE={'BACKEND': 'none'}, GENERATION_STUB_LATENCY=0)
+class SelectBackendTests(SimpleTestCase):
+    def setUp(self):
+        backends._forget_instances()
+        self.addCleanup(backends._forget_instances)
+        # No API key: the hosted engine cannot be built
+        patcher = mock.patch('stable_diffusion_service.stable_diffusion_service', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_engines_are_built_once_per_process(self):
+        self.assertIs(get_backend('stub'), get_backend('stub'))
+        self.assertEqual(set(built_backends()), {'stub'})
+
+    @override_settings(GENERATION_BACKEND_CANDIDATES=ALL_ENGINES)
+    def test_cheapest_engine_supporting_the_size_wins(self):
+        self.assertIsInstance(select_backend(1024, 1024), StubBackend)
+
+    @override_settings(GENERATION_BACKEND_CANDIDATES=['huggingface', 'procedural'])
+    def test_unbuildable_engines_are_skipped(self):
+        self.assertIsInstance(select_backend(1024, 1024), ProceduralBackend)
+        self.assertIsNone(select_backend(3000, 3000))
+
+    @override_settings(GENERATION_BACKEND_CANDIDATES=['procedural', 'stub'])
+    def test_unavailable_engines_are_skipped(self):
+        with mock.patch.object(StubBackend, 'is_available', return_value=False):
+            self.assertIsInstance(select_backend(), ProceduralBackend)
+
+    @override_settings(GENERATION_BACKEND_CANDIDATES=['procedural', 'stub'])
+    def test_size_limits_filter_the_candidates(self):
+        self.assertIsInstance(select_backend(3000, 3000), StubBackend)
+        self.assertIsInstance(select_backend(3000, 3000, steps=1), StubBackend)
+        self.assertIsNone(select_backend(512, 512, steps=30))
+
+    @override_settings(GENERATION_BACKEND_CANDIDATES=None, GENERATION_BACKEND='huggingface')
+    def test_raises_when_no_engine_can_be_built(self):
+        with self.assertRaises(ValueError):
+            select_backend()
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs os.fork')
+    def test_forked_child_builds_its_own_engines(self):
+        parent_backend = get_backend('stub')
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:  # child
+            try:
+                fresh = not built_backends() and get_backend('stub') is not parent_backend
+                os.write(write_end, b'1' if fresh else b'0')
+            finally:
+                os._exit(0)
+        os.close(write_end)
+        try:
+            result = os.read(read_end, 1)
+        finally:
+            os.close(read_end)
+            os.waitpid(pid, 0)
+        self.assertEqual(result, b'1')
+        # The parent keeps its engines
+        self.assertIs(get_backend('stub'), parent_backend)
+
+
+@override_settings(GENERATION_STUB_LATENCY=0)
+class LocalBackendTests(SimpleTestCase):
+    def test_procedural_images_are_deterministic(self):
+        backend = ProceduralBackend()
+        first = backend.generate_image('a red fox', width=64, height=64, seed=7)
+        self.assertEqual(first.format, 'png')
+        self.assertEqual(backend.generate_image('a red fox', width=64, height=64, seed=7).data, first.data)
+        self.assertNotEqual(backend.generate_image('a red fox', width=64, height=64, seed=8).data, first.data)
+
+    def test_unsupported_size_fails(self):
+        self.assertIsNone(ProceduralBackend().generate_image('a red fox', width=4096, height=4096))
+
+    def test_engines_never_share_cache_entries(self):
+        procedural = ProceduralBackend().request_key('a red fox', seed=1)
+        stub = StubBackend().request_key('a red fox', seed=1)
+        self.assertNotEqual(procedural, stub)
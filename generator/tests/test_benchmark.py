@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase
+
+from generator.benchmark import ScenarioStats, compare_results, percentile, run_scenario
+
+
+class PercentileTests(SimpleTestCase):
+    def test_interpolates_between_samples(self):
+        values = [1, 2, 3, 4]
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile(values, 50), 2.5)
+        self.assertEqual(percentile(values, 100), 4)
+        self.assertAlmostEqual(percentile(values, 95), 3.85)
+        self.assertIsNone(percentile([], 50))
+
+
+class ScenarioStatsTests(SimpleTestCase):
+    def test_summary(self):
+        stats = ScenarioStats('gallery')
+        stats.started_at, stats.finished_at = 10.0, 12.0
+        for latency, status, queries in ((0.1, 200, 3), (0.3, 200, 5), (0.2, 500, None)):
+            stats.record(latency, status, queries, ok=status == 200)
+        stats.record(1.0, ok=False)
+
+        summary = stats.summary()
+        self.assertEqual((summary['requests'], summary['errors'], summary['throughput_rps']), (4, 2, 2.0))
+        self.assertEqual(summary['latency_ms']['p50'], 250.0)
+        self.assertEqual(summary['latency_ms']['max'], 1000.0)
+        self.assertEqual(summary['db_queries'], {'mean': 4.0, 'max': 5})
+        self.assertEqual(summary['status_codes'], {'200': 2, '500': 1, 'error': 1})
+
+
+class RunScenarioTests(SimpleTestCase):
+    def test_every_request_is_sent_once(self):
+        seen = []
+
+        def make_request(client, index):
+            seen.append(index)
+            if index == 3:
+                raise requests.ConnectionError()
+            return SimpleNamespace(status_code=404 if index == 5 else 200, headers={'X-DB-Query-Count': '2'})
+
+        with mock.patch('generator.benchmark.BenchClient'):
+            stats = run_scenario('gallery', 'http://app', make_request, total=20, concurrency=4)
+
+        self.assertEqual(sorted(seen), list(range(20)))
+        summary = stats.summary()
+        self.assertEqual((summary['requests'], summary['errors']), (20, 2))
+        self.assertEqual(summary['status_codes'], {'200': 18, '404': 1, 'error': 1})
+        self.assertEqual(summary['db_queries']['mean'], 2)
+
+
+class CompareResultsTests(SimpleTestCase):
+    def test_flags_moves_of_more_than_ten_percent_the_wrong_way(self):
+        def run(rps, p95):
+            return {'scenarios': {'generate': {'throughput_rps': rps, 'latency_ms': {'p95': p95}}}}
+
+        rows = {row[1]: row for row in compare_results(run(100, 200), run(85, 210))}
+        self.assertEqual(rows['throughput_rps'][4:], (-15.0, True))
+        self.assertEqual(rows['latency_ms.p95'][4:], (5.0, False))
+        self.assertNotIn('latency_ms.p50', rows)
+        self.assertEqual(compare_results({'scenarios': {}}, run(1, 1)), [])
@@ -0,0 +1,123 @@
+import os
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from generator.cache import (
+    DiskBackend, DjangoCacheBackend, GenerationCache, MemoryLRUBackend, build_generation_cache,
+    generation_cache_key,
+)
+
+from .utils import IsolatedMediaMixin
+
+
+class GenerationCacheKeyTests(SimpleTestCase):
+    def test_whitespace_and_key_order_do_not_change_the_key(self):
+        a = generation_cache_key({'inputs': 'a  red\tfox ', 'parameters': {'width': 512, 'height': 512}})
+        b = generation_cache_key({'parameters': {'height': 512, 'width': 512}, 'inputs': 'a red fox'})
+        self.assertEqual(a, b)
+
+    def test_parameters_and_seed_change_the_key(self):
+        payload = {'inputs': 'a red fox', 'parameters': {'width': 512}}
+        keys = {
+            generation_cache_key(payload),
+            generation_cache_key(payload, seed=1),
+            generation_cache_key(payload, seed=2),
+            generation_cache_key({'inputs': 'a red fox', 'parameters': {'width': 768}}),
+        }
+        self.assertEqual(len(keys), 4)
+
+
+class MemoryLRUBackendTests(SimpleTestCase):
+    def test_least_recently_used_entry_is_evicted_first(self):
+        backend = MemoryLRUBackend(max_bytes=10, max_age=0)
+        backend.set('a', b'aaaa')
+        backend.set('b', b'bbbb')
+        backend.get('a')
+        backend.set('c', b'cccc')
+        self.assertEqual((backend.get('a'), backend.get('b'), backend.get('c')), (b'aaaa', None, b'cccc'))
+        self.assertEqual(backend.evictions, 1)
+
+    def test_entries_larger_than_the_cache_are_not_stored(self):
+        backend = MemoryLRUBackend(max_bytes=4, max_age=0)
+        backend.set('a', b'12345')
+        self.assertIsNone(backend.get('a'))
+
+    def test_expired_entries_are_dropped(self):
+        backend = MemoryLRUBackend(max_bytes=100, max_age=60)
+        backend.set('a', b'data')
+        with mock.patch('generator.cache.time.time', return_value=time.time() + 61):
+            self.assertIsNone(backend.get('a'))
+        self.assertEqual(backend._size, 0)
+
+    def test_replacing_an_entry_keeps_the_size_right(self):
+        backend = MemoryLRUBackend(max_bytes=100, max_age=0)
+        backend.set('a', b'1234')
+        backend.set('a', b'12')
+        self.assertEqual(backend._size, 2)
+        backend.delete('a')
+        self.assertEqual(backend._size, 0)
+
+
+class DiskBackendTests(IsolatedMediaMixin, SimpleTestCase):
+    def backend(self, max_bytes=100, max_age=0):
+        return DiskBackend(Path(self.media_root) / 'cache', max_bytes, max_age)
+
+    def test_round_trip_is_shared_between_instances(self):
+        self.backend().set('ab12', b'data')
+        self.assertEqual(self.backend().get('ab12'), b'data')
+        self.assertEqual(list((Path(self.media_root) / 'cache').glob('*/*')), [Path(self.media_root) / 'cache/ab/ab12'])
+
+    def test_least_recently_read_files_are_evicted(self):
+        backend = self.backend(max_bytes=10)
+        backend.set('aa', b'aaaa')
+        backend.set('bb', b'bbbb')
+        # 'aa' was read longest ago
+        for key, atime in (('aa', 1000), ('bb', 2000)):
+            path = backend._path(key)
+            os.utime(path, (atime, path.stat().st_mtime))
+        backend.set('cc', b'cccc')
+        self.assertEqual((backend.get('aa'), backend.get('bb'), backend.get('cc')), (None, b'bbbb', b'cccc'))
+        self.assertEqual(backend.evictions, 1)
+
+    def test_expired_files_are_dropped(self):
+        backend = self.backend(max_age=60)
+        backend.set('aa', b'data')
+        path = backend._path('aa')
+        os.utime(path, (time.time(), time.time() - 120))
+        self.assertIsNone(backend.get('aa'))
+        self.assertFalse(path.exists())
+
+    def test_clear_removes_every_entry(self):
+        backend = self.backend()
+        backend.set('aa', b'1')
+        backend.set('bb', b'2')
+        backend.clear()
+        self.assertEqual((backend.get('aa'), backend.get('bb')), (None, None))
+
+
+class GenerationCacheTests(IsolatedMediaMixin, SimpleTestCase):
+    def test_counts_hits_and_misses(self):
+        cache = GenerationCache(MemoryLRUBackend(100, 0))
+        cache.get('a')
+        cache.set('a', b'data')
+        self.assertEqual(cache.get('a'), b'data')
+        self.assertEqual(cache.stats(), {'backend': 'MemoryLRUBackend', 'hits': 1, 'misses': 1, 'evictions': 0})
+
+    def test_build_from_settings(self):
+        self.assertIsNone(build_generation_cache({'BACKEND': 'none'}))
+        self.assertIsInstance(build_generation_cache({'BACKEND': 'Memory'}).backend, MemoryLRUBackend)
+        disk = build_generation_cache({'BACKEND': 'disk', 'LOCATION': self.media_root})
+        self.assertIsInstance(disk.backend, DiskBackend)
+        django = build_generation_cache({'BACKEND': 'django', 'MAX_AGE': 0})
+        self.assertIsInstance(django.backend, DjangoCacheBackend)
+        self.assertIsNone(django.backend.max_age)
+        with self.assertRaises(ValueError):
+            build_generation_cache({'BACKEND': 'redis'})
+
+    def test_django_backend_round_trip(self):
+        cache = build_generation_cache({'BACKEND': 'django'})
+        cache.set('a', b'data')
+        self.assertEqual(cache.get('a'), b'data')
@@ -0,0 +1,116 @@
+import io
+import json
+import struct
+import tarfile
+import zipfile
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from generator.export import MANIFEST_NAME, ZipStream, export_archive, export_queryset
+from generator.models import GeneratedImage
+from generator.storage import get_blob_store
+
+from .utils import IsolatedMediaMixin, png_bytes
+
+
+def build_zip(entries, stream=None):
+    stream = stream or ZipStream()
+    chunks = []
+    for name, data in entries:
+        chunks.extend(stream.add(name, iter([data]), len(data), 1700000000))
+    chunks.extend(stream.close())
+    return b''.join(chunks)
+
+
+class ExportArchiveTests(IsolatedMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.red, self.blue = png_bytes(color=(255, 0, 0)), png_bytes(color=(0, 0, 255))
+        store = get_blob_store()
+        self.images = [
+            GeneratedImage.objects.create(prompt='red', blob_key=store.put(self.red), mime_type='image/png'),
+            GeneratedImage.objects.create(prompt='blue', blob_key=store.put(self.blue), mime_type='image/png'),
+            GeneratedImage.objects.create(prompt='legacy', image_url='https://example.com/legacy.png'),
+        ]
+
+    def export(self, archive_format, ids=None):
+        return b''.join(export_archive(export_queryset(ids), archive_format, chunk_size=1))
+
+    def check_manifest(self, manifest):
+        lines = [json.loads(line) for line in manifest.decode().splitlines()]
+        self.assertEqual([line['id'] for line in lines], [image.pk for image in self.images])
+        self.assertEqual(lines[0]['file'], f'images/red_{self.images[0].pk}.png')
+        self.assertEqual(lines[0]['sha256'], self.images[0].blob_key)
+        self.assertIsNone(lines[2]['file'])
+        self.assertEqual(lines[2]['source_url'], 'https://example.com/legacy.png')
+
+    def test_zip(self):
+        with zipfile.ZipFile(io.BytesIO(self.export('zip'))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), [
+                f'images/red_{self.images[0].pk}.png', f'images/blue_{self.images[1].pk}.png', MANIFEST_NAME,
+            ])
+            self.assertEqual(archive.read(f'images/blue_{self.images[1].pk}.png'), self.blue)
+            self.assertEqual(archive.getinfo(MANIFEST_NAME).compress_type, zipfile.ZIP_DEFLATED)
+            self.check_manifest(archive.read(MANIFEST_NAME))
+
+    def test_tar(self):
+        data = self.export('tar')
+        self.assertEqual(len(data) % tarfile.RECORDSIZE, 0)
+        with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+            self.assertEqual(len(archive.getnames()), 3)
+            self.assertEqual(archive.extractfile(f'images/red_{self.images[0].pk}.png').read(), self.red)
+            self.check_manifest(archive.extractfile(MANIFEST_NAME).read())
+
+    def test_blob_missing_from_the_store_is_only_in_the_manifest(self):
+        get_blob_store().delete(self.images[1].blob_key)
+        with zipfile.ZipFile(io.BytesIO(self.export('zip'))) as archive:
+            self.assertEqual(len(archive.namelist()), 2)
+            lines = archive.read(MANIFEST_NAME).decode().splitlines()
+            self.assertIsNone(json.loads(lines[1])['file'])
+
+    def test_view_exports_the_selection(self):
+        url = reverse('export_gallery') + f'?ids={self.images[1].pk}'
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(archive.namelist(), [f'images/blue_{self.images[1].pk}.png', MANIFEST_NAME])
+        self.assertEqual(self.client.get(reverse('export_gallery') + '?format=rar').status_code, 400)
+
+
+class ZipStreamTests(SimpleTestCase):
+    def test_utf8_names_and_empty_entries(self):
+        with zipfile.ZipFile(io.BytesIO(build_zip([('images/été.png', b'x' * 100), ('empty', b'')]))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.read('images/été.png'), b'x' * 100)
+            self.assertEqual(archive.read('empty'), b'')
+
+    def test_zip64_end_records_past_65535_entries(self):
+        count = 0x10000
+        data = build_zip((f'{i}', b'') for i in range(count))
+        self.assertIn(struct.pack('<I', 0x06064b50), data[-200:])
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            self.assertEqual(len(archive.infolist()), count)
+            self.assertEqual(archive.infolist()[-1].filename, f'{count - 1}')
+
+    def test_zip64_offsets_past_4_gib(self):
+        # Pretend 5 GiB were written before: only the offsets matter here
+        stream = ZipStream()
+        stream._offset = 5 << 30
+        data = build_zip([('late', b'data')], stream)
+
+        directory = data.index(struct.pack('<I', 0x02014b50))
+        (version_needed,) = struct.unpack_from('<H', data, directory + 6)
+        (header_offset,) = struct.unpack_from('<I', data, directory + 42)
+        name_length, extra_length = struct.unpack_from('<HH', data, directory + 28)
+        extra = data[directory + 46 + name_length:directory + 46 + name_length + extra_length]
+        self.assertEqual((version_needed, header_offset), (45, 0xFFFFFFFF))
+        self.assertEqual(struct.unpack('<HHQ', extra), (0x0001, 8, 5 << 30))
+
+        zip64_end = data.index(struct.pack('<I', 0x06064b50))
+        count, _, _, offset = struct.unpack_from('<QQQQ', data, zip64_end + 24)
+        self.assertEqual((count, offset), (1, (5 << 30) + directory))
+        end = data.index(struct.pack('<I', 0x06054b50))
+        (end_offset,) = struct.unpack_from('<I', data, end + 16)
+        self.assertEqual(end_offset, 0xFFFFFFFF)
@@ -0,0 +1,111 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from generator import jobs
+from generator.jobs import _lock_claims, claim_next_job, requeue_stale_jobs
+from generator.models import GenerationJob
+
+
+def queue(tenant, count, weight=1, start=0):
+    now = timezone.now()
+    for i in range(count):
+        GenerationJob.objects.create(
+            prompt=f'{tenant} {i}', tenant=tenant, weight=weight, created_at=now + timedelta(seconds=start + i),
+        )
+
+
+@override_settings(GENERATION_MAX_RUNNING=0)
+class FairShareClaimTests(TestCase):
+    def claimed_tenants(self, count):
+        return [claim_next_job('test').tenant for _ in range(count)]
+
+    def test_tenants_alternate(self):
+        queue('alice', 5)
+        queue('bob', 2, start=10)
+        self.assertEqual(self.claimed_tenants(4), ['alice', 'bob', 'alice', 'bob'])
+        self.assertEqual(self.claimed_tenants(3), ['alice', 'alice', 'alice'])
+        self.assertIsNone(claim_next_job('test'))
+
+    def test_weight_gives_more_slots(self):
+        queue('user', 4, weight=2)
+        queue('guest', 4, start=10)
+        self.assertEqual(self.claimed_tenants(3), ['user', 'guest', 'user'])
+
+    def test_jobs_of_a_tenant_run_in_order(self):
+        queue('alice', 3)
+        self.assertEqual([claim_next_job('test').prompt for _ in range(3)], ['alice 0', 'alice 1', 'alice 2'])
+
+    def test_claimed_job_is_running(self):
+        queue('alice', 1)
+        job = claim_next_job('worker-1')
+        self.assertEqual((job.status, job.worker, job.attempts), (GenerationJob.Status.RUNNING, 'worker-1', 1))
+
+    @override_settings(GENERATION_MAX_RUNNING=2)
+    def test_global_cap(self):
+        queue('alice', 3)
+        queue('bob', 3, start=10)
+        self.assertEqual(len(self.claimed_tenants(2)), 2)
+        self.assertIsNone(claim_next_job('test'))
+
+
+class ClaimLockTests(TestCase):
+    def lock_statements(self, options):
+        with mock.patch.dict(connection.settings_dict, OPTIONS=options), CaptureQueriesContext(connection) as queries:
+            _lock_claims()
+        return [query['sql'] for query in queries]
+
+    def test_immediate_transactions_need_no_extra_lock(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("SQLite only")
+        self.assertEqual(self.lock_statements({'transaction_mode': 'IMMEDIATE'}), [])
+
+    def test_deferred_transactions_take_the_write_lock(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("SQLite only")
+        statements = self.lock_statements({})
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('UPDATE generator_generationjob'))
+
+
+@override_settings(GENERATION_JOB_MAX_ATTEMPTS=3)
+class RequeueStaleJobsTests(TestCase):
+    def running(self, minutes_ago, attempts=1):
+        return GenerationJob.objects.create(
+            prompt='a red fox', status=GenerationJob.Status.RUNNING, worker='dead:1', attempts=attempts,
+            started_at=timezone.now() - timedelta(minutes=minutes_ago),
+        )
+
+    def test_stale_jobs_are_requeued(self):
+        stale, recent = self.running(20), self.running(1)
+        self.assertEqual(requeue_stale_jobs(600), 1)
+        stale.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual((stale.status, stale.worker), (GenerationJob.Status.QUEUED, ''))
+        self.assertEqual(recent.status, GenerationJob.Status.RUNNING)
+
+    def test_jobs_out_of_attempts_are_failed(self):
+        job = self.running(20, attempts=3)
+        self.assertEqual(requeue_stale_jobs(600), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.Status.FAILED)
+        self.assertEqual(job.error, 'Generation abandoned after 3 attempts')
+        self.assertIsNotNone(job.finished_at)
+
+    def test_jobs_running_in_this_process_are_not_stale(self):
+        job = self.running(20)
+        with mock.patch.object(jobs, '_running', {job.id}):
+            self.assertEqual(requeue_stale_jobs(600), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.Status.RUNNING)
+
+    def test_requeued_job_is_claimed_again(self):
+        job = self.running(20)
+        requeue_stale_jobs(600)
+        with override_settings(GENERATION_MAX_RUNNING=0):
+            claimed = claim_next_job('worker:2')
+        self.assertEqual((claimed.id, claimed.attempts), (job.id, 2))
@@ -0,0 +1,108 @@
+import os
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from generator import metrics
+from generator.middleware import ProfilingMiddleware
+
+from .utils import IsolatedMediaMixin
+
+
+class CollectTests(IsolatedMediaMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = Path(self.media_root) / 'metrics'
+        self.directory.mkdir()
+
+    def write(self, name, value, age=0):
+        path = self.directory / name
+        path.write_text(metrics.json.dumps({
+            'test_total': {'type': 'counter', 'help': '', 'labelnames': [], 'samples': [[[], value]]},
+        }))
+        if age:
+            mtime = time.time() - age
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def total(self):
+        return metrics.collect()['test_total']['samples'][()]
+
+    def test_sums_live_processes(self):
+        self.write(f'{metrics.socket.gethostname()}-{os.getppid()}.json', 2)
+        self.write('other-host-12.json', 3)
+        self.assertEqual(self.total(), 5)
+
+    def test_drops_dead_processes_of_this_host(self):
+        live = self.write(f'{metrics.socket.gethostname()}-{os.getppid()}.json', 2)
+        with mock.patch.object(metrics, '_pid_alive', side_effect=lambda pid: pid == os.getppid()):
+            dead = self.write(f'{metrics.socket.gethostname()}-999999.json', 7)
+            self.assertEqual(self.total(), 2)
+        self.assertTrue(live.exists())
+        self.assertFalse(dead.exists())
+
+    @override_settings(METRICS_SNAPSHOT_MAX_AGE=60)
+    def test_drops_snapshots_no_longer_written(self):
+        stale = self.write('other-host-12.json', 3, age=120)
+        self.write('other-host-13.json', 4, age=30)
+        self.assertEqual(self.total(), 4)
+        self.assertFalse(stale.exists())
+
+    def test_process_removes_its_snapshot_at_exit(self):
+        metrics.REGISTRY.flush()
+        own = self.directory / metrics._snapshot_name(os.getpid())
+        self.assertTrue(own.exists())
+        metrics.REGISTRY.discard()
+        self.assertFalse(own.exists())
+
+
+@override_settings(PROFILING_TOKEN='secret')
+class ProfilingMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.middleware = ProfilingMiddleware(lambda request: HttpResponse('page'))
+        self.factory = RequestFactory()
+
+    def get(self, path='/', **headers):
+        return self.middleware(self.factory.get(path, headers=headers))
+
+    def test_profiles_with_the_token(self):
+        response = self.get(x_profile='secret')
+        self.assertIn(b'function calls', response.content)
+
+    def test_wrong_or_missing_token_is_not_profiled(self):
+        self.assertEqual(self.get(x_profile='guess').content, b'page')
+        self.assertEqual(self.get().content, b'page')
+
+    @override_settings(PROFILING_TOKEN='')
+    def test_nothing_is_profiled_without_a_token(self):
+        self.assertEqual(self.get(x_profile='1').content, b'page')
+
+    def test_sort_key(self):
+        self.assertEqual(self.get('/?profile_sort=tottime', x_profile='secret').status_code, 200)
+        self.assertEqual(self.get('/?profile_sort=calls', x_profile='secret').status_code, 200)
+        self.assertEqual(self.get('/?profile_sort=nope', x_profile='secret').status_code, 400)
+
+
+class MetricsEndpointTests(IsolatedMediaMixin, TestCase):
+    def scrape(self, **headers):
+        return self.client.get(reverse('metrics'), headers=headers)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_is_required(self):
+        self.assertEqual(self.scrape().status_code, 401)
+        self.assertEqual(self.scrape(authorization='Bearer wrong').status_code, 401)
+        response = self.scrape(authorization='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'generation_jobs', response.content)
+
+    @override_settings(METRICS_TOKEN='', DEBUG=False)
+    def test_closed_without_a_token(self):
+        self.assertEqual(self.scrape().status_code, 403)
+
+    @override_settings(METRICS_TOKEN='', DEBUG=True)
+    def test_open_in_development_without_a_token(self):
+        self.assertEqual(self.scrape().status_code, 200)
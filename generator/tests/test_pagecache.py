@@ -0,0 +1,73 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from generator import pagecache
+from generator.models import GeneratedImage
+from generator.pagecache import deferred_invalidation, gallery_version
+
+PAGE_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pagecache-tests'},
+}
+
+
+@override_settings(CACHES=PAGE_CACHES, PAGE_CACHE_ALIAS='pages')
+class PageCacheTests(TestCase):
+    def setUp(self):
+        pagecache.page_cache().clear()
+
+    def test_saving_or_deleting_an_image_changes_the_gallery_version(self):
+        version = gallery_version()
+        self.assertEqual(gallery_version(), version)
+
+        image = GeneratedImage.objects.create(prompt='a red fox')
+        saved = gallery_version()
+        self.assertNotEqual(saved, version)
+
+        image.delete()
+        self.assertNotEqual(gallery_version(), saved)
+
+    def test_deferred_invalidation_applies_a_single_invalidation(self):
+        version = gallery_version()
+        cache = pagecache.page_cache()
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            with deferred_invalidation():
+                for i in range(3):
+                    GeneratedImage.objects.create(prompt=f'a red fox {i}')
+                self.assertEqual(gallery_version(), version)
+        self.assertEqual(cache_set.call_count, 1)
+        self.assertNotEqual(gallery_version(), version)
+
+    def test_deferred_invalidation_without_changes_keeps_the_version(self):
+        version = gallery_version()
+        with deferred_invalidation():
+            pass
+        self.assertEqual(gallery_version(), version)
+
+    def test_repeat_gallery_request_is_not_modified(self):
+        GeneratedImage.objects.create(prompt='a red fox')
+        # The first visit sets the CSRF cookie, which is part of the tag
+        self.client.get(reverse('gallery'))
+        response = self.client.get(reverse('gallery'))
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        repeat = self.client.get(reverse('gallery'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(repeat.content, b'')
+
+        # A new image changes the gallery, hence the tag
+        GeneratedImage.objects.create(prompt='a blue whale')
+        changed = self.client.get(reverse('gallery'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertContains(changed, 'a blue whale')
+
+    def test_search_parameters_have_their_own_tag(self):
+        self.client.get(reverse('gallery'))
+        first = self.client.get(reverse('gallery'))
+        searched = self.client.get(reverse('gallery'), {'q': 'fox'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(searched.status_code, 200)
+        self.assertNotEqual(searched['ETag'], first['ETag'])
@@ -0,0 +1,61 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from generator.models import GeneratedImage
+from generator.pagination import decode_cursor, encode_cursor, paginate_newest_first
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now() - timedelta(days=1)
+        # Two rows share each timestamp, so the id has to break the ties
+        cls.images = [
+            GeneratedImage.objects.create(prompt=f"image {i}", created_at=start + timedelta(minutes=i // 2))
+            for i in range(7)
+        ]
+        cls.newest_first = sorted(cls.images, key=lambda image: (image.created_at, image.pk), reverse=True)
+
+    def walk_older(self, page_size):
+        pages = []
+        page = paginate_newest_first(GeneratedImage.objects.all(), page_size)
+        pages.append(page)
+        while page.older_cursor:
+            page = paginate_newest_first(GeneratedImage.objects.all(), page_size, before=page.older_cursor)
+            pages.append(page)
+        return pages
+
+    def test_cursor_round_trip(self):
+        image = self.images[3]
+        self.assertEqual(decode_cursor(encode_cursor(image)), (image.created_at, image.pk))
+
+    def test_malformed_cursors_decode_to_none(self):
+        for cursor in ('', 'not base64!', 'Zm9v', encode_cursor(self.images[0])[:-3] + 'xyz'):
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decode_cursor(cursor))
+
+    def test_walking_older_visits_every_row_once_in_order(self):
+        pages = self.walk_older(3)
+        self.assertEqual([len(page.items) for page in pages], [3, 3, 1])
+        self.assertEqual([image for page in pages for image in page.items], self.newest_first)
+        self.assertIsNone(pages[0].newer_cursor)
+        self.assertIsNotNone(pages[1].newer_cursor)
+        self.assertIsNone(pages[-1].older_cursor)
+
+    def test_walking_newer_returns_the_previous_page(self):
+        pages = self.walk_older(3)
+        back = paginate_newest_first(GeneratedImage.objects.all(), 3, after=pages[2].newer_cursor)
+        self.assertEqual(back.items, pages[1].items)
+        first = paginate_newest_first(GeneratedImage.objects.all(), 3, after=back.newer_cursor)
+        self.assertEqual(first.items, pages[0].items)
+        self.assertIsNone(first.newer_cursor)
+
+    def test_malformed_cursor_starts_from_the_newest_row(self):
+        page = paginate_newest_first(GeneratedImage.objects.all(), 2, before='garbage')
+        self.assertEqual(page.items, self.newest_first[:2])
+
+    def test_page_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            paginate_newest_first(GeneratedImage.objects.all(), 3, before=encode_cursor(self.images[4]))
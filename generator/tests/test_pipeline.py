@@ -0,0 +1,60 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from generator import pipeline
+from generator.models import GeneratedImage
+from generator.singleflight import LeaseTable
+
+from .utils import IsolatedMediaMixin, png_bytes
+
+
+class FakeService:
+    """Generation engine writing a fixed PNG"""
+
+    def __init__(self):
+        self.calls = 0
+        self.seeds = []
+
+    def request_key(self, prompt, negative_prompt=None, seed=None):
+        return f'{prompt}|{negative_prompt}|{seed}'.encode().hex()[:64]
+
+    def generate_image(self, prompt, negative_prompt=None, seed=None, use_cache=True, sink=None, **options):
+        self.calls += 1
+        self.seeds.append(seed)
+        sink.write(png_bytes(color=(self.calls, 0, 0)))
+        return True
+
+    def is_available(self):
+        return True
+
+
+@override_settings(GENERATION_COALESCE=True)
+class CoalescingTests(IsolatedMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = FakeService()
+        patcher = mock.patch.object(pipeline, 'get_service', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        mock.patch.object(pipeline, 'schedule_renditions').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_finished_lease_is_shared(self):
+        first = pipeline.generate_and_store('a red fox')
+        second = pipeline.generate_and_store('a red fox')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(self.service.calls, 1)
+
+    def test_fresh_requests_are_not_coalesced(self):
+        first = pipeline.generate_and_store('a red fox')
+        fresh = pipeline.generate_and_store('a red fox', use_cache=False)
+        self.assertNotEqual(first.pk, fresh.pk)
+        self.assertEqual(self.service.calls, 2)
+        self.assertEqual(GeneratedImage.objects.count(), 2)
+
+    def test_fresh_request_does_not_wait_for_an_in_flight_generation(self):
+        key = self.service.request_key('a red fox')
+        self.assertIsNotNone(LeaseTable().acquire(key))  # Held by another process
+        image = pipeline.generate_and_store('a red fox', use_cache=False)
+        self.assertIsNotNone(image.pk)
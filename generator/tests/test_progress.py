@@ -0,0 +1,124 @@
+import asyncio
+import json
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from generator.models import GeneratedImage, GenerationJob
+from generator.progress import ajob_events, job_events, websocket_job_events
+
+Status = GenerationJob.Status
+
+
+def sse_events(content):
+    """Payloads of the 'job' events of a server-sent event stream"""
+    return [json.loads(line[len('data: '):]) for line in content.decode().splitlines() if line.startswith('data: ')]
+
+
+@override_settings(JOB_EVENTS_POLL_INTERVAL=0.01, JOB_EVENTS_MAX_DURATION=5)
+class JobEventsTests(TestCase):
+    def setUp(self):
+        self.job = GenerationJob.objects.create(prompt='a red fox')
+
+    def update(self, **fields):
+        GenerationJob.objects.filter(id=self.job.id).update(**fields)
+
+    async def aupdate(self, **fields):
+        await GenerationJob.objects.filter(id=self.job.id).aupdate(**fields)
+
+    def test_queued_running_succeeded(self):
+        events = job_events(self.job.id)
+        self.assertEqual(next(events)['status'], Status.QUEUED)
+
+        self.update(status=Status.RUNNING, loading_eta=timezone.now() + timedelta(seconds=20))
+        running = next(events)
+        self.assertEqual(running['status'], Status.RUNNING)
+        self.assertAlmostEqual(running['loading_eta_seconds'], 20, delta=1)
+
+        image = GeneratedImage.objects.create(prompt='a red fox')
+        self.update(status=Status.SUCCEEDED, image=image)
+        done = next(events)
+        self.assertEqual(done['status'], Status.SUCCEEDED)
+        self.assertEqual(done['image']['id'], image.id)
+        self.assertEqual(done['image']['url'], reverse('image_file', args=[image.id]))
+        self.assertEqual(list(events), [])
+
+    def test_failed_job_carries_its_error(self):
+        events = job_events(self.job.id)
+        next(events)
+        self.update(status=Status.FAILED, error='Image generation failed')
+        failed = next(events)
+        self.assertEqual(failed['status'], Status.FAILED)
+        self.assertEqual(failed['error'], 'Image generation failed')
+        self.assertIsNone(failed['image'])
+        self.assertEqual(list(events), [])
+
+    def test_unknown_job_has_no_events(self):
+        self.assertEqual(list(job_events(uuid.uuid4())), [])
+
+    def test_async_events_follow_the_same_transitions(self):
+        async def collect():
+            payloads = []
+            async for payload in ajob_events(self.job.id):
+                payloads.append(payload['status'])
+                if payload['status'] == Status.QUEUED:
+                    await self.aupdate(status=Status.RUNNING)
+                elif payload['status'] == Status.RUNNING:
+                    await self.aupdate(status=Status.FAILED, error='Image generation failed')
+            return payloads
+
+        self.assertEqual(async_to_sync(collect)(), [Status.QUEUED, Status.RUNNING, Status.FAILED])
+
+    def test_sse_view_streams_job_events(self):
+        self.update(status=Status.FAILED, error='Image generation failed')
+        response = self.client.get(reverse('job_events', args=[self.job.id]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith(b'retry: '))
+        self.assertIn(b'event: job\n', content)
+        self.assertEqual([event['status'] for event in sse_events(content)], [Status.FAILED])
+
+    def test_sse_view_404_for_an_unknown_job(self):
+        self.assertEqual(self.client.get(reverse('job_events', args=[uuid.uuid4()])).status_code, 404)
+
+    def websocket(self, path, on_message=None):
+        """Run the WebSocket handler on path and return the messages it sent"""
+        sent = []
+
+        async def receive():
+            if not sent:
+                return {'type': 'websocket.connect'}
+            await self.never.wait()
+
+        async def send(message):
+            sent.append(message)
+            if on_message and message['type'] == 'websocket.send':
+                await on_message(json.loads(message['text']))
+
+        async def run():
+            self.never = asyncio.Event()
+            await websocket_job_events({'type': 'websocket', 'path': path}, receive, send)
+
+        async_to_sync(run)()
+        return sent
+
+    def test_websocket_streams_until_the_job_finishes(self):
+        async def advance(payload):
+            if payload['status'] == Status.QUEUED:
+                await self.aupdate(status=Status.RUNNING)
+            elif payload['status'] == Status.RUNNING:
+                await self.aupdate(status=Status.SUCCEEDED)
+
+        sent = self.websocket(f'/ws/jobs/{self.job.id}/', advance)
+        self.assertEqual(sent[0], {'type': 'websocket.accept'})
+        statuses = [json.loads(message['text'])['status'] for message in sent[1:-1]]
+        self.assertEqual(statuses, [Status.QUEUED, Status.RUNNING, Status.SUCCEEDED])
+        self.assertEqual(sent[-1], {'type': 'websocket.close', 'code': 1000})
+
+    def test_websocket_rejects_unknown_paths(self):
+        self.assertEqual(self.websocket('/ws/jobs/nope/'), [{'type': 'websocket.close', 'code': 4404}])
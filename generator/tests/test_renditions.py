@@ -0,0 +1,73 @@
+import base64
+
+from django.test import SimpleTestCase, TestCase
+
+from generator.models import GeneratedImage
+from generator.pagecache import gallery_version
+from generator.renditions import _BASE83, blurhash_encode, placeholders, save_placeholders
+
+from .utils import IsolatedMediaMixin
+
+
+class SavePlaceholdersTests(IsolatedMediaMixin, TestCase):
+    def test_records_placeholders_and_invalidates_the_gallery(self):
+        image = GeneratedImage.objects.create(prompt='a fox', blob_key='a' * 64)
+        version = gallery_version()
+
+        save_placeholders({'a' * 64: {'blurhash': 'LEHV6nWB2yk8', 'lqip': 'data:image/webp;base64,AA'}})
+
+        image.refresh_from_db()
+        self.assertEqual(image.blurhash, 'LEHV6nWB2yk8')
+        self.assertIsNotNone(image.renditions_at)
+        self.assertNotEqual(gallery_version(), version)
+
+    def test_failed_renders_leave_the_gallery_cache_alone(self):
+        GeneratedImage.objects.create(prompt='a fox', blob_key='a' * 64)
+        version = gallery_version()
+        save_placeholders({'a' * 64: None, 'b' * 64: {'blurhash': 'x', 'lqip': ''}})
+        self.assertEqual(gallery_version(), version)
+
+
+def decode83(text):
+    value = 0
+    for char in text:
+        value = value * 83 + _BASE83.index(char)
+    return value
+
+
+class BlurHashTests(SimpleTestCase):
+    def image(self, size, color):
+        from PIL import Image
+
+        return Image.new('RGB', size, color)
+
+    def test_solid_color(self):
+        blurhash = blurhash_encode(self.image((8, 8), (255, 128, 0)))
+        # Size flag of 4x3 components, maximum AC value, the color as DC, then 11 AC components
+        self.assertEqual(len(blurhash), 6 + 2 * 11)
+        self.assertEqual(blurhash[0], 'L')
+        self.assertEqual(decode83(blurhash[2:6]), 0xFF8000)
+        self.assertEqual(blurhash_encode(self.image((8, 8), (255, 128, 0)), 1, 1), '00' + blurhash[2:6])
+
+    def test_average_color_and_detail(self):
+        from PIL import Image
+
+        image = Image.new('RGB', (16, 16), (0, 0, 0))
+        image.paste((255, 255, 255), (8, 0, 16, 16))
+        blurhash = blurhash_encode(image)
+        # The DC is the mean in linear light: lighter than the sRGB midpoint
+        r, g, b = (decode83(blurhash[2:6]) >> shift & 0xFF for shift in (16, 8, 0))
+        self.assertEqual(r, g)
+        self.assertEqual(g, b)
+        self.assertAlmostEqual(r, 188, delta=1)
+        # The black/white split carries far more detail than a flat image
+        self.assertGreater(decode83(blurhash[1]), decode83(blurhash_encode(self.image((16, 16), 'gray'))[1]))
+
+    def test_placeholders_follow_the_orientation(self):
+        landscape = placeholders(self.image((64, 32), 'blue'))
+        portrait = placeholders(self.image((32, 64), 'blue'))
+        self.assertEqual(landscape['blurhash'][0], _BASE83[3 + 2 * 9])
+        self.assertEqual(portrait['blurhash'][0], _BASE83[2 + 3 * 9])
+        prefix = 'data:image/webp;base64,'
+        self.assertTrue(landscape['lqip'].startswith(prefix))
+        self.assertEqual(base64.b64decode(landscape['lqip'][len(prefix):])[8:12], b'WEBP')
@@ -0,0 +1,165 @@
+import asyncio
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase, override_settings
+
+from generator.resilience import CircuitBreaker, Deadline, ExponentialBackoff
+from stable_diffusion_service import RetryPolicy, StableDiffusionService, model_loading
+
+LOADING = {'error': 'Model is currently loading', 'estimated_time': 20.0}
+
+
+@override_settings(HUGGINGFACE_API_KEY='test', HUGGINGFACE_API_URL='http://127.0.0.1:9/model',
+                   GENERATION_CACHE={'BACKEND': 'none'}, GENERATION_CIRCUIT_FAILURE_THRESHOLD=3)
+class RecordOutcomeTests(SimpleTestCase):
+    def setUp(self):
+        self.service = StableDiffusionService()
+
+    def test_plain_503_is_an_outage(self):
+        for _ in range(3):
+            self.service._record_outcome(503, {'error': 'Service Unavailable'})
+        self.assertEqual(self.service.circuit.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.service.cold_start.is_loading)
+
+    def test_503_without_a_json_body_is_an_outage(self):
+        for _ in range(3):
+            self.service._record_outcome(503, None)
+        self.assertEqual(self.service.circuit.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.service.cold_start.is_loading)
+
+    def test_loading_503_keeps_the_circuit_closed(self):
+        for _ in range(5):
+            self.service._record_outcome(503, LOADING)
+        self.assertEqual(self.service.circuit.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.service.cold_start.is_loading)
+        self.assertAlmostEqual(self.service.cold_start.seconds_until_ready(), 20.0, delta=1.0)
+
+        self.service._record_outcome(200)
+        self.assertFalse(self.service.cold_start.is_loading)
+
+    def test_probe_only_counts_loading_503_as_up(self):
+        response = mock.Mock(status_code=503)
+        response.json.return_value = {'error': 'Service Unavailable'}
+        with mock.patch.object(StableDiffusionService, 'session', mock.Mock(get=mock.Mock(return_value=response))):
+            self.assertFalse(self.service._probe())
+            response.json.return_value = LOADING
+            self.assertTrue(self.service._probe())
+
+
+def half_open_circuit():
+    """Breaker whose reset timeout just elapsed: the next call is the single probe"""
+    circuit = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    circuit.record_failure()
+    circuit._opened_at -= 61.0
+    return circuit
+
+
+class _HangingStream:
+    """Async context manager that never gets a response, until cancelled"""
+
+    async def __aenter__(self):
+        await asyncio.Event().wait()
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+@override_settings(HUGGINGFACE_API_KEY='test', HUGGINGFACE_API_URL='http://127.0.0.1:9/model',
+                   GENERATION_CACHE={'BACKEND': 'none'})
+class HalfOpenProbeTests(SimpleTestCase):
+    def setUp(self):
+        self.service = StableDiffusionService()
+        self.service.circuit = half_open_circuit()
+
+    def post_returning(self, response):
+        response.__enter__ = mock.Mock(return_value=response)
+        response.__exit__ = mock.Mock(return_value=False)
+        return mock.patch.object(StableDiffusionService, 'session', mock.Mock(post=mock.Mock(return_value=response)))
+
+    def test_broken_response_body_reopens_the_circuit(self):
+        response = mock.MagicMock(status_code=200)
+        response.iter_content.side_effect = requests.exceptions.ChunkedEncodingError('connection reset')
+        with self.post_returning(response), self.assertLogs('stable_diffusion_service', 'ERROR') as logs:
+            self.assertIsNone(self.service.generate_image('a cat'))
+        self.assertEqual(self.service.circuit.state, CircuitBreaker.OPEN)
+        self.assertIn('connection reset', logs.output[0])
+
+    def test_local_error_gives_the_probe_back(self):
+        response = mock.MagicMock(status_code=200)
+        response.iter_content.return_value = [b'\x89PNG']
+        sink = mock.Mock()
+        sink.write.side_effect = OSError('disk full')
+        with self.post_returning(response):
+            self.assertIsNone(self.service.generate_image('a cat', sink=sink))
+        self.assertEqual(self.service.circuit.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.service.circuit.allow_request())
+
+    def test_cancelled_probe_gives_the_slot_back(self):
+        client = mock.Mock()
+        client.stream.return_value = _HangingStream()
+
+        async def cancel_probe():
+            task = asyncio.create_task(self.service.agenerate_image('a cat'))
+            while not client.stream.called:
+                await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with mock.patch.object(self.service, '_get_async_client', return_value=client):
+            asyncio.run(cancel_probe())
+        self.assertEqual(self.service.circuit.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.service.circuit.allow_request())
+
+
+class RetryPolicyTests(SimpleTestCase):
+    def setUp(self):
+        self.policy = RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=8.0, deadline=60.0, max_loading_delay=30.0)
+
+    def test_model_loading(self):
+        self.assertTrue(model_loading(503, LOADING))
+        self.assertFalse(model_loading(503, {'error': 'Service Unavailable'}))
+        self.assertFalse(model_loading(503, None))
+        self.assertFalse(model_loading(500, LOADING))
+
+    def test_loading_503_waits_for_the_estimated_time(self):
+        self.assertEqual(self.policy.next_delay(0, 503, LOADING), 20.0)
+        self.assertEqual(self.policy.next_delay(0, 503, {'estimated_time': 90}), 30.0)
+
+    def test_plain_503_backs_off(self):
+        policy = RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=8.0)
+        policy.backoff = ExponentialBackoff(base=1.0, cap=8.0, jitter=False)
+        self.assertEqual(policy.next_delay(0, 503, {'error': 'Service Unavailable'}), 1.0)
+        self.assertEqual(policy.next_delay(2, 503, None), 4.0)
+
+    def test_client_errors_and_last_attempt_are_not_retried(self):
+        self.assertIsNone(self.policy.next_delay(0, 400))
+        self.assertIsNone(self.policy.next_delay(3, 500))
+        self.assertIsNotNone(self.policy.next_delay(0, 429))
+        self.assertIsNotNone(self.policy.next_delay(0, None))
+
+    def test_gives_up_when_the_wait_exceeds_the_deadline(self):
+        self.assertIsNone(self.policy.next_delay(0, 503, LOADING, deadline=Deadline(5.0)))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_consecutive_failures_and_recovers(self):
+        circuit = CircuitBreaker(failure_threshold=2, reset_timeout=0.0)
+        circuit.record_failure()
+        circuit.record_success()
+        circuit.record_failure()
+        self.assertEqual(circuit._state, CircuitBreaker.CLOSED)
+        circuit.record_failure()
+        self.assertEqual(circuit._state, CircuitBreaker.OPEN)
+        # reset_timeout elapsed: one probe goes through and closes it
+        self.assertEqual(circuit.state, CircuitBreaker.HALF_OPEN)
+        circuit.record_success()
+        self.assertEqual(circuit.state, CircuitBreaker.CLOSED)
+
+    def test_released_probe_lets_the_next_call_through(self):
+        circuit = half_open_circuit()
+        self.assertTrue(circuit.allow_request())
+        self.assertFalse(circuit.allow_request())
+        circuit.release_probe()
+        self.assertTrue(circuit.allow_request())
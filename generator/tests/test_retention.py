@@ -0,0 +1,140 @@
+import os
+import time
+from datetime import timedelta
+from io import BytesIO
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from generator.models import GeneratedImage
+from generator.pagecache import gallery_version
+from generator.retention import (
+    archive_blob, archive_candidates, delete_expired, delete_images, expiry_cutoff, save_archived,
+)
+from generator.storage import get_blob_store
+
+from .utils import IsolatedMediaMixin, png_bytes
+
+
+def gradient_png(size=(64, 48)):
+    from PIL import Image
+
+    image = Image.new('RGB', size)
+    image.putdata([(x * 4, y * 5, (x + y) * 2) for y in range(size[1]) for x in range(size[0])])
+    output = BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+@override_settings(RETENTION_MAX_AGE_DAYS=0, RETENTION_MAX_IMAGES=0, RETENTION_MAX_BYTES=0, RETENTION_BATCH_SIZE=2)
+class RetentionTests(IsolatedMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        # Oldest first, 5.5 to 1.5 days old, 100 bytes each
+        self.images = [
+            GeneratedImage.objects.create(prompt=f'{i}', byte_size=100, created_at=now - timedelta(days=5 - i, hours=12))
+            for i in range(5)
+        ]
+
+    def cutoff_index(self):
+        cutoff = expiry_cutoff()
+        return None if cutoff is None else [image.pk for image in self.images].index(cutoff[1])
+
+    def test_no_rule_expires_nothing(self):
+        self.assertIsNone(expiry_cutoff())
+        self.assertEqual(delete_expired()[0], 0)
+
+    def test_each_rule_keeps_a_newest_prefix(self):
+        for rule, value, index in (
+            ('RETENTION_MAX_AGE_DAYS', 4, 1),
+            ('RETENTION_MAX_IMAGES', 2, 2),
+            ('RETENTION_MAX_BYTES', 350, 1),
+        ):
+            with self.subTest(rule=rule), override_settings(**{rule: value}):
+                self.assertEqual(self.cutoff_index(), index)
+
+    @override_settings(RETENTION_MAX_AGE_DAYS=4, RETENTION_MAX_IMAGES=2)
+    def test_strictest_rule_wins(self):
+        self.assertEqual(self.cutoff_index(), 2)
+
+    @override_settings(RETENTION_MAX_IMAGES=2)
+    def test_delete_expired_in_batches(self):
+        self.assertEqual(delete_expired(dry_run=True)[0], 3)
+        self.assertEqual(GeneratedImage.objects.count(), 5)
+        self.assertEqual(delete_expired()[0], 3)
+        self.assertEqual(list(GeneratedImage.objects.order_by('created_at')), self.images[3:])
+
+
+class DeleteImagesTests(IsolatedMediaMixin, TestCase):
+    def store_old(self, data):
+        key = get_blob_store().put(data)
+        # Past the release grace period
+        old = time.time() - 2 * 3600
+        os.utime(get_blob_store().path(key), (old, old))
+        return key
+
+    def test_shared_blobs_are_kept_until_their_last_image_goes(self):
+        key = self.store_old(png_bytes())
+        first = GeneratedImage.objects.create(prompt='a', blob_key=key, byte_size=10)
+        second = GeneratedImage.objects.create(prompt='b', blob_key=key, byte_size=10)
+
+        deleted, released = delete_images(GeneratedImage.objects.filter(pk=first.pk))
+        self.assertEqual((deleted, released.blobs), (1, 0))
+        self.assertTrue(get_blob_store().exists(key))
+
+        deleted, released = delete_images(GeneratedImage.objects.filter(pk=second.pk))
+        self.assertEqual((deleted, released.blobs, released.bytes), (1, 1, len(png_bytes())))
+        self.assertFalse(get_blob_store().exists(key))
+
+    def test_recently_written_blobs_are_kept(self):
+        key = get_blob_store().put(png_bytes())
+        image = GeneratedImage.objects.create(prompt='a', blob_key=key)
+        self.assertEqual(delete_images(GeneratedImage.objects.filter(pk=image.pk))[1].blobs, 0)
+        self.assertTrue(get_blob_store().exists(key))
+
+
+class ArchiveTests(IsolatedMediaMixin, TestCase):
+    def test_archived_blob_has_the_same_pixels(self):
+        from PIL import Image, ImageChops
+
+        data = gradient_png()
+        key = get_blob_store().put(data)
+        stored = archive_blob(key)
+        self.assertEqual(stored.mime_type, 'image/webp')
+        self.assertLess(stored.size, len(data) * 0.9)
+        with Image.open(BytesIO(data)) as original, Image.open(get_blob_store().path(stored.key)) as archived:
+            self.assertIsNone(ImageChops.difference(original.convert('RGB'), archived.convert('RGB')).getbbox())
+
+    def test_webp_and_incompressible_blobs_are_kept(self):
+        from PIL import Image
+
+        output = BytesIO()
+        Image.new('RGB', (16, 16), 'red').save(output, format='WEBP', lossless=True)
+        self.assertIsNone(archive_blob(get_blob_store().put(output.getvalue())))
+
+    def test_save_archived_repoints_the_rows_and_releases_the_original(self):
+        key = get_blob_store().put(gradient_png())
+        old = time.time() - 2 * 3600
+        os.utime(get_blob_store().path(key), (old, old))
+        before = timezone.now()
+        image = GeneratedImage.objects.create(prompt='a', blob_key=key, created_at=before - timedelta(days=1))
+        self.assertEqual(list(archive_candidates(before)), [(image.pk, key)])
+        version = gallery_version()
+
+        stored = archive_blob(key)
+        archived, saved = save_archived({key: stored}, before)
+
+        image.refresh_from_db()
+        self.assertEqual((archived, image.blob_key, image.mime_type), (1, stored.key, 'image/webp'))
+        self.assertIsNotNone(image.archived_at)
+        self.assertGreater(saved, 0)
+        self.assertFalse(get_blob_store().exists(key))
+        self.assertNotEqual(gallery_version(), version)
+        self.assertEqual(list(archive_candidates(before)), [])
+
+    def test_blobs_shared_with_newer_images_are_not_candidates(self):
+        before = timezone.now()
+        GeneratedImage.objects.create(prompt='old', blob_key='a' * 64, created_at=before - timedelta(days=1))
+        GeneratedImage.objects.create(prompt='new', blob_key='a' * 64, created_at=before + timedelta(seconds=1))
+        self.assertEqual(list(archive_candidates(before)), [])
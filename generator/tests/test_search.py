@@ -0,0 +1,32 @@
+from django.db import connection
+from django.test import TestCase
+
+from generator.models import GeneratedImage
+from generator.search import fts5_available, search_images
+
+
+class FullTextSearchTests(TestCase):
+    def search(self, query):
+        return list(search_images(GeneratedImage.objects.all(), query).values_list('prompt', flat=True))
+
+    def test_triggers_survive_the_migrations(self):
+        if connection.vendor != 'sqlite' or not fts5_available():
+            self.skipTest("SQLite FTS5 only")
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'generator_image_fts_%'")
+            triggers = {name for name, in cursor.fetchall()}
+        self.assertEqual(triggers, {
+            'generator_image_fts_insert', 'generator_image_fts_delete', 'generator_image_fts_update',
+        })
+
+    def test_index_follows_inserts_updates_and_deletes(self):
+        image = GeneratedImage.objects.create(prompt='a lighthouse at dusk')
+        self.assertEqual(self.search('lighthouse'), ['a lighthouse at dusk'])
+
+        image.prompt = 'a windmill at dawn'
+        image.save()
+        self.assertEqual(self.search('lighthouse'), [])
+        self.assertEqual(self.search('windmill'), ['a windmill at dawn'])
+
+        image.delete()
+        self.assertEqual(self.search('windmill'), [])
@@ -0,0 +1,60 @@
+import asyncio
+import importlib.util
+import unittest
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from generator.stub_server import StubInferenceServer
+from stable_diffusion_service import BatchItem, StableDiffusionService
+
+HAS_HTTPX = importlib.util.find_spec('httpx') is not None
+
+
+@override_settings(HUGGINGFACE_API_KEY='test', GENERATION_CACHE={'BACKEND': 'none'},
+                   GENERATION_HTTP_POOL_SIZE=4, GENERATION_RETRY_MAX_ATTEMPTS=1)
+class StubServerClientTests(SimpleTestCase):
+    """Sync and async clients against generator.stub_server (no network needed)"""
+
+    def setUp(self):
+        self.server = StubInferenceServer(latency=0.05, image_size=32).start()
+        self.addCleanup(self.server.stop)
+        self.service = StableDiffusionService(api_url=self.server.url)
+
+    def items(self, count):
+        return [BatchItem(prompt=f'a cat {i}', seed=i) for i in range(count)]
+
+    def assertAllImages(self, items):
+        for item in items:
+            self.assertIsNone(item.error)
+            self.assertEqual(item.image.format, 'png')
+            self.assertTrue(item.image.data.startswith(b'\x89PNG'))
+
+    def test_pooled_session_is_shared_by_concurrent_calls(self):
+        items = self.service.generate_batch(self.items(8), concurrency=4)
+        self.assertAllImages(items)
+        self.assertEqual(self.server.request_count, 8)
+        adapter = self.service.session.get_adapter(self.server.url)
+        self.assertEqual(adapter._pool_maxsize, 4)
+        # One pool per host, sized for the concurrency
+        self.assertEqual(len(adapter.poolmanager.pools), 1)
+
+    @unittest.skipUnless(HAS_HTTPX, 'httpx (the "async" extra) is not installed')
+    def test_async_client_runs_calls_concurrently(self):
+        async def run():
+            try:
+                return await self.service.agenerate_batch(self.items(8), concurrency=8)
+            finally:
+                await self.service.aclose()
+
+        items = asyncio.run(run())
+        self.assertAllImages(items)
+        self.assertEqual(self.server.request_count, 8)
+        self.assertIsNone(self.service._async_client)
+
+    def test_async_path_falls_back_to_a_thread_without_httpx(self):
+        with mock.patch('stable_diffusion_service._load_httpx', return_value=None):
+            result = asyncio.run(self.service.agenerate_image('a cat'))
+        self.assertEqual(result.format, 'png')
+        self.assertEqual(self.server.request_count, 1)
+        self.assertIsNone(self.service._async_client)
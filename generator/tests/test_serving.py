@@ -0,0 +1,92 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils.http import http_date
+
+from generator.models import GeneratedImage
+from generator.serving import parse_range
+from generator.storage import get_blob_store
+
+from .utils import IsolatedMediaMixin, png_bytes
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_single_ranges(self):
+        cases = {
+            'bytes=0-9': (0, 9),
+            'bytes=10-': (10, 99),
+            'bytes=-10': (90, 99),
+            'bytes=-500': (0, 99),
+            'bytes=90-500': (90, 99),
+        }
+        for header, expected in cases.items():
+            with self.subTest(header=header):
+                self.assertEqual(parse_range(header, 100), expected)
+
+    def test_absent_or_unsupported_ranges_serve_the_whole_file(self):
+        for header in (None, '', 'bytes=-', 'bytes=0-1,5-6', 'items=0-1'):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 100))
+
+    def test_unsatisfiable_ranges(self):
+        for header in ('bytes=100-', 'bytes=5-4', 'bytes=-0'):
+            with self.subTest(header=header), self.assertRaises(ValueError):
+                parse_range(header, 100)
+
+
+@override_settings(IMAGE_SENDFILE_MODE='')
+class DownloadTests(IsolatedMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = png_bytes(size=(32, 32))
+        key = get_blob_store().put(self.data)
+        self.image = GeneratedImage.objects.create(
+            prompt='a red/square?', blob_key=key, byte_size=len(self.data), mime_type='image/png',
+        )
+        self.url = reverse('download_image', args=[self.image.pk])
+        self.etag = f'"{key}"'
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="a redsquare_{self.image.pk}.png"')
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=4-11')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), self.data[4:12])
+        self.assertEqual(response['Content-Range'], f'bytes 4-11/{len(self.data)}')
+        self.assertEqual(response['Content-Length'], '8')
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+
+    def test_stale_if_range_serves_the_whole_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE=self.etag)
+        self.assertEqual(response.status_code, 206)
+
+    def test_conditional_requests(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn('Content-Disposition', response)
+        last_modified = http_date(self.image.created_at.timestamp() + 1)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MATCH='"other"').status_code, 412)
+
+    @override_settings(IMAGE_SENDFILE_MODE='x-accel-redirect', IMAGE_ACCEL_REDIRECT_PREFIX='/protected/')
+    def test_offloaded_to_nginx(self):
+        response = self.client.get(self.url)
+        key = self.image.blob_key
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{key[:2]}/{key[2:4]}/{key}')
+        self.assertEqual(response.content, b'')
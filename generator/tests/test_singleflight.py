@@ -0,0 +1,85 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from generator.models import GeneratedImage, GenerationLease
+from generator.singleflight import LeaseTable, SingleFlight
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'image'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do('key', slow)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flight.do('key', slow))) for _ in range(3)]
+        for thread in followers:
+            thread.start()
+        while flight.shared < 3:
+            time.sleep(0.01)
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(5)
+
+        self.assertEqual((results, len(calls)), (['image'] * 4, 1))
+
+    def test_errors_are_shared_and_not_kept(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError('upstream down')
+
+        with self.assertRaises(ValueError):
+            flight.do('key', fail)
+        self.assertEqual(flight.do('key', lambda: 'image'), 'image')
+
+
+class LeaseTableTests(TestCase):
+    def setUp(self):
+        self.leases = LeaseTable(ttl=60, result_ttl=10, poll_interval=0.01)
+
+    def test_only_one_holder(self):
+        token = self.leases.acquire('key')
+        self.assertIsNotNone(token)
+        self.assertIsNone(self.leases.acquire('key'))
+        self.assertIsNotNone(self.leases.acquire('other'))
+
+    def test_waiters_get_the_outcome(self):
+        image = GeneratedImage.objects.create(prompt='a fox')
+        token = self.leases.acquire('key')
+        self.assertIsNone(self.leases.wait('key', timeout=0.05))
+        self.leases.complete('key', token, image=image)
+        self.assertEqual(self.leases.wait('key').image, image)
+
+        token = self.leases.acquire('failing')
+        self.leases.complete('failing', token, error='quota exceeded')
+        self.assertEqual(self.leases.wait('failing').error, 'quota exceeded')
+
+    def test_expired_lease_is_taken_over(self):
+        token = self.leases.acquire('key')
+        GenerationLease.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(self.leases.wait('key'))
+        new_token = self.leases.acquire('key')
+        self.assertNotIn(new_token, (None, token))
+        # The previous holder can no longer publish
+        self.leases.complete('key', token, error='late')
+        self.assertEqual(GenerationLease.objects.get(key='key').error, '')
+
+    def test_released_lease_is_free(self):
+        token = self.leases.acquire('key')
+        self.leases.release('key', token)
+        self.assertIsNone(self.leases.wait('key'))
+        self.assertIsNotNone(self.leases.acquire('key'))
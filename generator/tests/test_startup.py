@@ -0,0 +1,30 @@
+import os
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from generator.apps import _is_serving_process
+
+
+class ServingProcessTests(SimpleTestCase):
+    def serving(self, *argv, run_main=None):
+        environ = {key: value for key, value in os.environ.items() if key != 'RUN_MAIN'}
+        if run_main:
+            environ['RUN_MAIN'] = run_main
+        with mock.patch('sys.argv', list(argv)), mock.patch.dict('os.environ', environ, clear=True):
+            return _is_serving_process()
+
+    def test_application_servers_serve(self):
+        self.assertTrue(self.serving('/venv/bin/gunicorn', 'main:app'))
+        self.assertTrue(self.serving('/venv/lib/python3.11/site-packages/gunicorn/__main__.py', 'main:app'))
+        self.assertTrue(self.serving('/venv/bin/uvicorn', 'image_generator_django.asgi:application'))
+        self.assertTrue(self.serving('manage.py', 'rungenerationworker'))
+        self.assertTrue(self.serving('manage.py', 'runserver', run_main='true'))
+
+    def test_other_processes_do_not(self):
+        self.assertFalse(self.serving('manage.py', 'runserver'))
+        self.assertFalse(self.serving('manage.py', 'test'))
+        self.assertFalse(self.serving('/venv/bin/pytest'))
+        self.assertFalse(self.serving('-c'))
+        self.assertFalse(self.serving('scripts/import_prompts.py'))
+        self.assertFalse(self.serving())
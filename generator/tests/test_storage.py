@@ -0,0 +1,86 @@
+import base64
+import hashlib
+import os
+from pathlib import Path
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TransactionTestCase
+
+from generator.storage import BlobStore, get_blob_store, store_image_bytes
+
+from .utils import IsolatedMediaMixin, png_bytes
+
+
+class BlobStoreTests(IsolatedMediaMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = BlobStore(Path(self.media_root) / 'store')
+
+    def test_put_is_content_addressed_and_idempotent(self):
+        data = png_bytes()
+        key = self.store.put(data)
+        self.assertEqual(key, hashlib.sha256(data).hexdigest())
+        self.assertEqual(self.store.put(data), key)
+        self.assertEqual(self.store.read(key), data)
+        self.assertEqual(self.store.path(key).relative_to(self.store.root).parts, (key[:2], key[2:4], key))
+        self.assertEqual([k for k, _ in self.store.keys()], [key])
+
+    def test_invalid_keys_are_refused(self):
+        for key in ('', '../etc/passwd', 'A' * 64, 'a' * 63):
+            with self.subTest(key=key), self.assertRaises(ValueError):
+                self.store.path(key)
+
+    def test_writer_streams_and_describes_the_image(self):
+        data = png_bytes(size=(12, 7))
+        with self.store.writer() as writer:
+            for start in range(0, len(data), 10):
+                writer.write(data[start:start + 10])
+            stored = writer.commit()
+        self.assertEqual((stored.key, stored.size), (hashlib.sha256(data).hexdigest(), len(data)))
+        self.assertEqual((stored.mime_type, stored.width, stored.height), ('image/png', 12, 7))
+        self.assertEqual(self.store.read(stored.key), data)
+
+    def test_writer_left_without_commit_leaves_nothing(self):
+        with self.store.writer() as writer:
+            writer.write(b'partial')
+        self.assertEqual(os.listdir(self.store.root), [])
+
+    def test_writing_a_blob_again_refreshes_its_mtime(self):
+        key = self.store.put(b'blob')
+        os.utime(self.store.path(key), (0, 0))
+        self.store.put(b'blob')
+        self.assertGreater(self.store.path(key).stat().st_mtime, 0)
+
+
+class MoveDataUrlsMigrationTests(IsolatedMediaMixin, TransactionTestCase):
+    before = [('generator', '0002_image_blob_fields')]
+    after = [('generator', '0003_move_data_urls_to_blob_store')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+        super().tearDown()
+
+    def test_inline_images_move_to_the_blob_store_and_back(self):
+        data = png_bytes(size=(5, 4))
+        data_url = 'data:image/png;base64,' + base64.b64encode(data).decode()
+        GeneratedImage = self.migrate(self.before).get_model('generator', 'GeneratedImage')
+        image = GeneratedImage.objects.create(prompt='inline', image_url=data_url)
+        remote = GeneratedImage.objects.create(prompt='remote', image_url='https://example.com/a.png')
+
+        GeneratedImage = self.migrate(self.after).get_model('generator', 'GeneratedImage')
+        image = GeneratedImage.objects.get(pk=image.pk)
+        self.assertEqual(image.image_url, '')
+        self.assertEqual(image.blob_key, store_image_bytes(data).key)
+        self.assertEqual((image.width, image.height, image.mime_type), (5, 4, 'image/png'))
+        self.assertEqual(get_blob_store().read(image.blob_key), data)
+        self.assertEqual(GeneratedImage.objects.get(pk=remote.pk).image_url, 'https://example.com/a.png')
+
+        GeneratedImage = self.migrate(self.before).get_model('generator', 'GeneratedImage')
+        self.assertEqual(GeneratedImage.objects.get(pk=image.pk).image_url, data_url)
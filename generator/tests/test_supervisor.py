@@ -0,0 +1,37 @@
+import sys
+import time
+
+from django.test import SimpleTestCase
+
+from generator.resilience import ExponentialBackoff
+from generator.supervisor import ProcessSupervisor
+
+
+def wait_until(condition, timeout=10.0):
+    give_up_at = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > give_up_at:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+
+class ProcessSupervisorTests(SimpleTestCase):
+    def supervise(self, code, **options):
+        supervisor = ProcessSupervisor(
+            [sys.executable, '-c', code], backoff=ExponentialBackoff(base=0.01, cap=0.05, jitter=False), **options,
+        ).start()
+        self.addCleanup(supervisor.stop)
+        return supervisor
+
+    def test_child_that_exits_is_restarted(self):
+        supervisor = self.supervise('import sys; sys.exit(3)')
+        wait_until(lambda: supervisor.restarts >= 3)
+
+    def test_stop_terminates_the_child_and_stops_restarting(self):
+        supervisor = self.supervise('import time; time.sleep(60)', stop_timeout=5.0)
+        wait_until(lambda: supervisor.process is not None)
+        process = supervisor.process
+        supervisor.stop()
+        self.assertIsNotNone(process.poll())
+        self.assertEqual(supervisor.restarts, 0)
+        self.assertIs(supervisor.process, process)
@@ -0,0 +1,128 @@
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from generator.jobs import run_job
+from generator.models import GeneratedImage, GenerationJob
+from stable_diffusion_service import batch_size, build_batch_items
+
+from .utils import IsolatedMediaMixin
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class BatchGenerateApiTests(IsolatedMediaMixin, TestCase):
+    def post(self, body):
+        return self.client.post(reverse('batch_generate_api'), data=json.dumps(body), content_type='application/json')
+
+    def test_rejects_bodies_that_are_not_objects(self):
+        for body in ([], 'x', 3, None):
+            with self.subTest(body=body):
+                response = self.post(body)
+                self.assertEqual(response.status_code, 400)
+
+    def test_rejects_prompts_that_are_not_a_list(self):
+        response = self.post({'prompts': 'a cat'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('prompts', response.json()['error'])
+
+    def test_rejects_seeds_that_are_not_a_list(self):
+        self.assertEqual(self.post({'prompt': 'a cat', 'seeds': '123'}).status_code, 400)
+        self.assertEqual(self.post({'prompt': ['a cat']}).status_code, 400)
+
+    def test_invalid_json(self):
+        response = self.client.post(reverse('batch_generate_api'), data='{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(GENERATION_BATCH_MAX_ITEMS=4)
+    def test_rejects_batches_over_the_limit_before_building_them(self):
+        with mock.patch('stable_diffusion_service.random.randrange') as randrange:
+            for body in (
+                {'prompt': 'a cat', 'variations': 1_000_000_000},
+                {'prompt': 'a cat', 'seeds': list(range(5))},
+                {'prompts': ['a cat'] * 5},
+            ):
+                with self.subTest(body=list(body)):
+                    response = self.post(body)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('limited to 4', response.json()['error'])
+        randrange.assert_not_called()
+
+
+class BuildBatchItemsTests(SimpleTestCase):
+    def test_size_is_checked_before_drawing_seeds(self):
+        with mock.patch('stable_diffusion_service.random.randrange', return_value=7) as randrange:
+            with self.assertRaises(ValueError):
+                build_batch_items(prompt='a cat', variations=10 ** 12, max_items=16)
+            randrange.assert_not_called()
+            items = build_batch_items(prompt='a cat', variations=3, max_items=3)
+        self.assertEqual([item.seed for item in items], [7, 7, 7])
+        self.assertEqual(batch_size(prompt='a cat', seeds=[1, 2]), 2)
+        self.assertEqual(batch_size(prompts=['a', 'b', 'c'], prompt='x'), 3)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False, GENERATION_MAX_QUEUED=0, GENERATION_MAX_QUEUED_PER_TENANT=0)
+class BatchQueueTests(IsolatedMediaMixin, TestCase):
+    def test_api_queues_one_job_per_variation(self):
+        response = self.client.post(
+            reverse('batch_generate_api'), data=json.dumps({'prompt': 'a cat', 'seeds': [3, 1, 2], 'use_cache': False}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 202)
+        jobs = response.json()['jobs']
+        self.assertEqual([(job['prompt'], job['seed'], job['status']) for job in jobs],
+                         [('a cat', 3, 'queued'), ('a cat', 1, 'queued'), ('a cat', 2, 'queued')])
+        queued = GenerationJob.objects.filter(status=GenerationJob.Status.QUEUED)
+        self.assertEqual(sorted(queued.values_list('seed', flat=True)), [1, 2, 3])
+        self.assertFalse(queued.filter(use_cache=True).exists())
+        self.assertEqual(len({job.tenant for job in queued}), 1)
+
+    def test_api_rejects_seeds_that_are_not_integers(self):
+        for seeds in (['1'], [-1], [1.5]):
+            with self.subTest(seeds=seeds):
+                response = self.client.post(
+                    reverse('batch_generate_api'), data=json.dumps({'prompt': 'a cat', 'seeds': seeds}),
+                    content_type='application/json',
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(GenerationJob.objects.exists())
+
+    def test_form_queues_the_prompts_and_follows_their_jobs(self):
+        response = self.client.post(reverse('batch_generate'), {'prompts': 'a cat\na dog\n'})
+        jobs = list(GenerationJob.objects.order_by('prompt'))
+        self.assertEqual([job.prompt for job in jobs], ['a cat', 'a dog'])
+        self.assertRedirects(response, reverse('batch_generate') + '?jobs=' + ','.join(
+            str(job.id) for job in sorted(jobs, key=lambda job: response.url.index(str(job.id)))
+        ))
+
+        page = self.client.get(response.url)
+        self.assertEqual(page.context['jobs'], sorted(jobs, key=lambda job: response.url.index(str(job.id))))
+        self.assertContains(page, reverse('job_status', args=[jobs[0].id]))
+
+    def test_worker_generates_with_the_job_seed(self):
+        job = GenerationJob.objects.create(prompt='a cat', seed=42)
+        image = GeneratedImage.objects.create(prompt='a cat')
+        with mock.patch('generator.jobs.generate_and_store', return_value=image) as generate:
+            run_job(job)
+        generate.assert_called_once_with('a cat', '', use_cache=True, seed=42)
+        self.assertEqual(GenerationJob.objects.get(pk=job.pk).image, image)
+
+
+@override_settings(MESSAGE_STORAGE='django.contrib.messages.storage.session.SessionStorage')
+class PendingMessageAsgiTests(IsolatedMediaMixin, TestCase):
+    async def test_index_with_a_pending_message_in_the_session(self):
+        image = await GeneratedImage.objects.acreate(prompt='a red fox')
+        response = await self.async_client.post(reverse('delete_image', args=[image.id]))
+        self.assertEqual(response.status_code, 302)
+
+        # The ETag check reads the session-stored messages: no synchronous DB access in the event loop
+        response = await self.async_client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertContains(response, 'Image deleted successfully')
+
+        # Once shown, the page is cacheable again
+        response = await self.async_client.get(reverse('index'))
+        self.assertTrue(response.has_header('ETag'))
+        self.assertNotContains(response, 'Image deleted successfully')
@@ -0,0 +1,41 @@
+"""
+Shared helpers of the generator tests.
+"""
+import io
+import shutil
+import tempfile
+
+from django.test import override_settings
+
+from generator import storage
+
+
+def png_bytes(size=(8, 8), color=(200, 40, 40)):
+    """A small PNG image"""
+    from PIL import Image
+
+    output = io.BytesIO()
+    Image.new('RGB', size, color).save(output, format='PNG')
+    return output.getvalue()
+
+
+class IsolatedMediaMixin:
+    """Point the blob store, renditions, metrics and caches at a temporary directory"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp(prefix='generator-tests-')
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(
+            IMAGE_STORE_ROOT=f'{self.media_root}/blobs',
+            IMAGE_RENDITION_ROOT=f'{self.media_root}/renditions',
+            METRICS_DIR=f'{self.media_root}/metrics',
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'},
+                'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-pages'},
+            },
+        )
+        media.enable()
+        self.addCleanup(media.disable)
+        storage._blob_store = None
+        self.addCleanup(setattr, storage, '_blob_store', None)
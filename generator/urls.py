@@ -4,7 +4,16 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('generate/', views.generate_image, name='generate_image'),
+    path('batch/', views.batch_generate, name='batch_generate'),
+    path('api/batch/', views.batch_generate_api, name='batch_generate_api'),
+    path('jobs/<uuid:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<uuid:job_id>/events/', views.job_events, name='job_events'),
     path('gallery/', views.gallery, name='gallery'),
+    path('gallery/export/', views.export_gallery, name='export_gallery'),
+    path('similar/', views.similar_prompts, name='similar_prompts'),
+    path('image/<int:image_id>/', views.image_file, name='image_file'),
+    path('thumb/<int:image_id>/', views.image_thumbnail, name='image_thumbnail'),
     path('download/<int:image_id>/', views.download_image, name='download_image'),
     path('delete/<int:image_id>/', views.delete_image, name='delete_image'),
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
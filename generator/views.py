@@ -1,125 +1,392 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, aget_object_or_404, redirect
 from django.contrib import messages
-from django.http import HttpResponse, Http404
+from django.core.exceptions import ValidationError
+from django.db.models import Count
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.conf import settings
 from django.utils import timezone
+from django.template.loader import render_to_string
 from django.urls import reverse
-from .models import GeneratedImage
-import requests
-import tempfile
-import os
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.safestring import mark_safe
+from stable_diffusion_service import batch_size
+from .admission import aadmit
+from .backends import built_backends
+from .export import ARCHIVE_FORMATS, export_archive, export_queryset
+from .jobs import aenqueue_batch, aenqueue_generation
+from .metrics import collect, render as render_metrics, render_gauge
+from .pipeline import GenerationError, build_batch
+from .models import GeneratedImage, GenerationJob
+from .pagecache import agallery_fragment, gallery_version, page_condition, page_etag
+from .pagination import apaginate_newest_first
+from .progress import ajob_events, asse_stream, job_events as iter_job_events, job_payload, sse_stream
+from .renditions import DEFAULT_THUMBNAIL_SIZE, get_thumbnail, negotiate_format, rendition_formats
+from .retention import delete_images
+from .search import search_images, similar_images
+from .serving import aiter_in_thread, download_filename, serve_blob, served_over_asgi, stream_file
+from .storage import store_remote_image
+import json
 import logging
-from stable_diffusion_service import get_stable_diffusion_service
+import uuid
 
 logger = logging.getLogger(__name__)
 
+# Views are coroutines: under an ASGI server (see asgi.py) one process keeps
+# many requests waiting on the database or the inference API at once. Code
+# without an async version (transactions, search) runs through sync_to_async.
 
-def index(request):
+
+def _wants_json(request):
+    return 'application/json' in request.headers.get('Accept', '')
+
+
+def _index_etag(request):
+    # Pages following a job depend on the job state: always rendered
+    if request.GET.get('job'):
+        return None
+    return page_etag(request, 'index')
+
+
+@page_condition(_index_etag)
+async def index(request):
     """Main page with image generation form"""
-    return render(request, 'generator/index.html')
+    context = {}
+    job_id = request.GET.get('job')
+    if job_id:
+        try:
+            job = await GenerationJob.objects.select_related('image').filter(id=job_id).afirst()
+        except ValidationError:
+            job = None
+        if job is not None:
+            context.update({'job': job, 'prompt': job.prompt})
+            if job.status == GenerationJob.Status.SUCCEEDED and job.image:
+                context.update({
+                    'generated_image': job.image.src_url,
+                    'image_id': job.image.id,
+                })
+            elif job.status == GenerationJob.Status.FAILED:
+                messages.error(request, job.error or 'Image generation failed. Please try again.')
+    response = render(request, 'generator/index.html', context)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
 
+def _rejected(request, rejection, template='generator/index.html', context=None):
+    """429 response for a request refused by admission control"""
+    if _wants_json(request) or template is None:
+        response = JsonResponse({'error': rejection.reason, 'retry_after': rejection.retry_after}, status=429)
+    else:
+        messages.error(request, f"{rejection.reason} (retry in {rejection.retry_after}s)")
+        response = render(request, template, context or {}, status=429)
+    response['Retry-After'] = str(rejection.retry_after)
+    return response
 
-def generate_image(request):
-    """Generate image from text prompt using Stable Diffusion"""
+
+async def generate_image(request):
+    """Queue an image generation job for a text prompt"""
     if request.method != 'POST':
         return redirect('index')
     
     try:
         prompt = request.POST.get('prompt', '').strip()
         
+        error = None
         if not prompt:
-            messages.error(request, 'Please enter a text prompt')
+            error = 'Please enter a text prompt'
+        elif len(prompt) > 1000:
+            error = 'Prompt is too long. Please keep it under 1000 characters.'
+        if error:
+            if _wants_json(request):
+                return JsonResponse({'error': error}, status=400)
+            messages.error(request, error)
             return redirect('index')
         
-        if len(prompt) > 1000:
-            messages.error(request, 'Prompt is too long. Please keep it under 1000 characters.')
-            return redirect('index')
+        tenant, rejection = await aadmit(request)
+        if rejection:
+            return _rejected(request, rejection, context={'prompt': prompt})
         
-        # Generate image using Stable Diffusion
-        logger.info(f"Generating image for prompt: {prompt}")
+        # The worker generates the image; the request returns immediately
+        # "fresh" bypasses the generation cache for this request
+        job = await aenqueue_generation(
+            prompt, use_cache=not request.POST.get('fresh'), tenant=tenant.key, weight=tenant.weight,
+        )
+        logger.info(f"Queued generation job {job.id} for prompt: {prompt}")
         
-        try:
-            service = get_stable_diffusion_service()
-            if not service:
-                messages.error(request, 'Image generation service is not available. Please check your API key.')
-                return redirect('index')
-            
-            image_data_url = service.generate_image(prompt)
-            
-            # Save to database
-            new_image = GeneratedImage.objects.create(
-                prompt=prompt,
-                image_url=image_data_url
-            )
-            
-            messages.success(request, 'Image generated successfully!')
-            return render(request, 'generator/index.html', {
-                'generated_image': image_data_url,
-                'prompt': prompt,
-                'image_id': new_image.id
-            })
-            
-        except Exception as api_error:
-            logger.error(f"Stable Diffusion API error: {str(api_error)}")
-            
-            # Check if it's an API key issue
-            if "HUGGINGFACE_API_KEY" in str(api_error):
-                messages.error(request, 'Hugging Face API key is required. Please add your HUGGINGFACE_API_KEY to environment variables.')
-            else:
-                messages.error(request, f"Error generating image: {str(api_error)}")
-            
-            return redirect('index')
+        if _wants_json(request):
+            return JsonResponse(job_payload(job), status=202)
+        return redirect(f"{reverse('index')}?job={job.id}")
         
     except Exception as e:
         logger.error(f"Error in generate_image: {str(e)}")
+        if _wants_json(request):
+            return JsonResponse({'error': 'An unexpected error occurred. Please try again.'}, status=500)
         messages.error(request, 'An unexpected error occurred. Please try again.')
         return redirect('index')
 
 
-def gallery(request):
-    """Display gallery of generated images"""
+async def job_status(request, job_id):
+    """Return the current state of a generation job as JSON"""
+    job = await aget_object_or_404(GenerationJob, id=job_id)
+    return JsonResponse(job_payload(job))
+
+
+async def job_events(request, job_id):
+    """Stream the state transitions of a generation job as server-sent events"""
+    await aget_object_or_404(GenerationJob, id=job_id)
+    if served_over_asgi(request):
+        events = asse_stream(ajob_events(job_id))
+    else:
+        events = sse_stream(iter_job_events(job_id))
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Let nginx pass events through as they come
+    return response
+
+
+def _parse_int(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_job_ids(value):
+    """Return the job ids of a comma-separated list, ignoring malformed ones"""
+    ids = []
+    for part in (value or '').split(','):
+        try:
+            ids.append(uuid.UUID(part.strip()))
+        except ValueError:
+            continue
+    return ids[:settings.GENERATION_BATCH_MAX_ITEMS]
+
+
+async def batch_generate(request):
+    """Queue several images at once: a list of prompts, or one prompt with N variations"""
+    if request.method != 'POST':
+        context = {}
+        job_ids = _parse_job_ids(request.GET.get('jobs'))
+        if job_ids:
+            jobs = {job.id: job async for job in GenerationJob.objects.select_related('image').filter(id__in=job_ids)}
+            context['jobs'] = [jobs[job_id] for job_id in job_ids if job_id in jobs]
+        return render(request, 'generator/batch.html', context)
+    
+    prompts = [line.strip() for line in request.POST.get('prompts', '').splitlines() if line.strip()]
+    variations = _parse_int(request.POST.get('variations'))
+    if len(prompts) == 1 and variations and variations > 1:
+        kwargs = {'prompt': prompts[0], 'variations': variations}
+    else:
+        kwargs = {'prompts': prompts}
+    
+    error = None
+    if any(len(prompt) > 1000 for prompt in prompts):
+        error = 'Prompt is too long. Please keep it under 1000 characters.'
+    cost = batch_size(**kwargs)
+    if cost > settings.GENERATION_BATCH_MAX_ITEMS:
+        error = f"A batch is limited to {settings.GENERATION_BATCH_MAX_ITEMS} images"
+    if error:
+        messages.error(request, error)
+        return render(request, 'generator/batch.html', {'prompts': request.POST.get('prompts', '')})
+    
+    tenant, rejection = await aadmit(request, cost=max(1, cost))
+    if rejection:
+        return _rejected(request, rejection, 'generator/batch.html', {'prompts': request.POST.get('prompts', '')})
+    
+    try:
+        items = build_batch(**kwargs)
+    except GenerationError as e:
+        messages.error(request, str(e))
+        return render(request, 'generator/batch.html', {'prompts': request.POST.get('prompts', '')})
+    
+    # The worker generates the images; the request returns immediately
+    jobs = await aenqueue_batch(
+        items, use_cache=not request.POST.get('fresh'), tenant=tenant.key, weight=tenant.weight,
+    )
+    logger.info(f"Queued a batch of {len(jobs)} generation jobs")
+    return redirect(f"{reverse('batch_generate')}?jobs={','.join(str(job.id) for job in jobs)}")
+
+
+async def batch_generate_api(request):
+    """
+    JSON batch endpoint: queue one generation job per image and answer 202 with the jobs.
+
+    Body: {"prompts": [...]} or {"prompt": "...", "seeds": [...]} or
+    {"prompt": "...", "variations": N}, plus an optional "use_cache". The jobs
+    run on the generation workers, which bound the fan-out; follow each one
+    through its status_url or events_url.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'The JSON body must be an object'}, status=400)
+    for field, kind in (('prompts', list), ('seeds', list), ('prompt', str)):
+        if data.get(field) is not None and not isinstance(data[field], kind):
+            return JsonResponse({'error': f'"{field}" must be a {"list" if kind is list else "string"}'}, status=400)
+
+    prompts = [p.strip() for p in data.get('prompts') or [] if isinstance(p, str) and p.strip()]
+    prompt = (data.get('prompt') or '').strip()
+    if any(len(p) > 1000 for p in prompts + [prompt]):
+        return JsonResponse({'error': 'Prompt is too long. Please keep it under 1000 characters.'}, status=400)
+    
+    seeds = data.get('seeds')
+    if seeds and not all(isinstance(seed, int) and 0 <= seed < 2 ** 63 for seed in seeds):
+        return JsonResponse({'error': '"seeds" must hold non-negative integers'}, status=400)
+    variations = _parse_int(data.get('variations'))
+    cost = batch_size(prompts, prompt, seeds, variations)
+    if cost > settings.GENERATION_BATCH_MAX_ITEMS:
+        return JsonResponse({'error': f"A batch is limited to {settings.GENERATION_BATCH_MAX_ITEMS} images"}, status=400)
+    tenant, rejection = await aadmit(request, cost=max(1, cost))
+    if rejection:
+        return _rejected(request, rejection, template=None)
+    
+    try:
+        items = build_batch(prompts=prompts or None, prompt=prompt or None, seeds=seeds, variations=variations)
+    except GenerationError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    jobs = await aenqueue_batch(
+        items, use_cache=bool(data.get('use_cache', True)), tenant=tenant.key, weight=tenant.weight,
+    )
+    logger.info(f"Queued a batch of {len(jobs)} generation jobs")
+    return JsonResponse({'jobs': [job_payload(job) for job in jobs]}, status=202)
+
+
+def _gallery_params(request):
+    return request.GET.get('q', '').strip(), request.GET.get('before'), request.GET.get('after')
+
+
+def _gallery_version(request):
+    # Read once per request: by the ETag check and by the view
+    if not hasattr(request, '_gallery_version'):
+        request._gallery_version = gallery_version()
+    return request._gallery_version
+
+
+def _gallery_etag(request):
+    return page_etag(request, _gallery_version(request), *_gallery_params(request))
+
+
+@page_condition(_gallery_etag)
+async def gallery(request):
+    """Display gallery of generated images, one keyset page at a time, optionally filtered by a prompt search"""
+    query, before, after = _gallery_params(request)
+
+    async def render_grid():
+        # search_images may check the database for the full-text table once
+        queryset = await sync_to_async(search_images)(GeneratedImage.objects.for_listing(), query)
+        page = await apaginate_newest_first(
+            queryset,
+            settings.GALLERY_PAGE_SIZE,
+            before=before,
+            after=after,
+        )
+        return render_to_string('generator/gallery_grid.html', {
+            'images': page.items,
+            'page': page,
+            'query': query,
+        })
+
     try:
-        images = GeneratedImage.objects.all()[:50]  # Last 50 images
-        return render(request, 'generator/gallery.html', {'images': images})
+        grid = await agallery_fragment(_gallery_version(request), (query, before, after), render_grid)
+        response = render(request, 'generator/gallery.html', {'grid': mark_safe(grid), 'query': query})
     except Exception as e:
         logger.error(f"Error in gallery: {str(e)}")
         messages.error(request, 'Error loading gallery')
         return redirect('index')
+    # Always revalidated, answered 304 from the ETag while nothing changed
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
-def download_image(request, image_id):
-    """Download generated image"""
-    import base64
+async def similar_prompts(request):
+    """Return the existing images whose prompt resembles ?prompt=, so they can be reused"""
+    prompt = request.GET.get('prompt', '').strip()
+    if len(prompt) < 3:
+        return JsonResponse({'items': []})
+    matches = await sync_to_async(similar_images)(prompt[:1000], queryset=GeneratedImage.objects.for_listing())
+    return JsonResponse({'items': [
+        {
+            'id': image.id,
+            'prompt': image.prompt,
+            'similarity': similarity,
+            'url': image.src_url,
+            'thumbnail_url': image.thumbnail_url,
+            'download_url': reverse('download_image', args=[image.id]),
+        }
+        for image, similarity in matches
+    ]})
+
+
+def _thumbnail_params(request):
+    """Return the (size, format) requested for a thumbnail"""
+    try:
+        size = int(request.GET.get('size', DEFAULT_THUMBNAIL_SIZE))
+    except ValueError:
+        size = DEFAULT_THUMBNAIL_SIZE
+    fmt = request.GET.get('format') or negotiate_format(request.headers.get('Accept'))
+    return size, fmt
+
+
+async def image_thumbnail(request, image_id):
+    """Serve a small WebP/AVIF/JPEG rendition of an image"""
+    image = await aget_object_or_404(GeneratedImage.objects.only('blob_key'), id=image_id)
+    if not image.blob_key:
+        raise Http404("Image is not held in the blob store")
+    
+    size, fmt = _thumbnail_params(request)
+    etag = f'"{image.blob_key[:16]}-{size}-{fmt}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        try:
+            # Rendered on first request when no background rendition exists yet
+            path = await sync_to_async(get_thumbnail, thread_sensitive=False)(image.blob_key, size, fmt)
+        except ValueError as e:
+            raise Http404(str(e))
+        response = stream_file(request, path, rendition_formats()[fmt][1])
     
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    if 'format' not in request.GET:
+        response['Vary'] = 'Accept'
+    return response
+
+
+async def image_file(request, image_id):
+    """Serve the full-size image bytes from the blob store"""
+    image = await aget_object_or_404(GeneratedImage.objects.only('blob_key', 'mime_type', 'created_at'), id=image_id)
+    if not image.blob_key:
+        raise Http404("Image is not held in the blob store")
+    
+    return serve_blob(request, image.blob_key, image.mime_type or 'image/png', last_modified=image.created_at)
+
+
+async def download_image(request, image_id):
+    """Download generated image"""
     try:
-        image = get_object_or_404(GeneratedImage, id=image_id)
+        image = await aget_object_or_404(GeneratedImage, id=image_id)
         
-        # Handle base64 data URLs from Stable Diffusion
-        if image.image_url.startswith('data:image'):
-            # Extract base64 data from data URL
-            header, data = image.image_url.split(',', 1)
-            image_data = base64.b64decode(data)
-            
-            # Generate filename
-            safe_prompt = "".join(c for c in image.prompt[:50] if c.isalnum() or c in (' ', '-', '_')).rstrip()
-            filename = f"{safe_prompt}_{image.id}.png"
-            
-            response = HttpResponse(image_data, content_type='image/png')
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
-            
-        else:
-            # Handle regular URLs (fallback for legacy images)
-            response = requests.get(image.image_url, timeout=30)
-            response.raise_for_status()
-            
-            # Generate filename
-            safe_prompt = "".join(c for c in image.prompt[:50] if c.isalnum() or c in (' ', '-', '_')).rstrip()
-            filename = f"{safe_prompt}_{image.id}.png"
-            
-            http_response = HttpResponse(response.content, content_type='image/png')
-            http_response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return http_response
+        if not image.blob_key:
+            # Legacy remote image: fetch it once into the blob store, then serve it locally
+            stored = await sync_to_async(store_remote_image, thread_sensitive=False)(image.image_url)
+            for field, value in stored.as_fields().items():
+                setattr(image, field, value)
+            image.image_url = ''
+            await image.asave(update_fields=list(stored.as_fields()) + ['image_url'])
+        
+        return serve_blob(
+            request,
+            image.blob_key,
+            image.mime_type or 'image/png',
+            last_modified=image.created_at,
+            filename=download_filename(image.prompt, image.id, image.mime_type),
+        )
         
     except Exception as e:
         logger.error(f"Error downloading image {image_id}: {str(e)}")
@@ -127,14 +394,50 @@ def download_image(request, image_id):
         return redirect('gallery')
 
 
-def delete_image(request, image_id):
+def _parse_ids(value):
+    """Return the ids of a comma-separated list, or None when there is no list"""
+    if not value:
+        return None
+    return [int(part) for part in value.split(',') if part.strip().isdigit()]
+
+
+async def export_gallery(request):
+    """
+    Download a ZIP or tar of the images with a JSONL manifest of their prompts.
+
+    Exports every image, the ?ids= selection or the ?q= search results. The
+    archive is streamed as it is built, so its size does not matter.
+    """
+    archive_format = request.GET.get('format', 'zip')
+    if archive_format not in ARCHIVE_FORMATS:
+        return JsonResponse({'error': f"format must be one of: {', '.join(ARCHIVE_FORMATS)}"}, status=400)
+    
+    queryset = export_queryset(_parse_ids(request.GET.get('ids')))
+    query = request.GET.get('q', '').strip()
+    if query:
+        queryset = await sync_to_async(search_images)(queryset, query)
+    
+    chunks = export_archive(queryset, archive_format)
+    if served_over_asgi(request):
+        chunks = aiter_in_thread(chunks)
+    content_type, extension = ARCHIVE_FORMATS[archive_format]
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="gallery-{timezone.now():%Y%m%d-%H%M%S}.{extension}"'
+    )
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def delete_image(request, image_id):
     """Delete generated image from gallery"""
     if request.method != 'POST':
         return redirect('gallery')
     
     try:
-        image = get_object_or_404(GeneratedImage, id=image_id)
-        image.delete()
+        image = await aget_object_or_404(GeneratedImage.objects.only('id'), id=image_id)
+        # Also releases the blob and thumbnails when no other image shares them
+        await sync_to_async(delete_images)(GeneratedImage.objects.filter(id=image.id))
         messages.success(request, 'Image deleted successfully')
     except Exception as e:
         logger.error(f"Error deleting image {image_id}: {str(e)}")
@@ -143,4 +446,32 @@ def delete_image(request, image_id):
     return redirect('gallery')
 
 
-# OpenAI function removed - now using Stable Diffusion
+async def metrics(request):
+    """Prometheus metrics of the web and worker processes, plus live queue and backend state"""
+    token = settings.METRICS_TOKEN
+    if token:
+        if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    elif not settings.DEBUG:
+        # Queue sizes and backend state are not public: without a token, only in development
+        return HttpResponse('Forbidden: set METRICS_TOKEN to scrape /metrics', status=403, content_type='text/plain')
+
+    body = render_metrics(collect())
+    job_counts = GenerationJob.objects.values_list('status').annotate(count=Count('id')).order_by()
+    job_counts = [row async for row in job_counts]
+    body += render_gauge(
+        'generation_jobs', 'Generation jobs by status',
+        [((status,), count) for status, count in job_counts], ['status'],
+    )
+    backends = built_backends()
+    body += render_gauge(
+        'generation_circuit_open', 'Circuit breaker of the backend is open or half-open',
+        [((name,), int(backend.circuit.state != 'closed'))
+         for name, backend in backends.items() if hasattr(backend, 'circuit')],
+        ['backend'],
+    )
+    body += render_gauge(
+        'generation_model_loading', 'The backend model is cold-starting',
+        [((name,), int(backend.cold_start.is_loading)) for name, backend in backends.items()], ['backend'],
+    )
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
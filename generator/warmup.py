@@ -0,0 +1,162 @@
+"""
+Model warm-up and cold-start coordination for the inference endpoint.
+
+The hosted model is unloaded after idling and answers 503 with an
+``estimated_time`` while it loads again. ColdStartGate remembers that state
+so requests arriving during a known cold start wait on one shared event
+(woken by the first success) instead of each polling and sleeping on its
+own. ModelWarmer primes the model at startup and can keep it warm with a
+periodic ping.
+"""
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+_listeners = []
+
+
+def on_cold_start(listener):
+    """
+    Register listener(gate, seconds_until_ready) for every gate of the process.
+
+    It is called whenever a cold start is observed or its estimate changes,
+    and with None once the model is ready again.
+    """
+    _listeners.append(listener)
+    return listener
+
+
+def _notify(gate, seconds_until_ready):
+    for listener in _listeners:
+        try:
+            listener(gate, seconds_until_ready)
+        except Exception as e:
+            logger.warning(f"Cold-start listener failed: {e}")
+
+
+class ColdStartGate:
+    """Shared view of whether the model is loading and when it should be ready"""
+
+    def __init__(self, history=20):
+        self._ready = threading.Event()
+        self._ready.set()
+        self._lock = threading.Lock()
+        self.expected_ready_at = None
+        self.loading_since = None
+        self.observed_estimates = deque(maxlen=history)
+        self.cold_starts = 0
+
+    @property
+    def is_loading(self):
+        return not self._ready.is_set()
+
+    def mark_loading(self, estimated_time=None):
+        """Record a 503 'model loading' answer"""
+        with self._lock:
+            now = time.monotonic()
+            if not self.is_loading:
+                self.cold_starts += 1
+                self.loading_since = now
+            if estimated_time is not None:
+                self.observed_estimates.append(float(estimated_time))
+                self.expected_ready_at = now + float(estimated_time)
+            elif self.expected_ready_at is None:
+                self.expected_ready_at = now + (self.typical_estimate() or 10.0)
+            self._ready.clear()
+        _notify(self, self.seconds_until_ready())
+
+    def mark_ready(self):
+        """Record a successful answer and wake every waiting request"""
+        with self._lock:
+            was_loading = self.is_loading
+            self.expected_ready_at = None
+            self.loading_since = None
+            self._ready.set()
+        if was_loading:
+            _notify(self, None)
+
+    def seconds_until_ready(self):
+        if not self.is_loading or self.expected_ready_at is None:
+            return 0.0
+        return max(0.0, self.expected_ready_at - time.monotonic())
+
+    def wait(self, timeout=None):
+        """
+        Block while a cold start is in progress.
+
+        Returns as soon as another request observes the model ready, or once
+        the expected load time (capped by timeout) has elapsed.
+        """
+        if not self.is_loading:
+            return True
+        wait_for = self.seconds_until_ready()
+        if timeout is not None:
+            wait_for = min(wait_for, timeout)
+        return self._ready.wait(wait_for)
+
+    def typical_estimate(self):
+        return statistics.median(self.observed_estimates) if self.observed_estimates else None
+
+    def snapshot(self):
+        return {
+            'loading': self.is_loading,
+            'seconds_until_ready': round(self.seconds_until_ready(), 1),
+            'cold_starts': self.cold_starts,
+            'typical_estimated_time': self.typical_estimate(),
+        }
+
+
+class ModelWarmer:
+    """Primes the model once, then optionally pings it every ``interval`` seconds"""
+
+    def __init__(self, service, interval=0):
+        self.service = service
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._thread = threading.Thread(target=self._run, name='model-warmer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                ready = self.service.warm_up()
+            except Exception as e:
+                logger.warning(f"Model warm-up failed: {e}")
+                ready = False
+
+            gate = self.service.cold_start
+            if not ready and gate.is_loading:
+                # Poll again when the model should have finished loading
+                delay = max(1.0, gate.seconds_until_ready())
+            elif self.interval:
+                delay = self.interval
+            else:
+                # Priming only: done once the model answered (or the API failed)
+                return
+            self._stop.wait(delay)
+
+
+_warmer = None
+_warmer_lock = threading.Lock()
+
+
+def start_model_warmer(service, interval=0):
+    """Start the process-wide warmer once and return it"""
+    global _warmer
+    with _warmer_lock:
+        if _warmer is None:
+            _warmer = ModelWarmer(service, interval).start()
+        return _warmer
@@ -0,0 +1,51 @@
+"""
+Configuration Gunicorn, lue automatiquement depuis le répertoire courant
+(`gunicorn main:app`). Les options de la ligne de commande restent prioritaires.
+"""
+import os
+
+import decouple
+
+# GUNICORN_PRELOAD=True : le master charge l'application une seule fois avant de
+# forker ; les workers (et ceux qui remplacent un worker mort) démarrent alors
+# sans réimporter Django. Voir generator/startup.py.
+preload_app = decouple.config('GUNICORN_PRELOAD', default=False, cast=bool)
+
+# GENERATION_WORKER_SUPERVISED=True : le master lance aussi `manage.py
+# rungenerationworker` dans un processus séparé, le relance s'il s'arrête et
+# l'arrête avec le serveur (déploiements à commande unique, comme .replit).
+# Voir generator/supervisor.py.
+supervise_worker = decouple.config('GENERATION_WORKER_SUPERVISED', default=False, cast=bool)
+
+_supervisor = None
+
+if preload_app:
+    os.environ['GENERATOR_PRELOADED'] = 'true'
+
+    def pre_fork(server, worker):
+        from generator.startup import prepare_fork
+
+        prepare_fork()
+
+    def post_fork(server, worker):
+        from generator.startup import after_fork
+
+        after_fork()
+
+
+def when_ready(server):
+    global _supervisor
+
+    if preload_app:
+        from generator.startup import warm_process
+
+        warm_process()
+    if supervise_worker:
+        from generator.supervisor import ProcessSupervisor
+
+        _supervisor = ProcessSupervisor().start()
+
+
+def on_exit(server):
+    if _supervisor is not None:
+        _supervisor.stop()
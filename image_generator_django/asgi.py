@@ -1,7 +1,10 @@
 """
 ASGI config for image_generator_django project.
 
-It exposes the ASGI callable as a module-level variable named ``application``.
+It exposes the ASGI callable as a module-level variable named ``application``,
+served with e.g. ``uvicorn image_generator_django.asgi:application --workers 2``.
+The generator views are coroutines, so under ASGI a worker process keeps
+many requests waiting on the inference API without a thread per request.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +16,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'image_generator_django.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once the app registry is ready
+from generator.progress import websocket_job_events  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """Django for HTTP, generator.progress for the job progress WebSockets (/ws/jobs/<id>/)"""
+    if scope['type'] == 'websocket':
+        await websocket_job_events(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -62,6 +62,20 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request timings for /metrics; profiling of single requests sent with an X-Profile header
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=False, cast=bool)
+PROFILING_TOKEN = config('PROFILING_TOKEN', default='')
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'generator.middleware.MetricsMiddleware')
+if PROFILING_ENABLED:
+    MIDDLEWARE.insert(0, 'generator.middleware.ProfilingMiddleware')
+
+# Adds an X-DB-Query-Count header to every response (used by `manage.py runbenchmark`)
+QUERY_COUNT_HEADER = config('QUERY_COUNT_HEADER', default=False, cast=bool)
+if QUERY_COUNT_HEADER:
+    MIDDLEWARE.insert(0, 'generator.middleware.QueryCountMiddleware')
+
 ROOT_URLCONF = 'image_generator_django.urls'
 
 TEMPLATES = [
@@ -85,10 +99,22 @@ WSGI_APPLICATION = 'image_generator_django.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+SQLITE_OPTIONS = {
+    # Wait for the lock instead of failing with "database is locked"
+    'timeout': config('SQLITE_TIMEOUT', default=20, cast=int),
+    # Take the write lock when a transaction starts, so the web and worker
+    # processes queue up instead of failing on lock upgrades
+    'transaction_mode': 'IMMEDIATE',
+}
+# Write-ahead logging: readers no longer block on the writer (and vice versa)
+if config('SQLITE_WAL', default=True, cast=bool):
+    SQLITE_OPTIONS['init_command'] = 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': config('SQLITE_PATH', default=str(BASE_DIR / 'db.sqlite3')),
+        'OPTIONS': dict(SQLITE_OPTIONS),
     }
 }
 
@@ -100,6 +126,13 @@ if DATABASE_URL:
         DATABASES['default'] = dj_database_url.parse(DATABASE_URL)
     except ImportError:
         pass  # dj_database_url not available, use default SQLite
+# A sqlite:// DATABASE_URL (as in docker-compose.yml) gets the same options
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['OPTIONS'] = {**SQLITE_OPTIONS, **DATABASES['default'].get('OPTIONS', {})}
+
+# Keep database connections open between requests (seconds, 0 to close after each request)
+DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=60, cast=int)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
 
 
 # Password validation
@@ -142,14 +175,176 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Static files are served by the app process through WhiteNoise when it is installed
+# (`pip install ".[static]"`): collectstatic writes content-hashed names plus gzip and
+# brotli copies, served with a one-year immutable Cache-Control
+try:
+    import whitenoise  # noqa: F401
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+                      'whitenoise.middleware.WhiteNoiseMiddleware')
+    STATICFILES_BACKEND = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+except ImportError:
+    STATICFILES_BACKEND = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': config('STATICFILES_BACKEND', default=STATICFILES_BACKEND),
+    },
+}
+
 # Media files for user uploads (if needed in future)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Content-addressed store for generated image bytes
+IMAGE_STORE_ROOT = config('IMAGE_STORE_ROOT', default=str(MEDIA_ROOT / 'blobs'))
+# Offload image transfers to the front server: '' (stream from Django),
+# 'x-sendfile' (Apache/lighttpd) or 'x-accel-redirect' (nginx internal location
+# IMAGE_ACCEL_REDIRECT_PREFIX mapped onto IMAGE_STORE_ROOT)
+IMAGE_SENDFILE_MODE = config('IMAGE_SENDFILE_MODE', default='')
+IMAGE_ACCEL_REDIRECT_PREFIX = config('IMAGE_ACCEL_REDIRECT_PREFIX', default='/protected-blobs/')
+IMAGE_RENDITION_ROOT = config('IMAGE_RENDITION_ROOT', default=str(MEDIA_ROOT / 'renditions'))
+# Processes rendering thumbnails, WebP/AVIF variants and placeholders after each
+# generation (0: render on first request only)
+RENDITION_POOL_SIZE = config('RENDITION_POOL_SIZE', default=2, cast=int)
+
+# Rows read per database round trip by the streaming gallery export
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=500, cast=int)
+
+# Lifecycle of generated images, applied by the enforceretention command
+# (0 disables a rule). Images past the age, beyond the newest N or outside the
+# newest byte budget are deleted; older images are moved to the archive tier
+# (lossless WebP)
+RETENTION_MAX_AGE_DAYS = config('RETENTION_MAX_AGE_DAYS', default=0, cast=int)
+RETENTION_MAX_IMAGES = config('RETENTION_MAX_IMAGES', default=0, cast=int)
+RETENTION_MAX_BYTES = config('RETENTION_MAX_BYTES', default=0, cast=int)
+IMAGE_ARCHIVE_AFTER_DAYS = config('IMAGE_ARCHIVE_AFTER_DAYS', default=0, cast=int)
+RETENTION_JOB_MAX_AGE_DAYS = config('RETENTION_JOB_MAX_AGE_DAYS', default=30, cast=int)
+# Rows deleted per transaction
+RETENTION_BATCH_SIZE = config('RETENTION_BATCH_SIZE', default=500, cast=int)
+# VACUUM the SQLite file once this share of its pages is free
+RETENTION_VACUUM_FREE_RATIO = config('RETENTION_VACUUM_FREE_RATIO', default=0.25, cast=float)
+
+# Number of images per gallery page
+GALLERY_PAGE_SIZE = config('GALLERY_PAGE_SIZE', default=24, cast=int)
+
+# Rendered gallery grids (generator.pagecache). The cache must be shared by the web and
+# worker processes, which invalidate it when they save images: a directory by default,
+# or e.g. PAGE_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache with a redis:// location
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pages': {
+        'BACKEND': config('PAGE_CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('PAGE_CACHE_LOCATION', default=str(MEDIA_ROOT / 'page-cache')),
+    },
+}
+PAGE_CACHE_ALIAS = 'pages'
+PAGE_CACHE_TIMEOUT = config('PAGE_CACHE_TIMEOUT', default=3600, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Generation engine: huggingface, procedural (local CPU renderer, no network),
+# stub (instant placeholder images for load tests) or a dotted path to a backend.
+# With GENERATION_BACKEND_CANDIDATES (comma separated) the cheapest candidate able
+# to serve each request is picked instead.
+GENERATION_BACKEND = config('GENERATION_BACKEND', default='huggingface')
+GENERATION_BACKEND_CANDIDATES = config('GENERATION_BACKEND_CANDIDATES', default='', cast=Csv())
+GENERATION_STUB_LATENCY = config('GENERATION_STUB_LATENCY', default=0.0, cast=float)
+
 # Hugging Face Configuration
 HUGGINGFACE_API_KEY = config('HUGGINGFACE_API_KEY', default=None)
+HUGGINGFACE_API_URL = config('HUGGINGFACE_API_URL', default=None)  # e.g. a local `runinferencestub`
+# Pooled HTTP connections to the inference endpoint
+GENERATION_HTTP_POOL_SIZE = config('GENERATION_HTTP_POOL_SIZE', default=10, cast=int)
+# Connections of the async client (views served over ASGI), so many calls can wait on the API at once
+GENERATION_ASYNC_POOL_SIZE = config('GENERATION_ASYNC_POOL_SIZE', default=200, cast=int)
+GENERATION_HTTP_TIMEOUT = config('GENERATION_HTTP_TIMEOUT', default=60, cast=float)
+# Retries: exponential backoff with jitter inside an overall per-request deadline (seconds)
+GENERATION_RETRY_MAX_ATTEMPTS = config('GENERATION_RETRY_MAX_ATTEMPTS', default=3, cast=int)
+GENERATION_RETRY_BASE_DELAY = config('GENERATION_RETRY_BASE_DELAY', default=1.0, cast=float)
+GENERATION_RETRY_MAX_DELAY = config('GENERATION_RETRY_MAX_DELAY', default=30.0, cast=float)
+GENERATION_REQUEST_DEADLINE = config('GENERATION_REQUEST_DEADLINE', default=120.0, cast=float)
+# Circuit breaker: open after N consecutive 5xx/timeouts, probe again after the reset timeout
+GENERATION_CIRCUIT_FAILURE_THRESHOLD = config('GENERATION_CIRCUIT_FAILURE_THRESHOLD', default=5, cast=int)
+GENERATION_CIRCUIT_RESET_TIMEOUT = config('GENERATION_CIRCUIT_RESET_TIMEOUT', default=30.0, cast=float)
+# Seconds a health observation stays valid before is_available() probes the API
+GENERATION_HEALTH_TTL = config('GENERATION_HEALTH_TTL', default=30.0, cast=float)
+# Identical concurrent generations (across threads and worker processes) share one
+# upstream call; a lease not finished after GENERATION_COALESCE_LEASE_TTL seconds is taken over
+GENERATION_COALESCE = config('GENERATION_COALESCE', default=True, cast=bool)
+GENERATION_COALESCE_LEASE_TTL = config('GENERATION_COALESCE_LEASE_TTL', default=180, cast=int)
+GENERATION_COALESCE_POLL_INTERVAL = config('GENERATION_COALESCE_POLL_INTERVAL', default=0.25, cast=float)
+# Warm-up: prime the model when a server or worker process starts, and optionally
+# ping it every GENERATION_KEEP_WARM_INTERVAL seconds (0 disables; each ping uses quota)
+GENERATION_WARMUP_ON_STARTUP = config('GENERATION_WARMUP_ON_STARTUP', default=True, cast=bool)
+GENERATION_KEEP_WARM_INTERVAL = config('GENERATION_KEEP_WARM_INTERVAL', default=0, cast=int)
+# Images are stored exactly as returned by the API unless a format is set here
+# (webp, avif, jpeg or png); only then is the image decoded and re-encoded.
+GENERATION_OUTPUT_FORMAT = config('GENERATION_OUTPUT_FORMAT', default='')
+GENERATION_OUTPUT_QUALITY = config('GENERATION_OUTPUT_QUALITY', default=90, cast=int)
+
+# Generation job queue (see `python manage.py rungenerationworker`)
+GENERATION_WORKER_CONCURRENCY = config('GENERATION_WORKER_CONCURRENCY', default=2, cast=int)
+GENERATION_WORKER_POLL_INTERVAL = config('GENERATION_WORKER_POLL_INTERVAL', default=1.0, cast=float)
+# Running jobs older than this (seconds) belong to a dead worker: every worker
+# requeues them at startup and then every GENERATION_REQUEUE_INTERVAL seconds,
+# and fails the ones already claimed GENERATION_JOB_MAX_ATTEMPTS times
+GENERATION_JOB_TIMEOUT = config('GENERATION_JOB_TIMEOUT', default=600, cast=int)
+GENERATION_REQUEUE_INTERVAL = config('GENERATION_REQUEUE_INTERVAL', default=60, cast=float)
+GENERATION_JOB_MAX_ATTEMPTS = config('GENERATION_JOB_MAX_ATTEMPTS', default=3, cast=int)
+# Progress streams (jobs/<id>/events/): database poll interval, and how long one
+# server-sent event stream stays open before the browser reconnects (keep it under
+# the gunicorn worker timeout, 30s by default, when running sync workers)
+JOB_EVENTS_POLL_INTERVAL = config('JOB_EVENTS_POLL_INTERVAL', default=0.5, cast=float)
+JOB_EVENTS_MAX_DURATION = config('JOB_EVENTS_MAX_DURATION', default=25, cast=float)
+
+# Admission control (generator.admission). Token buckets per tenant (user, else session,
+# else client address) and per client address: BURST generations at once, refilled at
+# PER_MINUTE; excess requests get 429 with Retry-After
+RATE_LIMIT_ENABLED = config('RATE_LIMIT_ENABLED', default=True, cast=bool)
+RATE_LIMIT_BURST = config('RATE_LIMIT_BURST', default=10, cast=int)
+RATE_LIMIT_PER_MINUTE = config('RATE_LIMIT_PER_MINUTE', default=6, cast=float)
+RATE_LIMIT_IP_BURST = config('RATE_LIMIT_IP_BURST', default=30, cast=int)
+RATE_LIMIT_IP_PER_MINUTE = config('RATE_LIMIT_IP_PER_MINUTE', default=20, cast=float)
+# Only behind a proxy that sets X-Forwarded-For (otherwise clients can spoof it)
+RATE_LIMIT_TRUST_X_FORWARDED_FOR = config('RATE_LIMIT_TRUST_X_FORWARDED_FOR', default=False, cast=bool)
+# Queue caps (0: unlimited), and the fair share of worker slots: signed-in users weigh
+# GENERATION_USER_WEIGHT, anonymous clients 1; at most GENERATION_MAX_RUNNING jobs run
+# across all workers
+GENERATION_MAX_QUEUED = config('GENERATION_MAX_QUEUED', default=200, cast=int)
+GENERATION_MAX_QUEUED_PER_TENANT = config('GENERATION_MAX_QUEUED_PER_TENANT', default=5, cast=int)
+GENERATION_USER_WEIGHT = config('GENERATION_USER_WEIGHT', default=2, cast=int)
+GENERATION_MAX_RUNNING = config('GENERATION_MAX_RUNNING', default=8, cast=int)
+# Typical duration of one generation, for Retry-After estimates of a full queue
+GENERATION_TYPICAL_SECONDS = config('GENERATION_TYPICAL_SECONDS', default=15, cast=float)
+
+# Cache of generation results keyed on the request payload
+# BACKEND: memory (per process LRU), disk (shared directory), django (CACHES alias) or none
+GENERATION_CACHE = {
+    'BACKEND': config('GENERATION_CACHE_BACKEND', default='memory'),
+    'MAX_BYTES': config('GENERATION_CACHE_MAX_BYTES', default=256 * 1024 * 1024, cast=int),
+    'MAX_AGE': config('GENERATION_CACHE_MAX_AGE', default=7 * 24 * 3600, cast=int),
+    'LOCATION': config('GENERATION_CACHE_LOCATION', default=str(MEDIA_ROOT / 'generation-cache')),
+    'CACHE_ALIAS': config('GENERATION_CACHE_ALIAS', default='default'),
+}
+
+# Metrics (/metrics): each process flushes its counters to METRICS_DIR so the endpoint
+# can sum web and worker processes; leave empty to only report the serving process.
+# Scrapers must send "Authorization: Bearer <METRICS_TOKEN>"; without a token the
+# endpoint only answers when DEBUG is on.
+METRICS_DIR = config('METRICS_DIR', default=str(MEDIA_ROOT / 'metrics'))
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5.0, cast=float)
+# Snapshots not rewritten for this long are dropped (processes that died on another host)
+METRICS_SNAPSHOT_MAX_AGE = config('METRICS_SNAPSHOT_MAX_AGE', default=3600, cast=int)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Batch generation: batch/ and api/batch/ queue one job per image (at most
+# GENERATION_BATCH_MAX_ITEMS); `python manage.py generatebatch` generates
+# inline, GENERATION_BATCH_CONCURRENCY at a time
+GENERATION_BATCH_MAX_ITEMS = config('GENERATION_BATCH_MAX_ITEMS', default=16, cast=int)
+GENERATION_BATCH_CONCURRENCY = config('GENERATION_BATCH_CONCURRENCY', default=4, cast=int)
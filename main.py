@@ -1,9 +1,9 @@
 """
 Point d'entrée WSGI pour l'application Django de génération d'images IA
 """
+import gc
 import os
 import sys
-import django
 from django.core.wsgi import get_wsgi_application
 
 # Ajouter le répertoire du projet au PATH Python
@@ -12,8 +12,11 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 # Configuration de l'environnement Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'image_generator_django.settings')
 
-# Initialisation de Django
-django.setup()
-
-# Application WSGI pour Gunicorn
-app = get_wsgi_application()
\ No newline at end of file
+# Application WSGI pour Gunicorn (get_wsgi_application() initialise Django).
+# Les objets créés au chargement vivent autant que le processus : le ramasse-miettes
+# est suspendu pendant l'initialisation au lieu de les parcourir plusieurs fois.
+gc.disable()
+try:
+    app = get_wsgi_application()
+finally:
+    gc.enable()
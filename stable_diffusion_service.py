@@ -1,15 +1,33 @@
 """
 Service pour la génération d'images avec Stable Diffusion via Hugging Face
 """
+import asyncio
+import logging
 import os
-import requests
-import base64
+import random
+import threading
 from io import BytesIO
-from PIL import Image
 import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
 
+from generator.imageinfo import sniff_image
+from generator.metrics import CACHE_REQUESTS, FAILURES, RETRIES, UPSTREAM_REQUESTS, span
+from generator.resilience import CircuitBreaker, Deadline, ExponentialBackoff, HealthState
+from generator.warmup import ColdStartGate
 
-# Instance globale du service
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_API_URL = "https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-xl-base-1.0"
+
+# Taille des morceaux lus sur la réponse HTTP
+CHUNK_SIZE = 64 * 1024
+
+# Formats de transcodage explicite (output_format) -> format PIL
+TRANSCODE_FORMATS = {"webp": "WEBP", "avif": "AVIF", "jpeg": "JPEG", "png": "PNG"}
+
+# Instance globale du service, créée au premier appel de get_stable_diffusion_service()
 stable_diffusion_service = None
 
 def get_stable_diffusion_service():
@@ -19,122 +37,756 @@ def get_stable_diffusion_service():
         stable_diffusion_service = StableDiffusionService()
     return stable_diffusion_service
 
-class StableDiffusionService:
-    def __init__(self):
-        self.api_key = os.environ.get('HUGGINGFACE_API_KEY')
+def _setting(name, default=None):
+    """Lit un réglage Django s'il est configuré, sinon la variable d'environnement du même nom"""
+    try:
+        from django.conf import settings
+        if settings.configured and hasattr(settings, name):
+            return getattr(settings, name)
+    except ImportError:
+        pass
+    return os.environ.get(name, default)
+
+def _load_httpx():
+    """Renvoie le module httpx, ou None si l'extra « async » n'est pas installé"""
+    try:
+        import httpx
+    except ImportError:
+        return None
+    return httpx
+
+def _default_cache():
+    """Construit le cache de résultats à partir du réglage Django GENERATION_CACHE"""
+    config = _setting('GENERATION_CACHE')
+    if not config:
+        return None
+    from generator.cache import build_generation_cache
+    return build_generation_cache(config)
+
+
+def model_loading(status_code, body):
+    """
+    Vrai pour une réponse « modèle en cours de chargement » : un 503 dont le
+    corps annonce estimated_time. Tout autre 503 est une panne de l'API.
+    """
+    return status_code == 503 and isinstance(body, dict) and "estimated_time" in body
+
+
+class RetryPolicy:
+    """
+    Politique de retry partagée par les chemins synchrone et asynchrone.
+
+    Backoff exponentiel avec jitter, borné par un budget de temps global
+    (Deadline) pour l'ensemble des tentatives. next_delay() renvoie le
+    nombre de secondes à attendre avant la tentative suivante, ou None s'il
+    faut abandonner.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=30.0, deadline=120.0, max_loading_delay=30.0):
+        self.max_attempts = max_attempts
+        self.backoff = ExponentialBackoff(base=base_delay, cap=max_delay)
+        self.deadline = deadline
+        self.max_loading_delay = max_loading_delay
+
+    def start(self):
+        """Ouvre le budget de temps d'une requête"""
+        return Deadline(self.deadline)
+
+    def is_retryable(self, status_code):
+        return status_code is None or status_code in (408, 429) or status_code >= 500
+
+    def next_delay(self, attempt, status_code, body=None, deadline=None, retry_after=None):
+        if attempt >= self.max_attempts - 1 or not self.is_retryable(status_code):
+            return None
+        if model_loading(status_code, body):
+            # Modèle en cours de chargement : on attend le temps annoncé
+            delay = min(body["estimated_time"], self.max_loading_delay)
+        elif retry_after is not None:
+            delay = min(retry_after, self.max_loading_delay)
+        else:
+            delay = self.backoff.delay(attempt)
+        # Inutile d'attendre si la tentative suivante dépasserait le budget
+        if deadline is not None and delay >= deadline.remaining():
+            return None
+        return delay
+
+
+@dataclass
+class ImageResult:
+    """Résultat d'une génération"""
+    size: int
+    format: str = None  # 'png', 'jpeg', 'webp'... lu dans l'en-tête, sans décodage
+    data: bytes = None  # octets de l'image, None s'ils ont été écrits dans un sink
+
+
+class _ResultCollector:
+    """Transmet les morceaux reçus au sink et garde l'en-tête (et les octets si nécessaire)"""
+
+    def __init__(self, sink, keep):
+        self.sink = sink
+        self.keep = keep or sink is None
+        self.parts = []
+        self.size = 0
+        self.header = b""
+
+    def write(self, chunk):
+        if self.sink is not None:
+            self.sink.write(chunk)
+        if self.keep:
+            self.parts.append(chunk)
+        if len(self.header) < 64:
+            self.header += chunk[:64]
+        self.size += len(chunk)
+
+    def data(self):
+        if len(self.parts) > 1:
+            self.parts = [b"".join(self.parts)]
+        return self.parts[0] if self.parts else b""
+
+    def result(self):
+        return ImageResult(
+            size=self.size,
+            format=sniff_image(self.header)[0],
+            data=self.data() if self.sink is None else None,
+        )
+
+
+@dataclass
+class BatchItem:
+    """Un élément d'un lot : prompt, graine éventuelle et résultat"""
+    prompt: str
+    seed: int = None
+    image: ImageResult = None  # résultat en cas de succès
+    error: str = None
+    image_id: int = None  # identifiant de l'image enregistrée, renseigné par l'appelant
+
+    @property
+    def ok(self):
+        return self.image is not None
+
+
+def build_batch_items(prompts=None, prompt=None, seeds=None, variations=None, max_items=None):
+    """
+    Construit les éléments d'un lot.
+
+    Soit une liste de prompts, soit un prompt unique décliné sur une liste de
+    graines (ou sur `variations` graines tirées au hasard). Un lot de plus de
+    `max_items` éléments lève ValueError avant que rien ne soit construit.
+    """
+    if max_items is not None and batch_size(prompts, prompt, seeds, variations) > max_items:
+        raise ValueError(f"A batch is limited to {max_items} images")
+    if prompts:
+        return [BatchItem(prompt=p) for p in prompts]
+    if prompt:
+        if not seeds:
+            seeds = [random.randrange(2 ** 32) for _ in range(variations or 1)]
+        return [BatchItem(prompt=prompt, seed=seed) for seed in seeds]
+    return []
+
+
+def batch_size(prompts=None, prompt=None, seeds=None, variations=None):
+    """Nombre d'éléments du lot que build_batch_items construirait"""
+    if prompts:
+        return len(prompts)
+    if prompt:
+        return len(seeds) if seeds else variations or 1
+    return 0
+
+
+@dataclass(frozen=True)
+class BackendCapabilities:
+    """Capacités déclarées par un moteur de génération"""
+    max_width: int
+    max_height: int
+    default_steps: int
+    max_steps: int
+    supports_batching: bool = False  # plusieurs images par appel au moteur
+    requires_network: bool = False
+    relative_cost: float = 1.0  # coût relatif d'une image, pour choisir le moteur le moins cher
+
+    def supports(self, width=1024, height=1024, steps=None):
+        """True si le moteur peut traiter une requête de cette taille"""
+        return (
+            width <= self.max_width and height <= self.max_height
+            and (steps is None or steps <= self.max_steps)
+        )
+
+
+class GenerationBackend:
+    """
+    Interface commune des moteurs de génération.
+
+    Fournit le cache, la génération par lots, le transcodage et l'écriture en
+    flux : un moteur local n'a qu'à implémenter _render(). Le moteur Hugging
+    Face (StableDiffusionService) redéfinit generate_image pour ses appels HTTP.
+    """
+    name = None
+    capabilities = None
+
+    def __init__(self, cache=None):
+        # Cache des résultats par payload (None = pas de cache)
+        self.cache = cache
+        # Démarrage à froid connu du modèle (jamais pour un moteur local)
+        self.cold_start = ColdStartGate()
+
+    def describe(self):
+        """Nom et capacités du moteur"""
+        return {"name": self.name, "capabilities": asdict(self.capabilities)}
+
+    def generate_image(self, prompt, negative_prompt=None, width=1024, height=1024, seed=None, use_cache=True,
+                       sink=None, output_format=None, quality=None):
+        """
+        Génère une image avec le moteur local (mêmes arguments et résultat que
+        StableDiffusionService.generate_image)
+        """
+        try:
+            if not self._check_size(width, height):
+                return self._failed("unsupported_size")
+            payload = self._build_payload(prompt, negative_prompt, width, height, seed)
+            cache_key, cached_bytes = self._cache_lookup(payload, seed, use_cache)
+            if cached_bytes is not None:
+                return self._emit(cached_bytes, sink, output_format, quality)
+
+            collector = self._collector(sink, cache_key, output_format)
+            with span("render", backend=self.name):
+                image_bytes = self._render(prompt, negative_prompt, width, height, seed)
+            collector.write(image_bytes)
+            return self._finish(collector, cache_key, sink, output_format, quality)
+        except Exception as e:
+            logger.error(f"Erreur inattendue ({self.name}): {e}")
+            return self._failed("error")
+
+    async def agenerate_image(self, prompt, negative_prompt=None, width=1024, height=1024, seed=None, use_cache=True,
+                              sink=None, output_format=None, quality=None):
+        """Version coroutine de generate_image (le rendu local s'exécute dans un thread)"""
+        return await asyncio.to_thread(
+            self.generate_image, prompt, negative_prompt, width, height, seed, use_cache, sink, output_format, quality,
+        )
+
+    def _failed(self, reason):
+        """Compte un échec de génération et renvoie None"""
+        FAILURES.inc(backend=self.name, reason=reason)
+        return None
+
+    def _render(self, prompt, negative_prompt, width, height, seed):
+        """Renvoie les octets encodés de l'image (à implémenter par les moteurs locaux)"""
+        raise NotImplementedError
+
+    def _check_size(self, width, height):
+        if self.capabilities.supports(width, height):
+            return True
+        logger.warning(f"Taille {width}x{height} non supportée par le moteur {self.name}")
+        return False
+
+    def warm_up(self):
+        """Un moteur local est toujours prêt"""
+        return True
+
+    def is_available(self):
+        return True
+
+    async def aclose(self):
+        pass
+
+    def _build_payload(self, prompt, negative_prompt, width, height, seed):
+        """Construit le payload envoyé à l'API (et la description normalisée de la requête)"""
+        # Amélioration du prompt avec des mots-clés de qualité
+        enhanced_prompt = f"{prompt}, high quality, detailed, professional, 8k resolution"
+
+        # Prompt négatif par défaut pour améliorer la qualité
+        default_negative = "blurry, low quality, distorted, deformed, ugly, bad anatomy, bad proportions"
+        if negative_prompt:
+            full_negative_prompt = f"{negative_prompt}, {default_negative}"
+        else:
+            full_negative_prompt = default_negative
+
+        payload = {
+            "inputs": enhanced_prompt,
+            "parameters": {
+                "negative_prompt": full_negative_prompt,
+                "width": width,
+                "height": height,
+                "num_inference_steps": self.capabilities.default_steps,
+                "guidance_scale": 7.5
+            }
+        }
+        if seed is not None:
+            payload["parameters"]["seed"] = seed
+        return payload
+
+    def request_key(self, prompt, negative_prompt=None, width=1024, height=1024, seed=None):
+        """Clé déterministe d'une requête (payload normalisé) : deux requêtes identiques ont la même clé"""
+        from generator.cache import generation_cache_key
+        return generation_cache_key(self._build_payload(prompt, negative_prompt, width, height, seed), seed)
+
+    def _cache_lookup(self, payload, seed, use_cache):
+        """Renvoie (clé de cache, octets en cache ou None)"""
+        if self.cache is None:
+            return None, None
+        from generator.cache import generation_cache_key
+        cache_key = generation_cache_key(payload, seed)
+        if not use_cache:
+            return cache_key, None
+        cached_bytes = self.cache.get(cache_key)
+        CACHE_REQUESTS.inc(result="miss" if cached_bytes is None else "hit")
+        return cache_key, cached_bytes
+
+    def generate_batch(self, items, concurrency=4, negative_prompt=None, width=1024, height=1024, use_cache=True,
+                       sink_factory=None, output_format=None, quality=None):
+        """
+        Génère un lot d'images avec au plus `concurrency` appels simultanés.
+
+        Args:
+            items (list[BatchItem]): Éléments à générer (voir build_batch_items)
+            concurrency (int): Nombre maximal de générations en parallèle
+            sink_factory: Fonction item -> sink, pour écrire chaque image en flux
+
+        Returns:
+            list[BatchItem]: Les mêmes éléments, complétés par image ou error
+        """
+        def run(item):
+            item.image = self.generate_image(
+                item.prompt, negative_prompt=negative_prompt, width=width, height=height,
+                seed=item.seed, use_cache=use_cache,
+                sink=sink_factory(item) if sink_factory else None,
+                output_format=output_format, quality=quality,
+            )
+            if item.image is None:
+                item.error = "Image generation failed"
+            return item
+
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items) or 1))) as pool:
+            return list(pool.map(run, items))
+
+    async def agenerate_batch(self, items, concurrency=4, negative_prompt=None, width=1024, height=1024, use_cache=True,
+                              sink_factory=None, output_format=None, quality=None):
+        """Version coroutine de generate_batch (concurrence bornée par un sémaphore)"""
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def run(item):
+            async with semaphore:
+                item.image = await self.agenerate_image(
+                    item.prompt, negative_prompt=negative_prompt, width=width, height=height,
+                    seed=item.seed, use_cache=use_cache,
+                    sink=sink_factory(item) if sink_factory else None,
+                    output_format=output_format, quality=quality,
+                )
+            if item.image is None:
+                item.error = "Image generation failed"
+            return item
+
+        return await asyncio.gather(*(run(item) for item in items))
+
+    def _collector(self, sink, cache_key, output_format):
+        # Avec un transcodage, l'original n'est pas écrit dans le sink
+        keep = cache_key is not None or bool(output_format)
+        return _ResultCollector(None if output_format else sink, keep)
+
+    def _finish(self, collector, cache_key, sink, output_format, quality):
+        """Termine une réponse reçue : mise en cache puis transcodage éventuel"""
+        if cache_key is not None:
+            self.cache.set(cache_key, collector.data())
+        if output_format:
+            return self._emit(collector.data(), sink, output_format, quality)
+        return collector.result()
+
+    def _emit(self, image_bytes, sink, output_format=None, quality=None):
+        """Renvoie des octets complets (cache ou transcodage) au sink ou à l'appelant"""
+        if output_format:
+            image_bytes = self._transcode(image_bytes, output_format, quality)
+        collector = _ResultCollector(sink, keep=False)
+        collector.write(image_bytes)
+        return collector.result()
+
+    def _transcode(self, image_bytes, output_format, quality=None):
+        """Réencode l'image dans le format demandé (seul cas où l'image est décodée)"""
+        pil_format = TRANSCODE_FORMATS.get(output_format.lower())
+        if pil_format is None:
+            raise ValueError(f"Format de sortie non supporté: {output_format}")
+        if sniff_image(image_bytes[:64])[0] == output_format.lower():
+            return image_bytes
+        with span("image_processing", output_format=output_format):
+            return self._reencode(image_bytes, output_format, pil_format, quality)
+
+    def _reencode(self, image_bytes, output_format, pil_format, quality):
+        from PIL import Image
+
+        image = Image.open(BytesIO(image_bytes))
+        if pil_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        buffered = BytesIO()
+        options = {"quality": quality} if quality and pil_format != "PNG" else {}
+        try:
+            image.save(buffered, format=pil_format, **options)
+        except (KeyError, OSError) as e:
+            # Encodeur absent de cette installation de Pillow (AVIF par ex.)
+            logger.warning(f"Transcodage {output_format} impossible, image d'origine conservée: {e}")
+            return image_bytes
+        return buffered.getvalue()
+
+
+class StableDiffusionService(GenerationBackend):
+    """Moteur Hugging Face Inference API (stabilityai/stable-diffusion-xl-base-1.0 par défaut)"""
+    name = "huggingface"
+    capabilities = BackendCapabilities(
+        max_width=1536, max_height=1536, default_steps=50, max_steps=100,
+        supports_batching=False, requires_network=True, relative_cost=1.0,
+    )
+
+    def __init__(self, cache=None, api_url=None, pool_size=None, timeout=None, retry_policy=None):
+        self.api_key = _setting('HUGGINGFACE_API_KEY')
         if not self.api_key:
             raise ValueError("HUGGINGFACE_API_KEY environment variable is required")
-        
-        self.api_url = "https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-xl-base-1.0"
+
+        super().__init__(cache=cache if cache is not None else _default_cache())
+        self.api_url = api_url or _setting('HUGGINGFACE_API_URL') or DEFAULT_API_URL
         self.headers = {"Authorization": f"Bearer {self.api_key}"}
-    
-    def generate_image(self, prompt, negative_prompt=None, width=1024, height=1024):
+        self.timeout = float(timeout or _setting('GENERATION_HTTP_TIMEOUT', 60))
+        self.pool_size = int(pool_size or _setting('GENERATION_HTTP_POOL_SIZE', 10))
+        # Le client asynchrone n'immobilise pas un thread par appel : il peut en garder bien plus en vol
+        self.async_pool_size = int(_setting('GENERATION_ASYNC_POOL_SIZE', 200))
+        self.retry_policy = retry_policy or RetryPolicy(
+            max_attempts=int(_setting('GENERATION_RETRY_MAX_ATTEMPTS', 3)),
+            base_delay=float(_setting('GENERATION_RETRY_BASE_DELAY', 1.0)),
+            max_delay=float(_setting('GENERATION_RETRY_MAX_DELAY', 30.0)),
+            deadline=float(_setting('GENERATION_REQUEST_DEADLINE', 120.0)),
+        )
+        # Coupe-circuit : échec immédiat après des erreurs 5xx/timeouts répétées
+        self.circuit = CircuitBreaker(
+            failure_threshold=int(_setting('GENERATION_CIRCUIT_FAILURE_THRESHOLD', 5)),
+            reset_timeout=float(_setting('GENERATION_CIRCUIT_RESET_TIMEOUT', 30.0)),
+        )
+        self.health = HealthState(
+            self.circuit, probe=self._probe, ttl=float(_setting('GENERATION_HEALTH_TTL', 30.0)),
+        )
+
+        # Session HTTP (requests) et client asynchrone (httpx), créés à la première
+        # utilisation : construire le service ne charge aucune bibliothèque HTTP
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._async_client = None
+        self._async_client_loop = None
+
+    @property
+    def session(self):
+        """Session HTTP partagée : connexions keep-alive réutilisées entre les appels"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.headers.update(self.headers)
+                    self._session = session
+        return self._session
+
+    def generate_image(self, prompt, negative_prompt=None, width=1024, height=1024, seed=None, use_cache=True,
+                       sink=None, output_format=None, quality=None):
         """
         Génère une image à partir d'un prompt texte
-        
+
         Args:
             prompt (str): Description de l'image à générer
             negative_prompt (str): Éléments à éviter dans l'image
             width (int): Largeur de l'image (par défaut 1024)
             height (int): Hauteur de l'image (par défaut 1024)
-        
+            seed (int): Graine de génération (optionnelle, fait partie de la clé de cache)
+            use_cache (bool): False pour ignorer le cache et forcer une nouvelle génération
+            sink: Objet fichier (méthode write) recevant l'image par morceaux, au
+                lieu de la garder en mémoire
+            output_format (str): Transcodage explicite ('webp', 'avif', 'jpeg', 'png') ;
+                par défaut les octets de l'API sont conservés tels quels
+            quality (int): Qualité du transcodage
+
         Returns:
-            str: Image en base64 data URL ou None en cas d'erreur
+            ImageResult: Résultat (data vaut None si l'image a été écrite dans sink)
+            ou None en cas d'erreur
         """
+        import requests
+
+        # Vrai tant qu'une tentative autorisée par le coupe-circuit n'a pas enregistré son résultat
+        unsettled = False
         try:
-            # Amélioration du prompt avec des mots-clés de qualité
-            enhanced_prompt = f"{prompt}, high quality, detailed, professional, 8k resolution"
-            
-            # Prompt négatif par défaut pour améliorer la qualité
-            default_negative = "blurry, low quality, distorted, deformed, ugly, bad anatomy, bad proportions"
-            if negative_prompt:
-                full_negative_prompt = f"{negative_prompt}, {default_negative}"
-            else:
-                full_negative_prompt = default_negative
-            
-            payload = {
-                "inputs": enhanced_prompt,
-                "parameters": {
-                    "negative_prompt": full_negative_prompt,
-                    "width": width,
-                    "height": height,
-                    "num_inference_steps": 50,
-                    "guidance_scale": 7.5
-                }
-            }
-            
-            # Tentative de génération avec retry
-            for attempt in range(3):
-                response = requests.post(
-                    self.api_url,
-                    headers=self.headers,
-                    json=payload,
-                    timeout=60
-                )
-                
-                if response.status_code == 200:
-                    # Conversion de l'image en base64
-                    image_bytes = response.content
-                    image = Image.open(BytesIO(image_bytes))
-                    
-                    # Conversion en base64 pour stockage dans la base de données
-                    buffered = BytesIO()
-                    image.save(buffered, format="PNG")
-                    img_base64 = base64.b64encode(buffered.getvalue()).decode()
-                    
-                    return f"data:image/png;base64,{img_base64}"
-                
-                elif response.status_code == 503:
-                    # Modèle en cours de chargement, on attend
-                    error_data = response.json()
-                    if "estimated_time" in error_data:
-                        wait_time = min(error_data["estimated_time"], 30)
-                        print(f"Modèle en chargement, attente de {wait_time} secondes...")
-                        time.sleep(wait_time)
-                        continue
-                    else:
-                        time.sleep(10)  # Attente par défaut
-                        continue
-                
-                else:
-                    print(f"Erreur API Hugging Face: {response.status_code} - {response.text}")
-                    if attempt < 2:  # Retry pour les autres erreurs
-                        time.sleep(5)
-                        continue
+            if not self._check_size(width, height):
+                return self._failed("unsupported_size")
+            payload = self._build_payload(prompt, negative_prompt, width, height, seed)
+
+            # Un payload identique a déjà été généré : pas d'appel à l'API
+            cache_key, cached_bytes = self._cache_lookup(payload, seed, use_cache)
+            if cached_bytes is not None:
+                return self._emit(cached_bytes, sink, output_format, quality)
+
+            # Coupe-circuit ouvert : échec immédiat sans appeler l'API
+            if not self.circuit.allow_request():
+                logger.warning("Service Hugging Face indisponible (coupe-circuit ouvert)")
+                return self._failed("circuit_open")
+            unsettled = True
+
+            # Tentative de génération avec retry, dans un budget de temps global
+            deadline = self.retry_policy.start()
+            # Modèle en cours de chargement : on attend avec les autres requêtes
+            # au lieu de sonder l'API chacun de son côté
+            if self.cold_start.is_loading:
+                with span("model_loading_wait"):
+                    self.cold_start.wait(timeout=deadline.remaining())
+            for attempt in range(self.retry_policy.max_attempts):
+                status_code, body, retry_after = None, None, None
+                unsettled = True
+                try:
+                    timeout = max(0.1, min(self.timeout, deadline.remaining()))
+                    with (
+                        span("http_request", attempt=attempt),
+                        self.session.post(self.api_url, json=payload, timeout=timeout, stream=True) as response,
+                    ):
+                        status_code = response.status_code
+                        if status_code == 200:
+                            # Les octets sont transmis par morceaux, sans décodage de l'image
+                            collector = self._collector(sink, cache_key, output_format)
+                            for chunk in response.iter_content(CHUNK_SIZE):
+                                collector.write(chunk)
+                            self._record_outcome(200)
+                            unsettled = False
+                            return self._finish(collector, cache_key, sink, output_format, quality)
+
+                        body = self._error_body(status_code, response.text, response.json)
+                        retry_after = _retry_after(response.headers)
+                except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                    logger.warning(f"Erreur de connexion: {e}")
+
+                self._record_outcome(status_code, body)
+                unsettled = False
+                delay = self._next_delay(attempt, status_code, body, deadline, retry_after)
+                if delay is None:
                     break
-            
-            return None
-            
-        except requests.exceptions.Timeout:
-            print("Timeout lors de la génération d'image")
-            return None
+                with span(_wait_stage(status_code, body)):
+                    time.sleep(delay)
+
+            return self._failed("exhausted")
+
         except requests.exceptions.RequestException as e:
-            print(f"Erreur de requête: {e}")
-            return None
+            # Réponse interrompue en cours de lecture (ChunkedEncodingError...) : échec de l'API
+            logger.error(f"Erreur de requête: {e}")
+            if unsettled:
+                self._record_outcome(None)
+                unsettled = False
+            return self._failed("error")
         except Exception as e:
-            print(f"Erreur inattendue: {e}")
+            logger.error(f"Erreur inattendue: {e}")
+            return self._failed("error")
+        finally:
+            # Erreur locale (sink...) ou interruption : la sonde semi-ouverte est rendue
+            if unsettled:
+                self.circuit.release_probe()
+
+    async def agenerate_image(self, prompt, negative_prompt=None, width=1024, height=1024, seed=None, use_cache=True,
+                              sink=None, output_format=None, quality=None):
+        """
+        Version coroutine de generate_image, basée sur un client httpx.AsyncClient.
+
+        Plusieurs générations peuvent ainsi attendre l'API en parallèle sur une
+        même boucle d'événements. Même politique de retry que le chemin synchrone.
+
+        Sans httpx (extra « async » non installé), le chemin synchrone s'exécute
+        dans un thread.
+
+        Returns:
+            ImageResult: Résultat ou None en cas d'erreur
+        """
+        httpx = _load_httpx()
+        if httpx is None:
+            return await super().agenerate_image(
+                prompt, negative_prompt, width, height, seed, use_cache, sink, output_format, quality,
+            )
+
+        unsettled = False
+        try:
+            if not self._check_size(width, height):
+                return self._failed("unsupported_size")
+            payload = self._build_payload(prompt, negative_prompt, width, height, seed)
+
+            cache_key, cached_bytes = await asyncio.to_thread(self._cache_lookup, payload, seed, use_cache)
+            if cached_bytes is not None:
+                return await asyncio.to_thread(self._emit, cached_bytes, sink, output_format, quality)
+
+            if not self.circuit.allow_request():
+                logger.warning("Service Hugging Face indisponible (coupe-circuit ouvert)")
+                return self._failed("circuit_open")
+            unsettled = True
+
+            client = self._get_async_client()
+            deadline = self.retry_policy.start()
+            if self.cold_start.is_loading:
+                with span("model_loading_wait"):
+                    await asyncio.to_thread(self.cold_start.wait, deadline.remaining())
+            for attempt in range(self.retry_policy.max_attempts):
+                status_code, body, retry_after = None, None, None
+                unsettled = True
+                try:
+                    timeout = max(0.1, min(self.timeout, deadline.remaining()))
+                    with span("http_request", attempt=attempt):
+                        async with client.stream("POST", self.api_url, json=payload, timeout=timeout) as response:
+                            status_code = response.status_code
+                            if status_code == 200:
+                                collector = self._collector(sink, cache_key, output_format)
+                                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                                    collector.write(chunk)
+                            else:
+                                await response.aread()
+                                body = self._error_body(status_code, response.text, response.json)
+                                retry_after = _retry_after(response.headers)
+                    if status_code == 200:
+                        self._record_outcome(200)
+                        unsettled = False
+                        # Cache et transcodage éventuel hors de la boucle d'événements
+                        return await asyncio.to_thread(self._finish, collector, cache_key, sink, output_format, quality)
+                except (httpx.TimeoutException, httpx.TransportError) as e:
+                    logger.warning(f"Erreur de connexion: {e}")
+
+                self._record_outcome(status_code, body)
+                unsettled = False
+                delay = self._next_delay(attempt, status_code, body, deadline, retry_after)
+                if delay is None:
+                    break
+                with span(_wait_stage(status_code, body)):
+                    await asyncio.sleep(delay)
+
+            return self._failed("exhausted")
+
+        except httpx.HTTPError as e:
+            logger.error(f"Erreur de requête: {e}")
+            if unsettled:
+                self._record_outcome(None)
+                unsettled = False
+            return self._failed("error")
+        except Exception as e:
+            logger.error(f"Erreur inattendue: {e}")
+            return self._failed("error")
+        finally:
+            # Erreur locale ou annulation (CancelledError) : la sonde semi-ouverte est rendue
+            if unsettled:
+                self.circuit.release_probe()
+
+    def _record_outcome(self, status_code, body=None):
+        """Met à jour le coupe-circuit, l'état de santé et l'état de chargement après une tentative"""
+        UPSTREAM_REQUESTS.inc(backend=self.name, status=status_code or "error")
+        if status_code == 200:
+            self.cold_start.mark_ready()
+        elif model_loading(status_code, body):
+            self.cold_start.mark_loading(body["estimated_time"])
+        if status_code is None or (status_code >= 500 and not model_loading(status_code, body)):
+            # Timeout, connexion impossible ou erreur serveur (503 sans estimated_time compris)
+            self.circuit.record_failure()
+            self.health.observe(False)
+        else:
+            # 200, erreurs client et 503 « modèle en chargement » : l'API répond
+            self.circuit.record_success()
+            self.health.observe(True)
+
+    def _next_delay(self, attempt, status_code, body, deadline, retry_after):
+        if self.circuit.state == CircuitBreaker.OPEN:
             return None
-    
+        delay = self.retry_policy.next_delay(attempt, status_code, body, deadline, retry_after)
+        if delay is not None:
+            RETRIES.inc(backend=self.name, status=status_code or "error")
+        return delay
+
+    def _get_async_client(self):
+        """Renvoie le client httpx de la boucle courante (un client est lié à sa boucle)"""
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            self._async_client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.async_pool_size, max_keepalive_connections=self.pool_size,
+                ),
+            )
+            self._async_client_loop = loop
+        return self._async_client
+
+    async def aclose(self):
+        """Ferme le client asynchrone"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self._async_client_loop = None
+
+    def _error_body(self, status_code, text, json_func):
+        """Journalise une réponse en erreur et renvoie son corps JSON s'il existe"""
+        if status_code == 503:
+            logger.warning("Modèle en chargement ou service indisponible...")
+        else:
+            logger.error(f"Erreur API Hugging Face: {status_code} - {text}")
+        try:
+            return json_func()
+        except ValueError:
+            return None
+
+    def warm_up(self):
+        """
+        Amorce le chargement du modèle avec une génération minimale.
+
+        Returns:
+            bool: True si le modèle répond (chargé), False sinon
+        """
+        import requests
+
+        payload = {
+            "inputs": "warm-up",
+            "parameters": {"width": 256, "height": 256, "num_inference_steps": 1},
+            "options": {"wait_for_model": False, "use_cache": True},
+        }
+        body = None
+        try:
+            response = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+            status_code = response.status_code
+            if status_code != 200:
+                body = self._error_body(status_code, response.text, response.json)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Erreur de requête: {e}")
+            status_code = None
+        self._record_outcome(status_code, body)
+        return status_code == 200
+
     def is_available(self):
         """
         Vérifie si le service est disponible
-        
+
+        La réponse vient de l'état de santé en cache (coupe-circuit et dernières
+        réponses observées) ; l'API n'est sondée que si cet état est périmé.
+
         Returns:
             bool: True si le service est disponible
         """
+        return self.health.is_available()
+
+    def _probe(self):
+        """Sonde l'API (utilisé par HealthState quand l'état en cache est périmé)"""
+        import requests
+
         try:
-            response = requests.get(
-                self.api_url,
-                headers=self.headers,
-                timeout=10
-            )
-            return response.status_code in [200, 503]  # 503 = modèle en chargement
-        except:
+            response = self.session.get(self.api_url, timeout=10)
+            if response.status_code == 503:
+                return model_loading(503, response.json())
+            return response.status_code == 200
+        except (requests.exceptions.RequestException, ValueError):
             return False
 
 
-# Initialisation de l'instance globale
-try:
-    stable_diffusion_service = StableDiffusionService()
-except:
-    stable_diffusion_service = None
\ No newline at end of file
+def _wait_stage(status_code, body=None):
+    """Étape de mesure d'une attente entre deux tentatives"""
+    return "model_loading_wait" if model_loading(status_code, body) else "retry_backoff"
+
+
+def _retry_after(headers):
+    """Lit l'en-tête Retry-After (en secondes) s'il est présent"""
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
@@ -29,19 +29,77 @@ document.addEventListener('DOMContentLoaded', function() {
         updateCharCount(); // Initial count
     }
 
+    // Suggest existing images with a similar prompt while typing
+    const similarImages = document.getElementById('similarImages');
+    if (promptTextarea && similarImages && window.fetch) {
+        let similarTimer = null;
+        promptTextarea.addEventListener('input', function() {
+            clearTimeout(similarTimer);
+            similarTimer = setTimeout(() => showSimilarImages(similarImages, promptTextarea.value), 400);
+        });
+    }
+
     // Form submission with loading state
     const generateForm = document.getElementById('generateForm');
     if (generateForm) {
-        generateForm.addEventListener('submit', function() {
+        generateForm.addEventListener('submit', function(e) {
             const submitBtn = generateForm.querySelector('button[type="submit"]');
+            const originalBtnHtml = submitBtn ? submitBtn.innerHTML : '';
             if (submitBtn) {
                 submitBtn.classList.add('generating');
                 submitBtn.disabled = true;
                 submitBtn.innerHTML = '<i class="fas fa-spinner fa-spin me-2"></i>Generating...';
             }
+
+            if (!window.fetch) {
+                return; // Fall back to the regular form POST
+            }
+            e.preventDefault();
+
+            // Queue the job and poll its status instead of holding the request open
+            fetch(generateForm.action, {
+                method: 'POST',
+                body: new FormData(generateForm),
+                headers: {'Accept': 'application/json'},
+                credentials: 'same-origin'
+            })
+                .then(response => response.json().then(data => ({ok: response.ok, data: data})))
+                .then(({ok, data}) => {
+                    if (!ok) {
+                        throw new Error(data.error || 'Error generating image');
+                    }
+                    window.history.replaceState(null, '', `?job=${data.id}`);
+                    followJob(data, () => resetSubmitButton(submitBtn, originalBtnHtml));
+                })
+                .catch(error => {
+                    resetSubmitButton(submitBtn, originalBtnHtml);
+                    const loadingSection = document.getElementById('loadingSection');
+                    if (loadingSection) {
+                        loadingSection.classList.add('d-none');
+                    }
+                    alert(error.message);
+                });
         });
     }
 
+    // Resume following a job that was queued before this page load
+    const jobStatus = document.getElementById('jobStatus');
+    if (jobStatus) {
+        followJob({status_url: jobStatus.dataset.statusUrl, events_url: jobStatus.dataset.eventsUrl});
+    }
+
+    // Reload a batch page once every job still pending on it has finished
+    const pendingBatchJobs = document.querySelectorAll('#batchJobs [data-status-url]');
+    if (pendingBatchJobs.length > 0) {
+        let remaining = pendingBatchJobs.length;
+        pendingBatchJobs.forEach(card => waitForJob(card.dataset.statusUrl, () => {
+            remaining -= 1;
+            if (remaining === 0) {
+                window.location.reload();
+            }
+        }));
+    }
+
     // Delete confirmation
     const deleteButtons = document.querySelectorAll('.btn-delete');
     deleteButtons.forEach(button => {
@@ -87,4 +145,156 @@ document.addEventListener('DOMContentLoaded', function() {
 
         images.forEach(img => imageObserver.observe(img));
     }
-});
\ No newline at end of file
+});
+
+// List the images whose prompt resembles the one being typed
+function showSimilarImages(container, prompt) {
+    const list = document.getElementById('similarImagesList');
+    if (prompt.trim().length < 3) {
+        container.classList.add('d-none');
+        return;
+    }
+    container.dataset.prompt = prompt;
+    const url = `${container.dataset.similarUrl}?prompt=${encodeURIComponent(prompt)}`;
+    fetch(url, {headers: {'Accept': 'application/json'}, credentials: 'same-origin'})
+        .then(response => response.json())
+        .then(data => {
+            if (container.dataset.prompt !== prompt) {
+                return; // A newer prompt was typed meanwhile
+            }
+            list.replaceChildren(...data.items.map(item => {
+                const column = document.createElement('div');
+                column.className = 'col-4 col-md-2';
+                const link = document.createElement('a');
+                link.href = item.url;
+                link.target = '_blank';
+                link.title = item.prompt;
+                const img = document.createElement('img');
+                img.src = item.thumbnail_url;
+                img.alt = item.prompt;
+                img.loading = 'lazy';
+                img.className = 'img-fluid rounded';
+                link.appendChild(img);
+                column.appendChild(link);
+                return column;
+            }));
+            container.classList.toggle('d-none', data.items.length === 0);
+        })
+        .catch(() => container.classList.add('d-none'));
+}
+
+function resetSubmitButton(submitBtn, originalBtnHtml) {
+    if (submitBtn) {
+        submitBtn.classList.remove('generating');
+        submitBtn.disabled = false;
+        submitBtn.innerHTML = originalBtnHtml;
+    }
+}
+
+// Follow a generation job through its server-sent events, or by polling
+// when the browser has no EventSource or the stream cannot be opened
+function followJob(job, onFinished) {
+    if (!window.EventSource || !job.events_url) {
+        pollJob(job.status_url, onFinished);
+        return;
+    }
+    let finished = false;
+    const source = new EventSource(job.events_url);
+    source.addEventListener('job', event => {
+        const update = JSON.parse(event.data);
+        finished = showJobUpdate(update, onFinished);
+        if (finished) {
+            source.close();
+        }
+    });
+    source.onerror = () => {
+        // The stream ends every JOB_EVENTS_MAX_DURATION seconds and the browser
+        // reconnects by itself; only a refused stream falls back to polling
+        if (!finished && source.readyState === EventSource.CLOSED) {
+            pollJob(job.status_url, onFinished);
+        }
+    };
+}
+
+// Poll a generation job until it finishes
+function pollJob(statusUrl, onFinished, delay) {
+    delay = delay || 1000;
+    fetch(statusUrl, {headers: {'Accept': 'application/json'}, credentials: 'same-origin'})
+        .then(response => response.json())
+        .then(job => {
+            if (!showJobUpdate(job, onFinished)) {
+                setTimeout(() => pollJob(statusUrl, onFinished, Math.min(delay * 1.5, 5000)), delay);
+            }
+        })
+        .catch(() => setTimeout(() => pollJob(statusUrl, onFinished, 5000), 5000));
+}
+
+// Poll a generation job quietly and call onFinished once it has finished
+function waitForJob(statusUrl, onFinished, delay) {
+    delay = delay || 1000;
+    fetch(statusUrl, {headers: {'Accept': 'application/json'}, credentials: 'same-origin'})
+        .then(response => response.json())
+        .then(job => {
+            if (job.status === 'succeeded' || job.status === 'failed') {
+                onFinished(job);
+            } else {
+                setTimeout(() => waitForJob(statusUrl, onFinished, Math.min(delay * 1.5, 5000)), delay);
+            }
+        })
+        .catch(() => setTimeout(() => waitForJob(statusUrl, onFinished, 5000), 5000));
+}
+
+// Show a job state; returns true once the job has finished
+function showJobUpdate(job, onFinished) {
+    let text = job.status;
+    if (job.loading_eta_seconds !== null && job.loading_eta_seconds !== undefined) {
+        text = `loading the model, about ${job.loading_eta_seconds}s left`;
+    }
+    ['jobStatusText', 'loadingStatus'].forEach(id => {
+        const element = document.getElementById(id);
+        if (element) {
+            element.textContent = `Status: ${text}`;
+        }
+    });
+    if (job.status !== 'succeeded' && job.status !== 'failed') {
+        return false;
+    }
+
+    ['loadingSection', 'jobStatus'].forEach(id => {
+        const element = document.getElementById(id);
+        if (element) {
+            element.classList.add('d-none');
+        }
+    });
+    if (onFinished) {
+        onFinished(job);
+    }
+    window.history.replaceState(null, '', `?job=${job.id}`);
+    if (job.status === 'succeeded' && job.image) {
+        showResult(job);
+    } else {
+        alert(job.error || 'Error generating image');
+    }
+    return true;
+}
+
+// Render the generated image in place from the result template
+function showResult(job) {
+    const template = document.getElementById('resultTemplate');
+    if (!template) {
+        window.location.href = `${window.location.pathname}?job=${job.id}`;
+        return;
+    }
+    const previous = document.getElementById('generatedResult');
+    if (previous) {
+        previous.remove();
+    }
+    const result = template.content.firstElementChild.cloneNode(true);
+    result.id = 'generatedResult';
+    const img = result.querySelector('.result-image');
+    img.src = job.image.url;
+    img.alt = job.prompt;
+    result.querySelector('.result-prompt').textContent = job.prompt;
+    result.querySelector('.result-download').href = job.image.download_url;
+    template.parentNode.insertBefore(result, template);
+}